@@ -0,0 +1,249 @@
+from typing import Iterator, Optional
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+import dataclasses
+import http.cookiejar
+import httpx
+
+from core import misc
+from core.client import get_http_client
+from core.settings import base_settings
+from . import multistep
+
+
+COOKIE_FIELDS = (
+    'version', 'name', 'value', 'port', 'port_specified', 'domain',
+    'domain_specified', 'domain_initial_dot', 'path', 'path_specified',
+    'secure', 'expires', 'discard', 'comment', 'comment_url', 'rfc2109',
+)
+
+
+def dump_cookies(cookies: httpx.Cookies) -> str:
+    """Serialize cookies to JSON.
+
+    :param cookies: cookies of HTTP client
+    :type cookies: httpx.Cookies
+
+    :return: JSON text
+    :rtype: str
+    """
+    return json.dumps([
+        dict({field: getattr(cookie, field) for field in COOKIE_FIELDS},
+             rest=cookie._rest)
+        for cookie in cookies.jar
+    ])
+
+
+def load_cookies(text: str) -> httpx.Cookies:
+    """Deserialize cookies.
+
+    :param text: JSON text (see `dump_cookies()`)
+    :type text: str
+
+    :return: cookies
+    :rtype: httpx.Cookies
+    """
+    cookies = httpx.Cookies()
+    for fields in json.loads(text):
+        cookies.jar.set_cookie(http.cookiejar.Cookie(**fields))
+    return cookies
+
+
+@dataclasses.dataclass
+class Session:
+    version: int
+    cookies: str
+    expires_at: float
+
+    @property
+    def is_expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+
+class SessionStore:
+    """Session storage shared between workers.
+
+    Session is stored in SQLite database in WAL mode: readers are never
+    blocked, writers are serialized with `lock()`.
+
+    :ivar path: path to database file
+    """
+    DB_NAME = 'session.db'
+
+    def __init__(self, path: str = None):
+        self.path = path or misc.get_tmp_path(self.DB_NAME)
+        self._db = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None,
+            check_same_thread=False
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS session ('
+            'id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER, '
+            'cookies TEXT, expires_at REAL)'
+        )
+
+    def load(self) -> Optional[Session]:
+        """Load session.
+
+        :return: stored session or None
+        :rtype: Optional[Session]
+        """
+        row = self._db.execute(
+            'SELECT version, cookies, expires_at FROM session WHERE id = 1'
+        ).fetchone()
+        return Session(*row) if row else None
+
+    def save(self, cookies: str, expires_at: float) -> Session:
+        """Save new version of session. Must be called under `lock()`.
+
+        :param cookies: serialized cookies
+        :type cookies: str
+
+        :param expires_at: expiration time (UNIX timestamp)
+        :type expires_at: float
+
+        :return: saved session
+        :rtype: Session
+        """
+        session = self.load()
+        version = session.version + 1 if session else 1
+        self._db.execute(
+            'INSERT OR REPLACE INTO session '
+            '(id, version, cookies, expires_at) VALUES (1, ?, ?, ?)',
+            (version, cookies, expires_at)
+        )
+        return Session(version, cookies, expires_at)
+
+    def clear(self) -> None:
+        """Remove stored session.
+        """
+        self._db.execute('DELETE FROM session')
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Exclusive write transaction (other workers' writers wait).
+        """
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        else:
+            self._db.execute('COMMIT')
+
+
+class SessionManager:
+    """Authorized session shared between workers.
+
+    The first worker logs in and publishes session cookies to the store,
+    other workers reuse them. When a worker gets 401 (Unauthorized) or
+    session expires, it logs in again (once for all workers: the others
+    pick up the new session from the store) and repeats the request.
+
+    Log in and log out requests are sent by a separate client sharing
+    connection pools with the client (see `core.client.get_http_client()`),
+    so requests of other threads sharing the client keep their session
+    handling and cookies. New cookies replace old ones at once.
+
+    Session published by another worker is picked up without locking the
+    store, its write lock is taken only to log in and publish new session.
+
+    :ivar client: HTTP client
+    :ivar store: session storage
+    :ivar session: session currently used by client
+    """
+    def __init__(self, client: httpx.Client, store: SessionStore = None):
+        self.client = client
+        self.store = store or SessionStore()
+        self.session: Optional[Session] = None
+        self._lock = threading.Lock()
+        self.client.auth = SessionAuth(self)
+
+    def _apply(self, session: Session) -> None:
+        self.client.cookies = load_cookies(session.cookies)
+        self.session = session
+
+    def _login(self) -> None:
+        # Closing the client keeps shared connection pools open
+        with get_http_client() as auth_client:
+            multistep.MultistepAuth(auth_client).login()
+        cookies = auth_client.cookies
+        expires = [cookie.expires for cookie in cookies.jar
+                   if cookie.expires]
+        expires_at = min(
+            expires + [time.time() + base_settings.session_ttl]
+        )
+        self.session = self.store.save(dump_cookies(cookies), expires_at)
+        self.client.cookies = cookies
+
+    def open(self) -> None:
+        """Use stored session or log in if there is no valid one.
+        """
+        self.refresh()
+
+    def refresh(self, stale: Optional[Session] = None) -> None:
+        """Replace stale session with the newest one from the store, log in
+        if there is no such one.
+
+        :param stale: session which became invalid
+        :type stale: Optional[Session]
+        """
+        with self._lock:
+            if self.session is not stale:
+                # Already refreshed by another thread
+                return
+            if self._apply_newer(stale):
+                return
+            with self.store.lock():
+                # Another worker could have logged in while we were waiting
+                # for the lock
+                if not self._apply_newer(stale):
+                    self._login()
+
+    def _apply_newer(self, stale: Optional[Session]) -> bool:
+        session = self.store.load()
+        if session and not session.is_expired and (
+                stale is None or session.version > stale.version):
+            self._apply(session)
+            return True
+        return False
+
+    def close(self) -> None:
+        """Log out and remove stored session.
+        """
+        with get_http_client(self.client.cookies) as auth_client:
+            multistep.MultistepAuth(auth_client).logout()
+        with self.store.lock():
+            self.store.clear()
+        self.session = None
+
+
+class SessionAuth(httpx.Auth):
+    """HTTP client authentication which keeps session of `SessionManager`
+    valid.
+    """
+    def __init__(self, manager: SessionManager):
+        self.manager = manager
+
+    def auth_flow(self, request: httpx.Request):
+        manager = self.manager
+        session = manager.session
+        if session and session.is_expired:
+            manager.refresh(session)
+            self._update_cookie_header(request)
+            session = manager.session
+
+        response = yield request
+        if response.status_code == 401:
+            manager.refresh(session)
+            self._update_cookie_header(request)
+            yield request
+
+    def _update_cookie_header(self, request: httpx.Request) -> None:
+        request.headers.pop('Cookie', None)
+        self.manager.client.cookies.set_cookie_header(request)
@@ -1,5 +1,9 @@
+from typing import Union
+import functools
+
 from core.client import Base
 from core.settings import base_settings
+from api.mono.devices import device as device_api
 from . import models
 
 
@@ -8,23 +12,44 @@ class Campaign(Base):
     """
     URL_CAMPAIGN = '/platforms/{platform_id}/campaign/{campaign_id}'
 
-    def put_campaign(self, campaign_id: int, payload: dict):
+    def put_campaign(self, campaign_id: int, payload: Union[dict, bytes]):
         """Put campaign info.
 
+        Content shown by devices may change, so cached screenshot states
+        of devices are dropped (see `device.content_changed()`).
+
         :param campaign_id: campaign ID
         :type campaign_id: int
 
-        :param payload: request payload
-        :type payload: dict
+        :param payload: request payload (dict or serialized JSON)
+        :type payload: Union[dict, bytes]
 
         :return: response object
         """
-        return self.client.put(
-            self.url(self.URL_CAMPAIGN,
-                     platform_id=base_settings.platform_id,
-                     campaign_id=campaign_id),
-            json=payload
-        )
+        try:
+            return self.client.put(
+                self.url(self.URL_CAMPAIGN,
+                         platform_id=base_settings.platform_id,
+                         campaign_id=campaign_id),
+                **self.json_payload(payload)
+            )
+        finally:
+            # Screenshots seen while the request was in flight are stale
+            device_api.content_changed()
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def status_payload(cls, status: models.Status) -> bytes:
+        """Get serialized payload of campaign status update. Payloads are
+        built once and cached.
+
+        :param status: campaign status
+        :type status: models.Status
+
+        :return: request payload
+        :rtype: bytes
+        """
+        return cls.dump_json(models.CampaignUpdateModel(status=status))
 
     def play_campaign(self, campaign_id: int):
         """Play campaign.
@@ -34,9 +59,7 @@ class Campaign(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.CampaignUpdateModel(
-                status=models.Status.PLAYING
-        ).model_dump(exclude_none=True))
+        payload = self.status_payload(models.Status.PLAYING)
         response = self.put_campaign(campaign_id, payload)
         assert response.status_code == 200, \
             f'Could not play campaign {campaign_id}'
@@ -50,9 +73,7 @@ class Campaign(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.CampaignUpdateModel(
-                status=models.Status.PAUSED
-        ).model_dump(exclude_none=True))
+        payload = self.status_payload(models.Status.PAUSED)
         response = self.put_campaign(campaign_id, payload)
         assert response.status_code == 200, \
             f'Could not pause campaign {campaign_id}'
@@ -0,0 +1,320 @@
+from typing import Dict, List, Optional
+import json
+import time
+import logging
+import threading
+import dataclasses
+import waiting
+
+from core import improc, keyframes, misc
+from core.settings import base_settings
+
+
+METRICS_FILE = 'content.jsonl'
+
+
+@dataclasses.dataclass
+class ContentMetrics:
+    """Result of content verification on a device.
+
+    :ivar device_id: device ID
+    :ivar campaign_id: campaign ID
+    :ivar ready: whether device reported campaign content downloaded
+    :ivar attempts: number of retrieved screenshots
+    :ivar escalations: number of comparisons not decided by the cheap tier
+    (preview histogram or perceptual hash, see `improc.Comparison`)
+    :ivar distance: the last Hamming distance between perceptual hashes
+    (tiered comparison only)
+    :ivar score: the last score of fallback method
+    :ivar time_to_ready: time till device is ready (in seconds)
+    :ivar time_to_match: time till matching screenshot (in seconds), None
+    if content did not match
+    """
+    device_id: int
+    campaign_id: int
+    ready: bool = False
+    attempts: int = 0
+    escalations: int = 0
+    distance: Optional[int] = None
+    score: Optional[float] = None
+    time_to_ready: Optional[float] = None
+    time_to_match: Optional[float] = None
+
+    @property
+    def success(self) -> bool:
+        return self.time_to_match is not None
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+@dataclasses.dataclass
+class VideoMetrics(ContentMetrics):
+    """Result of video verification on a device.
+
+    :ivar frames: results of captured frames (see `improc.FrameMatch`)
+    """
+    frames: List[dict] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class ContentStats:
+    """Aggregated verifications of one campaign.
+
+    :ivar verifications: number of verifications
+    :ivar matches: number of successful verifications
+    :ivar ready: number of verifications with device reported ready
+    :ivar attempts: total number of retrieved screenshots
+    :ivar escalations: total number of escalated comparisons
+    :ivar time_to_match: total time till match of successful verifications
+    (in seconds)
+    :ivar max_time_to_match: maximal time till match (in seconds)
+    """
+    verifications: int = 0
+    matches: int = 0
+    ready: int = 0
+    attempts: int = 0
+    escalations: int = 0
+    time_to_match: float = 0.0
+    max_time_to_match: float = 0.0
+
+    def add(self, content_metrics: ContentMetrics) -> None:
+        self.verifications += 1
+        self.ready += content_metrics.ready
+        self.attempts += content_metrics.attempts
+        self.escalations += content_metrics.escalations
+        if content_metrics.success:
+            self.matches += 1
+            self.time_to_match += content_metrics.time_to_match
+            self.max_time_to_match = max(self.max_time_to_match,
+                                         content_metrics.time_to_match)
+
+    def merge(self, other: 'ContentStats') -> None:
+        self.verifications += other.verifications
+        self.matches += other.matches
+        self.ready += other.ready
+        self.attempts += other.attempts
+        self.escalations += other.escalations
+        self.time_to_match += other.time_to_match
+        self.max_time_to_match = max(self.max_time_to_match,
+                                     other.max_time_to_match)
+
+
+WORKER_OUTPUT_KEY = 'content_stats'
+# Verification statistics by campaign ID
+stats: Dict[int, ContentStats] = {}
+_stats_lock = threading.Lock()
+
+
+class ContentVerifier:
+    """Verification of content played by devices.
+
+    Instead of sleeping for a fixed time after campaign start, verifier
+    waits until device reports that it plays the campaign and has
+    downloaded all of its content. Then screenshots are compared with
+    reference image by comparator of the campaign (see
+    `improc.get_comparator()`): histograms or perceptual hashes of
+    previews first, with only borderline results rechecked at comparison
+    resolution or by fallback method (see `improc.HistComparator`,
+    `improc.TieredComparator`).
+
+    Results are aggregated by campaign into `stats` (see `summary()`) and
+    appended to `METRICS_FILE` under project temporary path (shared by
+    xdist workers), so number of attempts and timeouts can be tuned from
+    data.
+
+    :ivar device: device management object (see `device.Device`)
+    :ivar attempts: maximal number of screenshots
+    :ivar ready_timeout: time limit of waiting for device readiness
+    :ivar comparator: image comparator
+    """
+    WAIT_READY = 'device content ready'
+
+    def __init__(self, device, attempts: int = None,
+                 ready_timeout: float = None,
+                 comparator: improc.Comparator = None):
+        self.device = device
+        self.attempts = attempts or base_settings.content_attempts
+        self.ready_timeout = ready_timeout or \
+            base_settings.content_ready_timeout
+        self.comparator = comparator or improc.get_comparator()
+
+    def wait_ready(self, device_id: int, campaign_id: int) -> dict:
+        """Wait until device plays the campaign with all content downloaded.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param campaign_id: campaign ID
+        :type campaign_id: int
+
+        :return: player metrics
+        :rtype: dict
+
+        :raises waiting.TimeoutExpired when device is not ready in time
+        """
+        return self.device.watcher.wait(
+            device_id,
+            lambda player_metrics:
+                player_metrics['campaign_id'] == campaign_id and
+                player_metrics['downloaded'] >=
+                player_metrics['need_to_download'],
+            timeout_seconds=self.ready_timeout,
+            kind=self.WAIT_READY,
+            waiting_for=f'device {device_id} is ready to play campaign '
+                        f'{campaign_id}'
+        )
+
+    def _wait_ready(self, content_metrics: ContentMetrics,
+                    start: float) -> None:
+        try:
+            self.wait_ready(content_metrics.device_id,
+                            content_metrics.campaign_id)
+            content_metrics.ready = True
+        except waiting.TimeoutExpired as e:
+            # Device may not report its metrics properly, screenshots
+            # decide anyway
+            logging.warning(str(e))
+        content_metrics.time_to_ready = time.monotonic() - start
+
+    def verify(self, device_id: int, campaign_id: int,
+               fname: str) -> ContentMetrics:
+        """Verify that device plays content matching reference image.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param campaign_id: campaign ID
+        :type campaign_id: int
+
+        :param fname: filename of reference image
+        :type fname: str
+
+        :return: verification metrics (true if content matches)
+        :rtype: ContentMetrics
+        """
+        reference = self.comparator.reference(fname)
+        content_metrics = ContentMetrics(device_id, campaign_id)
+        start = time.monotonic()
+        self._wait_ready(content_metrics, start)
+
+        while content_metrics.attempts < self.attempts:
+            content_metrics.attempts += 1
+            with self.device.stream_screenshot(device_id) as screenshot:
+                comparison = self.comparator.compare(reference, screenshot)
+            content_metrics.distance = comparison.distance
+            content_metrics.score = comparison.score
+            if comparison.escalated:
+                content_metrics.escalations += 1
+            if comparison:
+                content_metrics.time_to_match = time.monotonic() - start
+                break
+        _record(content_metrics)
+        return content_metrics
+
+    def verify_video(self, device_id: int, campaign_id: int,
+                     index: keyframes.KeyframeIndex,
+                     frames: int = None) -> VideoMetrics:
+        """Verify that device plays video matching reference keyframes.
+
+        A burst of screenshots is captured and each one is checked by
+        `improc.VideoMatcher` as soon as it arrives. Capturing stops early
+        when remaining frames cannot change the result.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param campaign_id: campaign ID
+        :type campaign_id: int
+
+        :param index: reference keyframes of campaign media
+        :type index: keyframes.KeyframeIndex
+
+        :param frames: maximal number of screenshots,
+        `base_settings.video_frames` by default
+        :type frames: int
+
+        :return: verification metrics (true if video is playing)
+        :rtype: VideoMetrics
+        """
+        frames = frames or base_settings.video_frames
+        matcher = improc.VideoMatcher(index)
+        video_metrics = VideoMetrics(device_id, campaign_id)
+        start = time.monotonic()
+        self._wait_ready(video_metrics, start)
+
+        for screenshot in self.device.stream_screenshot_burst(device_id,
+                                                              frames):
+            frame = matcher.add(screenshot)
+            video_metrics.attempts += 1
+            video_metrics.score = frame.score
+            video_metrics.frames.append(dataclasses.asdict(frame))
+            if matcher.is_playing(frames):
+                video_metrics.time_to_match = time.monotonic() - start
+                break
+        _record(video_metrics)
+        return video_metrics
+
+
+def _record(content_metrics: ContentMetrics) -> None:
+    logging.debug(f'Content of device {content_metrics.device_id}: '
+                  f'{content_metrics}')
+    with _stats_lock:
+        stats.setdefault(content_metrics.campaign_id,
+                         ContentStats()).add(content_metrics)
+    entry = dataclasses.asdict(content_metrics)
+    entry['success'] = content_metrics.success
+    # Short appends are atomic, so workers may share the file
+    with open(misc.get_tmp_path(METRICS_FILE), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def to_dict() -> dict:
+    """Get verification statistics as JSON-serializable dictionary (e.g.,
+    to pass them from xdist worker to controller).
+
+    :return: statistics by campaign ID
+    :rtype: dict
+    """
+    with _stats_lock:
+        return {str(campaign_id): dataclasses.asdict(campaign_stats)
+                for campaign_id, campaign_stats in stats.items()}
+
+
+def merge(data: dict) -> None:
+    """Add verification statistics of another process.
+
+    :param data: statistics by campaign ID (see `to_dict()`)
+    :type data: dict
+    """
+    with _stats_lock:
+        for campaign_id, campaign_stats in data.items():
+            stats.setdefault(int(campaign_id), ContentStats()).merge(
+                ContentStats(**campaign_stats)
+            )
+
+
+def summary() -> List[str]:
+    """Get summary table: number of verifications, matches, device
+    readiness, mean number of screenshots and escalations per
+    verification, mean and maximal time till match (in seconds) by
+    campaign.
+
+    :return: lines of the table
+    :rtype: List[str]
+    """
+    lines = [f'{"campaign":>8} {"checks":>6} {"matched":>7} {"ready":>5} '
+             f'{"shots":>6} {"escal.":>6} {"mean":>7} {"max":>7}']
+    with _stats_lock:
+        for campaign_id, campaign_stats in sorted(stats.items()):
+            count = campaign_stats.verifications
+            mean = campaign_stats.time_to_match / campaign_stats.matches \
+                if campaign_stats.matches else 0.0
+            lines.append(
+                f'{campaign_id:>8} {count:>6} {campaign_stats.matches:>7} '
+                f'{campaign_stats.ready:>5} '
+                f'{campaign_stats.attempts/count:>6.1f} '
+                f'{campaign_stats.escalations/count:>6.1f} '
+                f'{mean:>7.2f} {campaign_stats.max_time_to_match:>7.2f}'
+            )
+    return lines
@@ -1,16 +1,71 @@
+from typing import (AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple,
+                    Union)
+import time
+import asyncio
+import contextlib
+import functools
+import dataclasses
 import waiting
+import pydantic
 
-from core.client import Base
+from core.client import Base, get_async_http_client
+from core import buffer, tracing, wait
 from core.settings import base_settings
-from . import models
+from . import models, watcher
+
+
+@dataclasses.dataclass
+class ScreenshotState:
+    """The last seen screenshot of a device.
+
+    :ivar ts: timestamp of screenshot reported by device
+    :ivar file: URL of screenshot
+    :ivar seen_at: time of receiving screenshot info (`time.monotonic()`)
+    :ivar captured_at: time of requesting the screenshot if it was captured
+    by this object (`time.monotonic()`), None otherwise
+    """
+    ts: int
+    file: Optional[str]
+    seen_at: float
+    captured_at: Optional[float] = None
+
+
+def content_changed() -> None:
+    """Drop cached screenshot states of all devices (see `ScreenshotState`)
+    when content shown by devices changes, e.g. campaign is played or
+    paused (see `api.mono.campaigns.campaign.Campaign`).
+    """
+    global _content_changed_at
+    _content_changed_at = time.monotonic()
+
+
+_content_changed_at = 0.0
 
 
 class Device(Base):
     """Device management.
+
+    The last seen screenshot of every device is cached (see
+    `ScreenshotState`), so consecutive screenshots of a device skip
+    requesting the previous timestamp while it is fresh (see
+    `base_settings.screenshot_state_ttl`). Commands sent to a device drop
+    its state, campaign changes made by this process drop states of all
+    devices (see `content_changed()`).
+
+    :ivar screenshots: the last seen screenshots by device ID
     """
     URL_DEVICE = '/platforms/{platform_id}/devices/{device_id}'
     URL_SCREENSHOT = '/platforms/{platform_id}/devices/screenshot'
 
+    # Kinds of waits (see core.wait)
+    WAIT_SCREENSHOT = 'device screenshot'
+    WAIT_STATUS = 'device status'
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.watcher = watcher.DeviceStatusWatcher(self)
+        self.screenshots: Dict[int, ScreenshotState] = {}
+
     def get_device(self, device_id: int):
         """Get device info.
 
@@ -28,23 +83,77 @@ class Device(Base):
             f'Could not get device {device_id} info'
         return response
 
-    def put_device(self, device_id: int, payload: dict):
+    def get_device_model(self, device_id: int,
+                         fields: Iterable[str] = None) -> pydantic.BaseModel:
+        """Get validated device info.
+
+        device.get_device_model(device_id, fields=('player_metrics',))
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param fields: fields to be validated (see
+        `models.device_projection()`), all fields by default
+        :type fields: Iterable[str]
+
+        :return: device info (`models.DeviceRetrieveModel` or its projection)
+        :rtype: pydantic.BaseModel
+        """
+        response = self.get_device(device_id)
+        model = models.DeviceRetrieveModel if fields is None \
+            else models.device_projection(tuple(fields))
+        return model.model_validate_json(response.content)
+
+    def put_device(self, device_id: int, payload: Union[dict, bytes]):
         """Put device info.
 
         :param device_id: device ID
         :type device_id: int
 
-        :param payload: request payload
-        :type payload: dict
+        :param payload: request payload (dict or serialized JSON)
+        :type payload: Union[dict, bytes]
 
         :return: response object
         """
-        return self.client.put(
+        # Screen changes and device may restart with its timestamps reset
+        self.screenshots.pop(device_id, None)
+        response = self.client.put(
             self.url(self.URL_DEVICE,
                      platform_id=base_settings.platform_id,
                      device_id=device_id),
-            json=payload
+            **self.json_payload(payload)
         )
+        # Status cached before the command must not satisfy waits after it
+        self.watcher.invalidate(device_id)
+        return response
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def command_payload(cls, command: models.ActionCommand,
+                        event: models.ActionEvent = models.ActionEvent.COMMAND,
+                        params: tuple = ()) -> bytes:
+        """Get serialized payload of a command. Payloads are built once and
+        cached.
+
+        :param command: command
+        :type command: models.ActionCommand
+
+        :param event: event
+        :type event: models.ActionEvent
+
+        :param params: command parameters
+        :type params: tuple
+
+        :return: request payload
+        :rtype: bytes
+        """
+        return cls.dump_json(models.DeviceUpdateModel(
+            commands=[models.Command(
+                action=models.Action(
+                    command=command, event=event, params=list(params)
+                )
+            )]
+        ))
 
     def get_screenshot_info(self, device_id: int):
         """Get info with URL of a screenshot.
@@ -72,12 +181,75 @@ class Device(Base):
         :return: response object if new timestamp > given (old) timestamp
         """
         response = self.get_screenshot_info(device_id)
-        new_ts = response.json().get('ts', 0)
-        if new_ts > ts:
+        state = self._update_state(device_id, response)
+        if state.ts > ts:
             return response
         else:
             return False
 
+    def _update_state(self, device_id: int, response) -> ScreenshotState:
+        info = response.json()
+        state = ScreenshotState(ts=info.get('ts', 0), file=info.get('file'),
+                                seen_at=time.monotonic())
+        self.screenshots[device_id] = state
+        return state
+
+    def _fresh_state(self, device_id: int) -> Optional[ScreenshotState]:
+        state = self.screenshots.get(device_id)
+        if state is None or state.seen_at < _content_changed_at or \
+                time.monotonic() - state.seen_at > \
+                base_settings.screenshot_state_ttl:
+            return None
+        return state
+
+    def capture_screenshot(self, device_id: int) -> str:
+        """Request new screenshot from a device and wait until it is ready.
+
+        Timestamp of the previous screenshot is requested only if cached
+        one is not fresh.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :return: URL of a new screenshot
+        :rtype: str
+        """
+        attributes = {'device.id': device_id}
+        state = self._fresh_state(device_id)
+        if state is None:
+            with tracing.span('screenshot.baseline', attributes):
+                state = self._update_state(
+                    device_id, self.get_screenshot_info(device_id)
+                )
+        ts = state.ts
+
+        requested_at = time.monotonic()
+        with tracing.span('screenshot.request', attributes):
+            response = self.client.post(
+                self.url(self.URL_SCREENSHOT,
+                         platform_id=base_settings.platform_id),
+                json={'device_id': device_id}
+            )
+        assert response.status_code == 200, \
+            f'Problem occurred with screenshot request form device {device_id}'
+
+        with tracing.span('screenshot.poll', attributes):
+            try:
+                wait.wait(
+                    lambda: self.check_new_screenshot(device_id, ts),
+                    timeout_seconds=30,
+                    kind=self.WAIT_SCREENSHOT,
+                    waiting_for=f'updated screenshot info for device '
+                                f'{device_id}'
+                )
+            except waiting.TimeoutExpired:
+                # Device may have reset its timestamps
+                self.screenshots.pop(device_id, None)
+                raise
+        state = self.screenshots[device_id]
+        state.captured_at = requested_at
+        return state.file
+
     def retrieve_screenshot(self, device_id: int) -> bytes:
         """Retrieve screenshot from a device.
 
@@ -87,26 +259,109 @@ class Device(Base):
         :return: screenshot in JPEG format
         :rtype: bytes
         """
-        ts = self.get_screenshot_info(device_id).json().get('ts', 0)
+        attributes = {'device.id': device_id}
+        with tracing.span(tracing.SCREENSHOT_SPAN, attributes):
+            file_url = self.capture_screenshot(device_id)
+            with tracing.span('screenshot.download', attributes):
+                screenshot = self.client.get(file_url).read()
+        return screenshot
 
-        response = self.client.post(
-            self.url(self.URL_SCREENSHOT,
-                     platform_id=base_settings.platform_id),
-            json={'device_id': device_id}
-        )
-        assert response.status_code == 200, \
-            f'Problem occurred with screenshot request form device {device_id}'
+    def latest_screenshot(self, device_id: int, max_age: float) -> bytes:
+        """Retrieve screenshot from a device reusing screenshot captured by
+        this object not earlier than `max_age` seconds ago, new screenshot
+        is captured only if there is no such one.
 
-        response = waiting.wait(
-            lambda: self.check_new_screenshot(device_id, ts),
-            timeout_seconds=30,
-            sleep_seconds=base_settings.polling_interval,
-            waiting_for=f'updated screenshot info for device {device_id}'
-        )
+        Reused screenshot may predate content changes which are not known
+        to this process (e.g., campaign played by another xdist worker or
+        device switching to new content a few seconds after the campaign
+        change), so it must not be used to verify content after such
+        changes.
 
-        file_url = response.json()['file']
-        screenshot = self.client.get(file_url).read()
-        return screenshot
+        :param device_id: device ID
+        :type device_id: int
+
+        :param max_age: maximal age of reused screenshot (in seconds)
+        :type max_age: float
+
+        :return: screenshot in JPEG format
+        :rtype: bytes
+        """
+        state = self.screenshots.get(device_id)
+        if state is None or state.captured_at is None or \
+                state.captured_at < _content_changed_at or \
+                time.monotonic() - state.captured_at > max_age:
+            return self.retrieve_screenshot(device_id)
+        with tracing.span('latest_screenshot', {'device.id': device_id}):
+            return self.client.get(state.file).read()
+
+    @contextlib.contextmanager
+    def stream_screenshot(self, device_id: int) -> Iterator[memoryview]:
+        """Retrieve screenshot from a device streaming it into a reusable
+        buffer (see `core.buffer`).
+
+        with device.stream_screenshot(device_id) as screenshot:
+            imp.load_target_reduced(screenshot)
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :return: zero-copy view of screenshot in JPEG format, valid only
+        inside `with` block
+        :rtype: Iterator[memoryview]
+        """
+        attributes = {'device.id': device_id}
+        with contextlib.ExitStack() as stack:
+            # Spans are closed before the screenshot is handed over
+            with tracing.span(tracing.SCREENSHOT_SPAN, attributes):
+                file_url = self.capture_screenshot(device_id)
+                with tracing.span('screenshot.download', attributes):
+                    screenshot = stack.enter_context(
+                        buffer.pool.download(self.client, file_url)
+                    )
+            yield screenshot
+
+    def stream_screenshot_burst(self, device_id: int,
+                                count: int) -> Iterator[memoryview]:
+        """Retrieve several screenshots from a device one after another.
+
+        for screenshot in device.stream_screenshot_burst(device_id, 5):
+            matcher.add(screenshot)
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param count: number of screenshots
+        :type count: int
+
+        :return: iterator over zero-copy views of screenshots in JPEG format,
+        each view is valid only till the next iteration
+        :rtype: Iterator[memoryview]
+        """
+        for _ in range(count):
+            with self.stream_screenshot(device_id) as screenshot:
+                yield screenshot
+
+    def retrieve_screenshots(self,
+                             device_ids: Iterable[int]) -> Dict[int, bytes]:
+        """Retrieve screenshots from several devices concurrently.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :return: screenshots in JPEG format by device ID
+        :rtype: Dict[int, bytes]
+        """
+        device_ids = tuple(device_ids)
+
+        async def collect():
+            async with get_async_http_client(self.client.cookies) as client:
+                return {
+                    device_id: screenshot async for device_id, screenshot
+                    in AsyncDevice(client).retrieve_screenshots(device_ids)
+                }
+
+        with tracing.span('screenshot.sweep', {'devices': len(device_ids)}):
+            return asyncio.run(collect())
 
     def wait_device(self, device_id: int, status: str) -> bool:
         """Wait for device's status to be playback / pause / etc.
@@ -120,13 +375,16 @@ class Device(Base):
         :return: True if status achieved
         :rtype: bool
         """
-        return waiting.wait(
-            lambda: self.get_device(
-                device_id).json()['player_metrics']['status'] == status,
-            timeout_seconds=120,
-            sleep_seconds=base_settings.polling_interval,
-            waiting_for=f'device {device_id} is {status}'
-        )
+        with tracing.span('wait_device', {'device.id': device_id,
+                                          'device.status': status}):
+            self.watcher.wait(
+                device_id,
+                lambda player_metrics: player_metrics['status'] == status,
+                timeout_seconds=120,
+                kind=f'{self.WAIT_STATUS} {status}',
+                waiting_for=f'device {device_id} is {status}'
+            )
+        return True
 
     def cmd_escape_playback(self, device_id: int):
         """Send 'escape playback' command to device.
@@ -136,14 +394,7 @@ class Device(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.DeviceUpdateModel(
-            commands=[models.Command(
-                action=models.Action(
-                    command=models.ActionCommand.ESCAPE,
-                    event=models.ActionEvent.COMMAND
-                )
-            )]
-        ).model_dump(exclude_none=True))
+        payload = self.command_payload(models.ActionCommand.ESCAPE)
         response = self.put_device(device_id, payload)
         assert response.status_code == 200, \
             f'Could not execute "escape" command for device {device_id}'
@@ -157,14 +408,7 @@ class Device(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.DeviceUpdateModel(
-            commands=[models.Command(
-                action=models.Action(
-                    command=models.ActionCommand.CONTINUE,
-                    event=models.ActionEvent.COMMAND
-                )
-            )]
-        ).model_dump(exclude_none=True))
+        payload = self.command_payload(models.ActionCommand.CONTINUE)
         response = self.put_device(device_id, payload)
         assert response.status_code == 200, \
             f'Could not execute "continue" command for device {device_id}'
@@ -178,14 +422,7 @@ class Device(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.DeviceUpdateModel(
-            commands=[models.Command(
-                action=models.Action(
-                    command=models.ActionCommand.RESTART,
-                    event=models.ActionEvent.COMMAND
-                )
-            )]
-        ).model_dump(exclude_none=True))
+        payload = self.command_payload(models.ActionCommand.RESTART)
         response = self.put_device(device_id, payload)
         assert response.status_code == 200, \
             f'Could not execute "restart" command for device {device_id}'
@@ -199,14 +436,7 @@ class Device(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.DeviceUpdateModel(
-            commands=[models.Command(
-                action=models.Action(
-                    command=models.ActionCommand.REBOOT,
-                    event=models.ActionEvent.COMMAND
-                )
-            )]
-        ).model_dump(exclude_none=True))
+        payload = self.command_payload(models.ActionCommand.REBOOT)
         response = self.put_device(device_id, payload)
         assert response.status_code == 200, \
             f'Could not execute "reboot" command for device {device_id}'
@@ -220,14 +450,9 @@ class Device(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.DeviceUpdateModel(
-            commands=[models.Command(
-                action=models.Action(
-                    command=models.ActionCommand.NONE,
-                    event=models.ActionEvent.UPDATE
-                )
-            )]
-        ).model_dump(exclude_none=True))
+        payload = self.command_payload(
+            models.ActionCommand.NONE, models.ActionEvent.UPDATE
+        )
         response = self.put_device(device_id, payload)
         assert response.status_code == 200, \
             f'Could not execute "update" command for device {device_id}'
@@ -244,16 +469,208 @@ class Device(Base):
 
         :return: response object
         """
-        payload = self.prepare_json(models.DeviceUpdateModel(
-            commands=[models.Command(
-                action=models.Action(
-                    command=models.ActionCommand.ROTATE_SCREEN,
-                    event=models.ActionEvent.NONE,
-                    params=[degrees]
-                )
-            )]
-        ).model_dump(exclude_none=True))
+        payload = self.command_payload(
+            models.ActionCommand.ROTATE_SCREEN, models.ActionEvent.NONE,
+            (degrees,)
+        )
         response = self.put_device(device_id, payload)
         assert response.status_code == 200, \
             f'Could not "rotate screen" to {degrees} for device {device_id}'
         return response
+
+
+class AsyncDevice(Base):
+    """Asynchronous device management.
+
+    Intended for operations on many devices at once, e.g. fleet-wide
+    screenshot sweep.
+    """
+    URL_SCREENSHOT = Device.URL_SCREENSHOT
+
+    async def get_screenshot_info(self, device_id: int):
+        """Get info with URL of a screenshot.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :return: response object
+        """
+        return await self.client.get(
+            self.url(self.URL_SCREENSHOT,
+                     platform_id=base_settings.platform_id),
+            params={'device_id': device_id}
+        )
+
+    async def check_new_screenshot(self, device_id: int, ts: int):
+        """Check whether device has a screenshot newer than given timestamp.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param ts: timestamp of previous screenshot
+        :type ts: int
+
+        :return: response object if new timestamp > given (old) timestamp
+        """
+        response = await self.get_screenshot_info(device_id)
+        new_ts = response.json().get('ts', 0)
+        if new_ts > ts:
+            return response
+        else:
+            return False
+
+    async def request_screenshot(self, device_id: int) -> int:
+        """Request new screenshot from a device.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :return: timestamp of previous screenshot
+        :rtype: int
+        """
+        attributes = {'device.id': device_id}
+        with tracing.span('screenshot.baseline', attributes):
+            response = await self.get_screenshot_info(device_id)
+        ts = response.json().get('ts', 0)
+
+        with tracing.span('screenshot.request', attributes):
+            response = await self.client.post(
+                self.url(self.URL_SCREENSHOT,
+                         platform_id=base_settings.platform_id),
+                json={'device_id': device_id}
+            )
+        assert response.status_code == 200, \
+            f'Problem occurred with screenshot request form device {device_id}'
+        return ts
+
+    async def download_screenshot(self, device_id: int,
+                                  file_url: str) -> Tuple[int, bytes]:
+        """Download screenshot file.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param file_url: URL of a screenshot
+        :type file_url: str
+
+        :return: device ID and screenshot in JPEG format
+        :rtype: Tuple[int, bytes]
+        """
+        with tracing.span('screenshot.download', {'device.id': device_id}):
+            response = await self.client.get(file_url)
+            return device_id, await response.aread()
+
+    async def retrieve_screenshot(self, device_id: int) -> bytes:
+        """Retrieve screenshot from a device.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :return: screenshot in JPEG format
+        :rtype: bytes
+        """
+        screenshots = [
+            screenshot async for _, screenshot
+            in self.retrieve_screenshots((device_id,))
+        ]
+        return screenshots[0]
+
+    async def retrieve_screenshots(
+            self, device_ids: Iterable[int], timeout_seconds: int = 30
+    ) -> AsyncIterator[Tuple[int, bytes]]:
+        """Retrieve screenshots from several devices.
+
+        All screenshot requests are sent at once, then pending devices are
+        polled together at intervals of the shared screenshot wait strategy
+        (see `core.wait`). Screenshots are yielded
+        in order of arrival, so whole sweep takes the time of the slowest
+        device.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :param timeout_seconds: time limit for the whole sweep
+        :type timeout_seconds: int
+
+        :return: asynchronous iterator over (device ID, screenshot in JPEG
+        format) pairs
+
+        :raises waiting.TimeoutExpired when some devices have not updated
+        their screenshots in time
+        """
+        device_ids = list(device_ids)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_seconds
+        # Round trip of every device and its polling are traced by spans
+        # started and ended here, phases of different devices overlap
+        roots = {device_id: tracing.start_span(tracing.SCREENSHOT_SPAN,
+                                               {'device.id': device_id})
+                 for device_id in device_ids}
+        polls = {}
+
+        async def request(device_id: int) -> int:
+            with tracing.use_span(roots[device_id]):
+                ts = await self.request_screenshot(device_id)
+            polls[device_id] = tracing.start_span(
+                'screenshot.poll', {'device.id': device_id},
+                parent=roots[device_id]
+            )
+            return ts
+
+        downloads = set()
+        error = None
+        try:
+            timestamps = await asyncio.gather(
+                *(request(device_id) for device_id in device_ids)
+            )
+            pending = dict(zip(device_ids, timestamps))
+            strategy = wait.get_strategy(Device.WAIT_SCREENSHOT)
+            intervals = strategy.intervals()
+            start = loop.time()
+            poll_at = start + next(intervals)
+
+            while pending or downloads:
+                delay = max(0, poll_at - loop.time()) if pending else None
+                if downloads:
+                    done, downloads = await asyncio.wait(
+                        downloads, timeout=delay,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        device_id, screenshot = task.result()
+                        tracing.end_span(roots.pop(device_id))
+                        yield device_id, screenshot
+                else:
+                    await asyncio.sleep(delay)
+
+                if not pending or loop.time() < poll_at:
+                    continue
+                responses = await asyncio.gather(
+                    *(self.check_new_screenshot(device_id, ts)
+                      for device_id, ts in pending.items())
+                )
+                for device_id, response in zip(list(pending), responses):
+                    if response:
+                        strategy.observe(loop.time() - start)
+                        del pending[device_id]
+                        tracing.end_span(polls.pop(device_id))
+                        with tracing.use_span(roots[device_id]):
+                            downloads.add(asyncio.create_task(
+                                self.download_screenshot(
+                                    device_id, response.json()['file'])
+                            ))
+                if pending and loop.time() >= deadline:
+                    raise waiting.TimeoutExpired(
+                        timeout_seconds,
+                        f'updated screenshot info for devices '
+                        f'{", ".join(map(str, pending))}'
+                    )
+                poll_at = min(loop.time() + next(intervals), deadline)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            for span in (*polls.values(), *roots.values()):
+                tracing.end_span(span, error)
+            for task in downloads:
+                task.cancel()
@@ -0,0 +1,174 @@
+from typing import Dict, Iterable, Optional
+import time
+import dataclasses
+import concurrent.futures
+import httpx
+
+from core.client import Base
+from core.settings import base_settings
+from core import wait
+from . import device as device_api, models
+
+
+@dataclasses.dataclass
+class CommandResult:
+    device_id: int
+    ok: bool
+    attempts: int
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+
+
+class DeviceFleet(Base):
+    """Commands dispatch to many devices at once.
+
+    Commands are sent concurrently (at most `max_workers` requests at a
+    time). A command is repeated (with exponential backoff) only when it
+    was certainly not applied: the request did not reach the server
+    (`RETRY_ERRORS`) or the server refused it (`RETRY_STATUS_CODES`).
+    Other failures (e.g., read timeout, 500) are reported without sending
+    the command again, so e.g. a device is never rebooted twice.
+
+    :ivar max_workers: maximal number of concurrent requests
+    :ivar attempts: maximal number of attempts per device
+    """
+    RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout,
+                    httpx.PoolTimeout)
+    RETRY_STATUS_CODES = frozenset((429, 503))
+
+    def __init__(self, client, max_workers: int = None, attempts: int = 3):
+        super().__init__(client)
+        self.device = device_api.Device(client)
+        self.max_workers = max_workers or base_settings.fleet_max_workers
+        self.attempts = attempts
+
+    def _send(self, device_id: int, payload: bytes) -> CommandResult:
+        intervals = wait.ExponentialBackoff().intervals()
+        result = CommandResult(device_id, ok=False, attempts=0)
+        while result.attempts < self.attempts:
+            result.attempts += 1
+            try:
+                response = self.device.put_device(device_id, payload)
+            except httpx.TransportError as e:
+                result.status_code, result.error = None, repr(e)
+                if not isinstance(e, self.RETRY_ERRORS):
+                    break
+            else:
+                result.status_code = response.status_code
+                if response.status_code == 200:
+                    result.ok, result.error = True, None
+                    break
+                result.error = response.reason_phrase
+                if response.status_code not in self.RETRY_STATUS_CODES:
+                    break
+            if result.attempts < self.attempts:
+                time.sleep(next(intervals))
+        return result
+
+    def dispatch(self, device_ids: Iterable[int],
+                 command: models.ActionCommand,
+                 event: models.ActionEvent = models.ActionEvent.COMMAND,
+                 params: tuple = ()) -> Dict[int, CommandResult]:
+        """Send command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :param command: command
+        :type command: models.ActionCommand
+
+        :param event: event
+        :type event: models.ActionEvent
+
+        :param params: command parameters
+        :type params: tuple
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        payload = self.device.command_payload(command, event, tuple(params))
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            results = pool.map(
+                lambda device_id: self._send(device_id, payload), device_ids
+            )
+            return {result.device_id: result for result in results}
+
+    def cmd_escape_playback(
+            self, device_ids: Iterable[int]) -> Dict[int, CommandResult]:
+        """Send 'escape playback' command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        return self.dispatch(device_ids, models.ActionCommand.ESCAPE)
+
+    def cmd_continue_playback(
+            self, device_ids: Iterable[int]) -> Dict[int, CommandResult]:
+        """Send 'continue playback' command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        return self.dispatch(device_ids, models.ActionCommand.CONTINUE)
+
+    def cmd_restart_player(
+            self, device_ids: Iterable[int]) -> Dict[int, CommandResult]:
+        """Send 'restart player' command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        return self.dispatch(device_ids, models.ActionCommand.RESTART)
+
+    def cmd_reboot_device(
+            self, device_ids: Iterable[int]) -> Dict[int, CommandResult]:
+        """Send 'reboot' command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        return self.dispatch(device_ids, models.ActionCommand.REBOOT)
+
+    def cmd_update_player(
+            self, device_ids: Iterable[int]) -> Dict[int, CommandResult]:
+        """Send 'update player' command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        return self.dispatch(
+            device_ids, models.ActionCommand.NONE, models.ActionEvent.UPDATE
+        )
+
+    def cmd_rotate_screen(self, device_ids: Iterable[int],
+                          degrees: int) -> Dict[int, CommandResult]:
+        """Send 'rotate screen' command to devices.
+
+        :param device_ids: device IDs
+        :type device_ids: Iterable[int]
+
+        :param degrees: degree value (from models.Degree)
+        :type degrees: int
+
+        :return: results by device ID
+        :rtype: Dict[int, CommandResult]
+        """
+        return self.dispatch(
+            device_ids, models.ActionCommand.ROTATE_SCREEN,
+            models.ActionEvent.NONE, (degrees,)
+        )
@@ -1,9 +1,10 @@
-from typing import Tuple, List, Optional, Literal
+from typing import Tuple, List, Optional, Literal, Type
 import datetime
+import functools
 import pydantic
 from pydantic import AnyUrl, HttpUrl
 
-from core import base, misc
+from core import base
 
 
 class Degree(base.IntEnum):
@@ -157,17 +158,11 @@ class PlayerMetrics(pydantic.BaseModel):
 
 class Interface(pydantic.BaseModel):
     name: str
-    private_ip: str
-    hardware_address: str
-    net_mask: str
+    private_ip: base.IPAddress
+    hardware_address: base.MACAddress
+    net_mask: base.IPAddress
     is_active: bool
 
-    # Validators
-    _is_private_ip = pydantic.field_validator('private_ip')(misc.is_ip)
-    _is_hardware_address = \
-        pydantic.field_validator('hardware_address')(misc.is_mac)
-    _is_net_mask = pydantic.field_validator('net_mask')(misc.is_ip)
-
 
 class Network(pydantic.BaseModel):
     public_ip: str
@@ -250,6 +245,26 @@ class DeviceRetrieveModel(pydantic.BaseModel):
     permission: int
 
 
+@functools.lru_cache(maxsize=None)
+def device_projection(fields: Tuple[str, ...]) -> Type[pydantic.BaseModel]:
+    """Get model with only given fields of `DeviceRetrieveModel`. Other
+    fields of device info are ignored (not validated).
+
+    :param fields: names of fields
+    :type fields: Tuple[str, ...]
+
+    :return: projection model
+    :rtype: Type[pydantic.BaseModel]
+    """
+    return pydantic.create_model(
+        f'DeviceRetrieveModel[{",".join(fields)}]',
+        **{
+            field: (DeviceRetrieveModel.model_fields[field].annotation, ...)
+            for field in fields
+        }
+    )
+
+
 @base.optional
 class DeviceUpdateModel(pydantic.BaseModel):
     ads_zone_resolution: AdsZoneResolution
@@ -0,0 +1,152 @@
+from typing import Callable, Optional
+import os
+import json
+import time
+import tempfile
+import filelock
+
+from core import misc, wait
+from core.settings import base_settings
+
+
+class DeviceStatusWatcher:
+    """Shared watcher of device statuses.
+
+    Latest `player_metrics` of every device is cached in a file under
+    project temporary path. Any number of waiters (threads or xdist workers)
+    read the cache without locking, and only the first one which finds it
+    stale fetches device info, so each device is requested at most once per
+    `max_age` regardless of number of waiters.
+
+    `max_age` defaults to `base_settings.polling_interval`. Waiters (see
+    `wait()`) accept metrics not older than their current interval between
+    polls instead, so waiters polling densely (see `core.wait`) get fresh
+    metrics while waiters polling at the same pace still share fetches.
+    Cache entry of a device is dropped when a command is sent to it (see
+    `invalidate()`).
+
+    :ivar device: device management object (see `device.Device`)
+    :ivar max_age: maximal age of cached metrics (in seconds)
+    """
+    STATUS_DIR = 'status'
+    # Only these fields of device info are validated
+    FIELDS = ('player_metrics',)
+
+    def __init__(self, device, max_age: float = None):
+        self.device = device
+        self.max_age = max_age or base_settings.polling_interval
+        os.makedirs(misc.get_tmp_path(self.STATUS_DIR), exist_ok=True)
+
+    def _path(self, device_id: int) -> str:
+        return misc.get_tmp_path(self.STATUS_DIR, f'{device_id}.json')
+
+    def _read(self, device_id: int, max_age: float) -> Optional[dict]:
+        try:
+            with open(self._path(device_id), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['ts'] > max_age:
+            return None
+        return entry['player_metrics']
+
+    def _write(self, device_id: int, player_metrics: dict) -> None:
+        path = self._path(device_id)
+        # Replace file atomically, so readers never see partial entry.
+        # Temporary file is unique for every writer (thread or process).
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'ts': time.time(),
+                           'player_metrics': player_metrics}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _lock(self, device_id: int) -> filelock.FileLock:
+        return filelock.FileLock(self._path(device_id) + '.lock')
+
+    def invalidate(self, device_id: int) -> None:
+        """Drop cached metrics of a device (e.g., after a command is sent to
+        it).
+
+        Fetch in progress is waited for, so metrics fetched before the
+        command are not cached after invalidation.
+
+        :param device_id: device ID
+        :type device_id: int
+        """
+        with self._lock(device_id):
+            try:
+                os.remove(self._path(device_id))
+            except FileNotFoundError:
+                pass
+
+    def player_metrics(self, device_id: int,
+                       max_age: float = None) -> dict:
+        """Get latest player metrics of a device.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param max_age: maximal age of cached metrics (in seconds),
+        `self.max_age` by default
+        :type max_age: float
+
+        :return: player metrics
+        :rtype: dict
+        """
+        max_age = self.max_age if max_age is None else max_age
+        player_metrics = self._read(device_id, max_age)
+        if player_metrics is not None:
+            return player_metrics
+        with self._lock(device_id):
+            # Other waiter could have updated metrics while we were waiting
+            # for the lock
+            player_metrics = self._read(device_id, max_age)
+            if player_metrics is None:
+                player_metrics = self.device.get_device_model(
+                    device_id, self.FIELDS
+                ).player_metrics.model_dump(mode='json')
+                self._write(device_id, player_metrics)
+        return player_metrics
+
+    def wait(self, device_id: int, predicate: Callable[[dict], bool],
+             timeout_seconds: float, kind: str, waiting_for: str) -> dict:
+        """Wait for player metrics of a device to satisfy predicate.
+
+        :param device_id: device ID
+        :type device_id: int
+
+        :param predicate: condition on player metrics
+        :type predicate: Callable[[dict], bool]
+
+        :param timeout_seconds: time limit
+        :type timeout_seconds: float
+
+        :param kind: kind of wait (see `core.wait`)
+        :type kind: str
+
+        :param waiting_for: description of awaited condition
+        :type waiting_for: str
+
+        :return: player metrics which satisfied predicate
+        :rtype: dict
+        """
+        last_poll = None
+
+        def check():
+            nonlocal last_poll
+            # Metrics must be not older than the interval slept by the
+            # strategy before this poll
+            now = time.monotonic()
+            max_age = wait.MIN_INTERVAL if last_poll is None \
+                else now - last_poll
+            last_poll = now
+            player_metrics = self.player_metrics(device_id, max_age)
+            return player_metrics if predicate(player_metrics) else False
+
+        return wait.wait(check, timeout_seconds=timeout_seconds, kind=kind,
+                         waiting_for=waiting_for)
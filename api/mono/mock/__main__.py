@@ -0,0 +1,65 @@
+"""Local mock server of mono API.
+
+python -m api.mono.mock --port 8321 --devices 1000 --latency 0.05
+
+Point the framework at it with `MOCK_SERVER_URL='http://127.0.0.1:8321'`.
+Without `--devices` devices of `DEVICES` setting are simulated.
+"""
+from typing import List
+import sys
+import argparse
+
+from .server import MockServer, SCREENSHOT_DELAY, DOWNLOAD_DELAY
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m api.mono.mock',
+                                     description='Mock server of mono API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8321)
+    parser.add_argument('--devices', type=int, default=0,
+                        help='number of simulated devices (IDs from 1)')
+    parser.add_argument('--media',
+                        help='directory with campaign screenshots named by '
+                             'campaign names (e.g. jpeg.jpg)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='response latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='maximal deviation of latency, seconds')
+    parser.add_argument('--screenshot-delay', type=float,
+                        default=SCREENSHOT_DELAY,
+                        help='time till requested screenshot is ready, '
+                             'seconds')
+    parser.add_argument('--download-delay', type=float,
+                        default=DOWNLOAD_DELAY,
+                        help='time till campaign content is downloaded, '
+                             'seconds')
+    options = parser.parse_args(args)
+
+    server = MockServer.from_settings(
+        media_path=options.media, latency=options.latency,
+        jitter=options.jitter, screenshot_delay=options.screenshot_delay,
+        download_delay=options.download_delay
+    )
+    if options.devices:
+        server = MockServer(
+            devices=range(1, options.devices + 1), media=server.media,
+            latency=options.latency, jitter=options.jitter,
+            screenshot_delay=options.screenshot_delay,
+            download_delay=options.download_delay
+        )
+    httpd = server.serve(options.host, options.port)
+    print(f'Serving {len(server.devices)} devices on '
+          f'http://{options.host}:{httpd.server_port}')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        for route, count in sorted(server.requests.items()):
+            print(f'{count:>10} {route}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,120 @@
+"""Realistic API payloads of mock server and benchmarks.
+"""
+import datetime
+
+
+def device_payload(device_id: int, interfaces: int = 2) -> dict:
+    """Get device info payload (see `DeviceRetrieveModel`).
+
+    :param device_id: device ID
+    :type device_id: int
+
+    :param interfaces: number of network interfaces
+    :type interfaces: int
+
+    :return: JSON-compatible payload
+    :rtype: dict
+    """
+    now = datetime.datetime(2023, 8, 1, 12, 0, tzinfo=datetime.timezone.utc)
+    day = [['09:00:00', '21:00:00']]
+    return {
+        'id': device_id,
+        'name': f'device-{device_id}',
+        'group_id': 1,
+        'profile_id': None,
+        'timings': [{'day_timings': day}] * 7,
+        'download_interval': [{'day_intervals': day}],
+        'monitoring': True,
+        'power_control': False,
+        'connected_at': now.isoformat(),
+        'created_at': now.isoformat(),
+        'skip_bulk_update': False,
+        'capabilities': {
+            'notch': False,
+            'bluetooth_supported': True,
+            'bluetooth': {},
+            'print': False,
+            'face_recognition': None,
+            'model': 'Signage Player',
+            'name': f'player-{device_id}',
+            'manufacturer': 'Vendor',
+            'root': False,
+            'screens': [
+                {'h': 2160, 'w': 3840, 'rate': 60, 'x': 0, 'y': 0,
+                 'depth': 24},
+            ],
+            'cameras': [],
+            'devices': {},
+            'serial_number': f'SN{device_id:08d}',
+            'cpu_model': 'ARM Cortex-A55',
+            'cpu_architecture': 'arm64',
+            'cpu_cores': 4,
+            'cpu_logical_cores': 4,
+            'gpu_model': 'Mali-G52',
+            'os': 'Android',
+            'os_version': '11',
+            'os_bit_capacity': 64,
+            'language': 'en',
+            'wake_timers': {'count': 0, 'status': False},
+            'time_zone': 10800,
+            'admin': True,
+            'version': '5.2.1',
+            'os_user': None,
+            'build': '5210',
+            'bit': 64,
+            'extras': {
+                'qms': {'type': 'none', 'url': 'http://qms.local/',
+                        'connected': False},
+                'telnet': {'enabled': False, 'port': 23, 'started': False},
+            },
+            'audio_outs': [{'name': 'HDMI', 'selected': True}],
+            'api_link': 'https://api.test.server/v5',
+        },
+        'metrics': {
+            'os_start_ts': 1690000000,
+            'abr': None,
+            'p_start_ts': 1690000100,
+            'br': None,
+            'ls_current': None,
+            'battery_level': None,
+            'power_type': None,
+            'ram_used': 1500000000,
+            'ram_total': 4000000000,
+            'ram_player': 300000000,
+            'up_time': 86400,
+            'os_up_time': 86500,
+            'space_available': 20000000000,
+            'volume': {'level': 50},
+        },
+        'player_metrics': {
+            'status': 'playback',
+            'project_id': 1,
+            'campaign_id': 1,
+            'need_to_download': 10,
+            'downloaded': 10,
+        },
+        'networks': {
+            'public_ip': '203.0.113.10',
+            'interfaces': [
+                {
+                    'name': f'eth{i}',
+                    'private_ip': f'10.{i}.{device_id // 256 % 256}.'
+                                  f'{device_id % 256}',
+                    'hardware_address': f'02:00:00:{i:02x}:'
+                                        f'{device_id // 256 % 256:02x}:'
+                                        f'{device_id % 256:02x}',
+                    'net_mask': '255.255.255.0',
+                    'is_active': i == 0,
+                } for i in range(interfaces)
+            ],
+        },
+        'custom_fields': [
+            {'id': 1, 'name': 'location', 'type': 'string', 'value': 'hall'},
+        ],
+        'commands': [],
+        'tags': [{'id': 1, 'name': 'lobby', 'permission': 7}],
+        'campaigns': [{'id': 1, 'name': 'jpeg', 'permission': 7}],
+        'ads_zone_resolution': {'height': 2160, 'width': 3840},
+        'timings_dates': [],
+        'permission': 7,
+    }
@@ -0,0 +1,450 @@
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import re
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import threading
+import collections
+import dataclasses
+import http.cookies
+import http.server
+import cv2
+import numpy
+import httpx
+
+from core.settings import base_settings
+from ..devices import models as device_models
+from ..campaigns import models as campaign_models
+from . import payloads
+
+
+SESSION_COOKIE = 'session'
+FRAME_SIZE = (1920, 1080)
+SCREENSHOT_DELAY = 1.0  # seconds
+DOWNLOAD_DELAY = 2.0  # seconds
+NEED_TO_DOWNLOAD = 3
+
+Route = Tuple[str, re.Pattern, Callable[..., httpx.Response], bool]
+
+
+@dataclasses.dataclass
+class SimulatedDevice:
+    """State of simulated device.
+
+    :ivar device_id: device ID
+    :ivar status: player status (see `models.Status`)
+    :ivar campaign_id: ID of played campaign
+    :ivar downloaded_at: time when campaign content is downloaded
+    :ivar ts: timestamp of the latest screenshot (in milliseconds)
+    :ivar screenshot_at: time when requested screenshot is ready, None if
+    there is no pending request
+    :ivar commands: received commands
+    """
+    device_id: int
+    status: str = device_models.Status.PLAYBACK
+    campaign_id: int = 0
+    downloaded_at: float = 0
+    ts: int = 1
+    screenshot_at: Optional[float] = None
+    commands: list = dataclasses.field(default_factory=list)
+
+    def is_downloaded(self, now: float) -> bool:
+        return now >= self.downloaded_at
+
+
+def route_template(pattern: re.Pattern) -> str:
+    """Get readable template of route pattern, e.g.
+    '/platforms/{platform_id}/devices/{device_id}'.
+
+    :param pattern: route pattern
+    :type pattern: re.Pattern
+
+    :return: template
+    :rtype: str
+    """
+    template = re.sub(r'\(\?P<(\w+)>[^)]*\)', r'{\1}', pattern.pattern)
+    return template.rstrip('$').replace('\\d+', '{ts}').replace('\\', '')
+
+
+def json_response(status_code: int, payload=None) -> httpx.Response:
+    return httpx.Response(
+        status_code, json={} if payload is None else payload
+    )
+
+
+class MockServer:
+    """Stand-in server of mono API with simulated devices.
+
+    Implements multistep authentication, device info and commands,
+    screenshots and campaign status. Played campaign is shown on device
+    screenshots when its content is "downloaded" (after `download_delay`),
+    requested screenshot is ready after `screenshot_delay`. Every response
+    is delayed by `latency` with random `jitter`.
+
+    Server is used in process as transport of HTTP client:
+
+    client = httpx.Client(base_url=base_settings.api_url,
+                          transport=server.transport())
+
+    or as local HTTP server (see `serve()` and `python -m api.mono.mock`).
+
+    :ivar devices: simulated devices by ID
+    :ivar media: screenshots (JPEG) of campaigns by campaign ID
+    :ivar latency: response latency (in seconds)
+    :ivar jitter: maximal deviation of latency (in seconds)
+    :ivar screenshot_delay: time till requested screenshot is ready
+    :ivar download_delay: time till campaign content is downloaded
+    :ivar auth: whether requests require authenticated session
+    :ivar requests: number of handled requests by route
+    """
+    def __init__(self, devices: Iterable[int] = (),
+                 media: Dict[int, bytes] = None,
+                 latency: float = 0, jitter: float = 0,
+                 screenshot_delay: float = SCREENSHOT_DELAY,
+                 download_delay: float = DOWNLOAD_DELAY,
+                 auth: bool = True):
+        self.devices = {device_id: SimulatedDevice(device_id)
+                        for device_id in devices}
+        self.media = dict(media or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.screenshot_delay = screenshot_delay
+        self.download_delay = download_delay
+        self.auth = auth
+        self.requests: 'collections.Counter[str]' = collections.Counter()
+        self._logins: Dict[str, dict] = {}
+        self._sessions = set()
+        self._frames: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        platform = r'/platforms/(?P<platform_id>\d+)'
+        self._routes: Tuple[Route, ...] = (
+            ('POST', re.compile(r'/auth/login/multi_step/start$'),
+             self._start, False),
+            ('POST', re.compile(r'/auth/login/multi_step/check_login$'),
+             self._check_login, False),
+            ('POST', re.compile(r'/auth/login/multi_step/commit_pwd$'),
+             self._commit_password, False),
+            ('POST', re.compile(r'/auth/login/multi_step/finish$'),
+             self._finish, False),
+            ('POST', re.compile(r'/users/logout$'), self._logout, True),
+            ('GET', re.compile(platform + r'/devices/screenshot$'),
+             self._get_screenshot_info, True),
+            ('POST', re.compile(platform + r'/devices/screenshot$'),
+             self._request_screenshot, True),
+            ('GET', re.compile(platform + r'/devices/(?P<device_id>\d+)$'),
+             self._get_device, True),
+            ('PUT', re.compile(platform + r'/devices/(?P<device_id>\d+)$'),
+             self._put_device, True),
+            ('PUT',
+             re.compile(platform + r'/campaign/(?P<campaign_id>\d+)$'),
+             self._put_campaign, True),
+            ('GET', re.compile(
+                r'/files/screenshots/(?P<device_id>\d+)/\d+\.jpg$'),
+             self._get_screenshot, False),
+        )
+
+    @classmethod
+    def from_settings(cls, media_path: str = None, **kwargs) -> 'MockServer':
+        """Create server simulating devices of `base_settings.devices`.
+
+        :param media_path: directory with screenshots of campaigns named by
+        campaign names of `base_settings.campaigns` (e.g. 'jpeg.jpg')
+        :type media_path: str
+
+        :param kwargs: other arguments of server
+
+        :return: server
+        :rtype: MockServer
+        """
+        media = {}
+        if media_path is not None:
+            for name, campaign_id in base_settings.campaigns.items():
+                fname = os.path.join(media_path, f'{name}.jpg')
+                if os.path.isfile(fname):
+                    with open(fname, 'rb') as f:
+                        media[campaign_id] = f.read()
+        return cls(
+            devices=[device_id for _, device_id in base_settings.devices],
+            media=media, **kwargs
+        )
+
+    def delay(self) -> float:
+        """Get latency of a response.
+
+        :return: latency (in seconds)
+        :rtype: float
+        """
+        return max(0.0, self.latency +
+                   random.uniform(-self.jitter, self.jitter))
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """Handle request with simulated latency.
+
+        :param request: request
+        :type request: httpx.Request
+
+        :return: response
+        :rtype: httpx.Response
+        """
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        return self.respond(request)
+
+    async def async_handle(self, request: httpx.Request) -> httpx.Response:
+        """Handle request of asynchronous client with simulated latency.
+
+        :param request: request
+        :type request: httpx.Request
+
+        :return: response
+        :rtype: httpx.Response
+        """
+        delay = self.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self.respond(request)
+
+    def transport(self) -> httpx.MockTransport:
+        """Get transport of HTTP client handled by the server.
+
+        :return: transport
+        :rtype: httpx.MockTransport
+        """
+        return httpx.MockTransport(self.handle)
+
+    def async_transport(self) -> httpx.MockTransport:
+        """Get transport of asynchronous HTTP client handled by the server.
+
+        :return: transport
+        :rtype: httpx.MockTransport
+        """
+        return httpx.MockTransport(self.async_handle)
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        """Handle request without latency.
+
+        :param request: request
+        :type request: httpx.Request
+
+        :return: response
+        :rtype: httpx.Response
+        """
+        path = request.url.path
+        for method, pattern, handler, authorized in self._routes:
+            match = pattern.search(path)
+            if match is None or method != request.method:
+                continue
+            with self._lock:
+                self.requests[f'{method} {route_template(pattern)}'] += 1
+                if authorized and self.auth and \
+                        not self._is_authorized(request):
+                    return json_response(401, {'detail': 'Unauthorized'})
+                return handler(request, **match.groupdict())
+        return json_response(404, {'detail': 'Not found'})
+
+    def _is_authorized(self, request: httpx.Request) -> bool:
+        cookies = http.cookies.SimpleCookie(request.headers.get('cookie', ''))
+        session = cookies.get(SESSION_COOKIE)
+        return session is not None and session.value in self._sessions
+
+    def _device(self, device_id) -> Optional[SimulatedDevice]:
+        return self.devices.get(int(device_id))
+
+    def frame(self, campaign_id: int) -> bytes:
+        """Get screenshot of a campaign: campaign media if known, otherwise
+        generated frame unique for the campaign (black frame for no
+        campaign).
+
+        :param campaign_id: campaign ID
+        :type campaign_id: int
+
+        :return: screenshot in JPEG format
+        :rtype: bytes
+        """
+        if campaign_id in self.media:
+            return self.media[campaign_id]
+        if campaign_id not in self._frames:
+            width, height = FRAME_SIZE
+            frame = numpy.zeros((height, width, 3), dtype=numpy.uint8)
+            if campaign_id:
+                rng = numpy.random.default_rng(campaign_id)
+                for _ in range(8):
+                    x, y = rng.integers(0, width), rng.integers(0, height)
+                    cv2.rectangle(frame, (int(x), int(y)),
+                                  (int(x) + width // 4, int(y) + height // 4),
+                                  rng.integers(0, 256, 3).tolist(), -1)
+            self._frames[campaign_id] = \
+                cv2.imencode('.jpg', frame)[1].tobytes()
+        return self._frames[campaign_id]
+
+    def _start(self, request):
+        session_id = uuid.uuid4().hex
+        self._logins[session_id] = {'login': False, 'password': False}
+        return json_response(200, {'session_id': session_id})
+
+    def _login_step(self, request, field: str, expected: str):
+        data = json.loads(request.content)
+        login = self._logins.get(data.get('session_id'))
+        if login is None:
+            return json_response(400, {'detail': 'Unknown session'})
+        login[field] = data.get(field) == expected
+        if not login[field]:
+            return json_response(400, {'detail': f'Wrong {field}'})
+        return json_response(200)
+
+    def _check_login(self, request):
+        return self._login_step(request, 'login', base_settings.user.email)
+
+    def _commit_password(self, request):
+        return self._login_step(request, 'password',
+                                base_settings.user.password)
+
+    def _finish(self, request):
+        session_id = json.loads(request.content).get('session_id')
+        login = self._logins.pop(session_id, None)
+        if not login or not all(login.values()):
+            return json_response(400, {'detail': 'Authentication failed'})
+        token = uuid.uuid4().hex
+        self._sessions.add(token)
+        response = json_response(200)
+        response.headers['set-cookie'] = \
+            f'{SESSION_COOKIE}={token}; Path=/; HttpOnly'
+        return response
+
+    def _logout(self, request):
+        # Without authentication a request may have no session cookie
+        cookies = http.cookies.SimpleCookie(request.headers.get('cookie', ''))
+        session = cookies.get(SESSION_COOKIE)
+        if session is not None:
+            self._sessions.discard(session.value)
+        return json_response(200)
+
+    def _get_device(self, request, platform_id, device_id):
+        device = self._device(device_id)
+        if device is None:
+            return json_response(404, {'detail': 'Device not found'})
+        payload = payloads.device_payload(device.device_id)
+        payload['player_metrics'].update(
+            status=device.status, campaign_id=device.campaign_id,
+            need_to_download=NEED_TO_DOWNLOAD,
+            downloaded=NEED_TO_DOWNLOAD
+            if device.is_downloaded(time.time()) else 0
+        )
+        return json_response(200, payload)
+
+    def _put_device(self, request, platform_id, device_id):
+        device = self._device(device_id)
+        if device is None:
+            return json_response(404, {'detail': 'Device not found'})
+        for command in json.loads(request.content).get('commands') or ():
+            action = command.get('action', {})
+            device.commands.append(action)
+            if action.get('command') == device_models.ActionCommand.ESCAPE:
+                device.status = device_models.Status.PAUSE
+            elif action.get('command') in (
+                    device_models.ActionCommand.CONTINUE,
+                    device_models.ActionCommand.RESTART):
+                device.status = device_models.Status.PLAYBACK
+        return json_response(200)
+
+    def _put_campaign(self, request, platform_id, campaign_id):
+        campaign_id = int(campaign_id)
+        status = json.loads(request.content).get('status')
+        now = time.time()
+        for device in self.devices.values():
+            if status == campaign_models.Status.PLAYING:
+                device.status = device_models.Status.PLAYBACK
+                if device.campaign_id != campaign_id:
+                    device.campaign_id = campaign_id
+                    device.downloaded_at = now + self.download_delay
+            elif device.campaign_id == campaign_id:
+                device.status = device_models.Status.PAUSE
+        return json_response(200)
+
+    def _get_screenshot_info(self, request, platform_id):
+        device = self._device(request.url.params.get('device_id', 0))
+        if device is None:
+            return json_response(404, {'detail': 'Device not found'})
+        now = time.time()
+        if device.screenshot_at is not None and now >= device.screenshot_at:
+            # Timestamps strictly increase even for immediate screenshots
+            device.ts = max(device.ts + 1, int(device.screenshot_at * 1000))
+            device.screenshot_at = None
+        url = request.url.copy_with(
+            path=f'/files/screenshots/{device.device_id}/{device.ts}.jpg',
+            query=None
+        )
+        return json_response(200, {'file': str(url), 'ts': device.ts})
+
+    def _request_screenshot(self, request, platform_id):
+        device = self._device(json.loads(request.content).get('device_id'))
+        if device is None:
+            return json_response(404, {'detail': 'Device not found'})
+        if device.screenshot_at is None:
+            device.screenshot_at = time.time() + self.screenshot_delay
+        return json_response(200)
+
+    def _get_screenshot(self, request, device_id):
+        device = self._device(device_id)
+        if device is None:
+            return json_response(404, {'detail': 'Device not found'})
+        playing = device.status == device_models.Status.PLAYBACK and \
+            device.is_downloaded(time.time())
+        return httpx.Response(
+            200, content=self.frame(device.campaign_id if playing else 0),
+            headers={'content-type': 'image/jpeg'}
+        )
+
+    def serve(self, host: str = '127.0.0.1',
+              port: int = 0) -> http.server.ThreadingHTTPServer:
+        """Create local HTTP server handling requests in threads. Requests
+        should keep original host in Host header (see
+        `base_settings.mock_server_url`).
+
+        httpd = server.serve(port=8321)
+        httpd.serve_forever()
+
+        :param host: address to listen
+        :type host: str
+
+        :param port: port to listen (any free port by default)
+        :type port: int
+
+        :return: HTTP server (not started)
+        :rtype: http.server.ThreadingHTTPServer
+        """
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                length = int(self.headers.get('content-length') or 0)
+                request = httpx.Request(
+                    self.command,
+                    f'http://{self.headers.get("host", host)}{self.path}',
+                    headers=list(self.headers.items()),
+                    content=self.rfile.read(length)
+                )
+                response = server.handle(request)
+                content = response.read()
+                self.send_response(response.status_code)
+                for name, value in response.headers.multi_items():
+                    if name not in ('content-length', 'transfer-encoding'):
+                        self.send_header(name, value)
+                self.send_header('content-length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        return httpd
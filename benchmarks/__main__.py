@@ -0,0 +1,140 @@
+"""Run benchmarks, store results as JSON and compare them with a baseline.
+
+python -m benchmarks [-o results.json] [--compare baseline.json]
+                     [--threshold 0.1] [module ...]
+
+Results are stored under `benchmarks` directory of project temporary path
+by default. Cases are compared by minimal time of one call (the least
+noisy statistic), exit status is 1 if any case is slower than baseline by
+more than threshold.
+"""
+from typing import List
+import os
+import sys
+import json
+import argparse
+import datetime
+import platform
+import importlib
+import subprocess
+
+from core import misc
+from . import common
+
+
+MODULES = ('decode', 'compare', 'payload', 'models', 'validators',
+           'logger', 'lease', 'screenshot')
+
+
+def git_commit() -> str:
+    """Get current commit of the project.
+
+    :return: commit hash, empty if unknown
+    :rtype: str
+    """
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', 'HEAD'), capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(modules: List[str]) -> dict:
+    """Run benchmark modules.
+
+    :param modules: short names of modules (e.g., 'decode')
+    :type modules: List[str]
+
+    :return: results with metadata of the run
+    :rtype: dict
+    """
+    benchmarks = {}
+    for name in modules:
+        module = importlib.import_module(f'.bench_{name}', __package__)
+        results = module.run()
+        common.print_results(module.TITLE, results)
+        benchmarks[name] = {'title': module.TITLE, 'results': results}
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commit': git_commit(),
+        'benchmarks': benchmarks,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Compare results with baseline and print changes of minimal times.
+
+    :param results: results of current run (see `run()`)
+    :type results: dict
+
+    :param baseline: results of previous run
+    :type baseline: dict
+
+    :param threshold: maximal allowed relative slowdown (e.g., 0.1 is 10%)
+    :type threshold: float
+
+    :return: regressed cases as 'module: case'
+    :rtype: List[str]
+    """
+    print(f'\nComparison with {baseline["commit"][:10] or "baseline"} '
+          f'({baseline["created"]})')
+    print(f'{"case":<48} {"before, ms":>10} {"after, ms":>10} '
+          f'{"change":>8}')
+    regressions = []
+    for name, benchmark in results['benchmarks'].items():
+        before = baseline['benchmarks'].get(name, {}).get('results', {})
+        for case, result in benchmark['results'].items():
+            if case not in before:
+                continue
+            change = result['min'] / before[case]['min'] - 1
+            regressed = change > threshold
+            if regressed:
+                regressions.append(f'{name}: {case}')
+            print(f'{name + ": " + case:<48} '
+                  f'{before[case]["min"]*1000:>10.3f} '
+                  f'{result["min"]*1000:>10.3f} {change:>+8.1%}'
+                  f'{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Run benchmarks.')
+    parser.add_argument('modules', nargs='*', metavar='module',
+                        help=f'one of {", ".join(MODULES)} (all by default)')
+    parser.add_argument('-o', '--output', help='JSON file with results')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='JSON file with results of previous run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='maximal allowed relative slowdown')
+    options = parser.parse_args(args)
+    unknown = set(options.modules) - set(MODULES)
+    if unknown:
+        parser.error(f'unknown modules: {", ".join(sorted(unknown))}')
+
+    results = run(options.modules or MODULES)
+    output = options.output or misc.get_tmp_path(
+        'benchmarks', f'{datetime.datetime.now():%Y%m%d-%H%M%S}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f'\nResults written to "{output}"')
+
+    if options.compare:
+        with open(options.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regressions over '
+                  f'{options.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+"""Throughput of screenshot comparison: Hue-Saturation histogram
+correlation (single full comparison and preview first) against tiered
+comparators (perceptual hash with histogram or SSIM fallback).
+
+python -m benchmarks.bench_compare [reference.jpg screenshot.jpg ...]
+
+Without arguments synthetic corpus is used: re-encoded copies of reference
+frame (matches), slightly altered frames (ambiguous) and different frames
+(mismatches).
+"""
+import os
+import sys
+import tempfile
+import collections
+import cv2
+import numpy
+
+from core import improc
+from . import common
+from .bench_decode import make_frame
+
+
+TITLE = 'Comparison of synthetic screenshots'
+COMPARATORS = {
+    'histogram preview + full': improc.HistComparator(),
+    'tiered dhash + hist': improc.TieredComparator('dhash'),
+    'tiered phash + hist': improc.TieredComparator('phash'),
+    'tiered dhash + ssim': improc.TieredComparator('dhash',
+                                                   fallback='ssim'),
+}
+
+
+def make_corpus() -> tuple:
+    """Generate reference file and screenshots.
+
+    :return: filename of reference image and screenshots in JPEG format
+    :rtype: tuple
+    """
+    raw = make_frame(1920, 1080)
+    frame = cv2.imdecode(numpy.frombuffer(raw, numpy.uint8), cv2.IMREAD_COLOR)
+    fd, fname = tempfile.mkstemp(suffix='.jpg')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(raw)
+
+    def encode(image, quality=80):
+        return cv2.imencode('.jpg', image,
+                            (cv2.IMWRITE_JPEG_QUALITY, quality))[1].tobytes()
+
+    screenshots = [encode(frame, quality) for quality in (60, 75, 90)]
+    overlay = frame.copy()
+    cv2.rectangle(overlay, (100, 100), (700, 400), (255, 255, 255), -1)
+    screenshots.append(encode(overlay))
+    screenshots.append(encode(cv2.GaussianBlur(frame, (31, 31), 0)))
+    screenshots.append(encode(cv2.flip(frame, 1)))
+    screenshots.append(encode(255 - frame))
+    screenshots.append(encode(numpy.roll(frame, 960, axis=1)))
+    return fname, screenshots
+
+
+def compare_hist(fname: str, screenshot: bytes) -> bool:
+    imp = improc.ImageProcessing()
+    imp.load_source_from_file(fname)
+    imp.load_target_reduced(screenshot)
+    return imp.compare_images()
+
+
+def measure(fname: str, screenshots: list) -> tuple:
+    """Measure comparison of screenshots with reference file.
+
+    :param fname: filename of reference image
+    :type fname: str
+
+    :param screenshots: screenshots in JPEG format
+    :type screenshots: list
+
+    :return: results by case (time of comparison of all screenshots) and
+    numbers of comparisons decided by each tier by case
+    :rtype: tuple
+    """
+    def run_hist():
+        for screenshot in screenshots:
+            compare_hist(fname, screenshot)
+
+    results = {'histogram': common.measure(run_hist, number=3)}
+    tiers = {'histogram': {'hist': len(screenshots)}}
+    for name, comparator in COMPARATORS.items():
+        reference = comparator.reference(fname)
+        results[name] = common.measure(
+            lambda: [comparator.compare(reference, screenshot)
+                     for screenshot in screenshots],
+            number=3)
+        tiers[name] = dict(collections.Counter(
+            comparator.compare(reference, screenshot).tier
+            for screenshot in screenshots
+        ))
+    return results, tiers
+
+
+def run() -> dict:
+    fname, screenshots = make_corpus()
+    try:
+        return measure(fname, screenshots)[0]
+    finally:
+        os.remove(fname)
+
+
+def main():
+    if len(sys.argv) > 2:
+        fname = sys.argv[1]
+        screenshots = []
+        for path in sys.argv[2:]:
+            with open(path, 'rb') as f:
+                screenshots.append(f.read())
+        results, tiers = measure(fname, screenshots)
+    else:
+        fname, screenshots = make_corpus()
+        try:
+            results, tiers = measure(fname, screenshots)
+        finally:
+            os.remove(fname)
+    common.print_results(
+        f'Comparison of {len(screenshots)} screenshots', results)
+
+    print(f'\n{"case":<32} {"cmp/s":>10}  decided by')
+    for name, result in results.items():
+        print(f'{name:<32} {len(screenshots)/result["mean"]:>10.1f}  '
+              f'{tiers[name]}')
+
+
+if __name__ == '__main__':
+    main()
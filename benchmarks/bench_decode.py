@@ -0,0 +1,183 @@
+"""Decode time and memory of a screenshot: full decode with PIL and resize
+against DCT-domain reduced decode.
+
+Scores of both paths are compared first (see `check_scores()`): the
+benchmark fails if reduced decode, or preview first comparison of
+`improc.HistComparator`, changes any pass/fail decision of
+`improc.THRESHOLD`.
+
+python -m benchmarks.bench_decode
+"""
+from typing import Dict, Tuple
+import os
+import glob
+
+import cv2
+import numpy
+
+from core import improc, misc
+from . import common
+
+
+TITLE = 'Screenshot decode'
+FRAMES = {
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+}
+# Reference images of the test suite
+DATA_FILES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'test_player', 'data', '*.jpg')
+
+
+def make_frame(width: int, height: int) -> bytes:
+    """Generate JPEG frame which resembles signage content (gradients with
+    noise).
+
+    :param width: frame width
+    :type width: int
+
+    :param height: frame height
+    :type height: int
+
+    :return: JPEG image
+    :rtype: bytes
+    """
+    rng = numpy.random.default_rng(0)
+    x = numpy.linspace(0, 255, width, dtype=numpy.float32)
+    y = numpy.linspace(0, 255, height, dtype=numpy.float32)[:, None]
+    frame = numpy.dstack((x + 0 * y, y + 0 * x, (x + y) / 2))
+    frame += rng.normal(0, 8, frame.shape)
+    frame = numpy.clip(frame, 0, 255).astype(numpy.uint8)
+    _, jpeg = cv2.imencode('.jpg', frame, (cv2.IMWRITE_JPEG_QUALITY, 90))
+    return jpeg.tobytes()
+
+
+def full_decode(raw: bytes) -> numpy.ndarray:
+    imp = improc.ImageProcessing()
+    imp.load_target_from_bytes(raw)
+    return cv2.resize(numpy.array(imp.target), improc.RESCALE_SIZE,
+                      interpolation=cv2.INTER_LINEAR)
+
+
+def reduced_decode(raw: bytes) -> numpy.ndarray:
+    imp = improc.ImageProcessing()
+    imp.load_target_reduced(raw)
+    return cv2.resize(imp.target, improc.RESCALE_SIZE,
+                      interpolation=cv2.INTER_LINEAR)
+
+
+def make_variants(image: numpy.ndarray) -> Dict[str, bytes]:
+    """Make screenshots of a reference image: matching ones (re-encoded)
+    and mismatching ones (overlaid, blurred, heavily compressed).
+
+    :param image: reference BGR image
+    :type image: numpy.ndarray
+
+    :return: JPEG screenshots by variant name
+    :rtype: Dict[str, bytes]
+    """
+    overlaid = image.copy()
+    height, width = image.shape[:2]
+    cv2.rectangle(overlaid, (width // 10, height // 10),
+                  (width // 3, height // 3), (255, 255, 255), -1)
+    variants = {
+        'q95': image,
+        'q90': image,
+        'q60': image,
+        'overlay': overlaid,
+        'blur': cv2.GaussianBlur(image, (31, 31), 0),
+    }
+    return {
+        name: cv2.imencode('.jpg', variant, (
+            cv2.IMWRITE_JPEG_QUALITY, int(name[1:]) if name[0] == 'q' else 90
+        ))[1].tobytes()
+        for name, variant in variants.items()
+    }
+
+
+def check_scores() -> Dict[str, Tuple[float, float]]:
+    """Compare histogram scores of full decode (PIL, as
+    `ImageProcessing.load_target_from_bytes()`) and reduced decode (as
+    comparators) of screenshots against their reference images.
+
+    References are test suite data files and generated frames. Decisions
+    of `improc.HistComparator` (preview first) are checked too.
+
+    :return: (full decode score, reduced decode score) by case name
+    :rtype: Dict[str, Tuple[float, float]]
+
+    :raises AssertionError if reduced decode or preview changes any
+    decision of `improc.THRESHOLD`
+    """
+    comparator = improc.HistComparator()
+    references = sorted(glob.glob(DATA_FILES))
+    for name, size in FRAMES.items():
+        fname = misc.get_tmp_path('benchmarks', f'frame-{name}.jpg')
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'wb') as f:
+            f.write(make_frame(*size))
+        references.append(fname)
+
+    scores = {}
+    changed = []
+    for fname in references:
+        full_reference = improc.get_file_hist(fname)
+        reduced_reference = improc.get_file_hist(fname, reduced=True)
+        reference = comparator.reference(fname)
+        for name, raw in make_variants(cv2.imread(fname)).items():
+            imp = improc.ImageProcessing()
+            imp.load_target_from_bytes(raw)
+            full = improc.compare_hist(full_reference, improc.calc_hist(
+                numpy.array(imp.target), cv2.COLOR_RGB2HSV))
+            reduced = improc.compare_hist(
+                reduced_reference,
+                improc.calc_hist(improc.decode_reduced(raw))
+            )
+            case = f'{os.path.basename(fname)} {name}'
+            scores[case] = full, reduced
+            comparison = comparator.compare(reference, raw)
+            if (full >= improc.THRESHOLD) != (reduced >= improc.THRESHOLD) \
+                    or comparison.match != (full >= improc.THRESHOLD):
+                changed.append(f'{case}: {full} -> {reduced} '
+                               f'({comparison.tier} {comparison.score})')
+
+    assert not changed, (
+        f'Reduced decode or preview changes decisions of THRESHOLD '
+        f'{improc.THRESHOLD}:\n' + '\n'.join(changed)
+    )
+    return scores
+
+
+def print_scores(scores: Dict[str, Tuple[float, float]]) -> None:
+    """Print scores of `check_scores()` as a table.
+
+    :param scores: (full decode score, reduced decode score) by case name
+    :type scores: Dict[str, Tuple[float, float]]
+    """
+    width = max(map(len, scores))
+    print(f'{"Score (full / reduced)":<{width}}  {"full":>8}  '
+          f'{"reduced":>8}')
+    for case, (full, reduced) in scores.items():
+        print(f'{case:<{width}}  {full:>8.3f}  {reduced:>8.3f}')
+    drift = max(abs(full - reduced) for full, reduced in scores.values())
+    print(f'Max drift: {drift:.3f}, threshold: {improc.THRESHOLD}\n')
+
+
+def run() -> dict:
+    print_scores(check_scores())
+    results = {}
+    for name, size in FRAMES.items():
+        raw = make_frame(*size)
+        results[f'{name} PIL + resize'] = common.measure(
+            lambda: full_decode(raw))
+        results[f'{name} reduced imdecode'] = common.measure(
+            lambda: reduced_decode(raw))
+    return results
+
+
+def main():
+    common.print_results(TITLE, run())
+
+
+if __name__ == '__main__':
+    main()
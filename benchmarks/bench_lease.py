@@ -0,0 +1,38 @@
+"""Latency of shared reference counter (see `core.lease`) used by
+parallel workers to share resources (e.g., running campaigns).
+
+python -m benchmarks.bench_lease
+"""
+from core import lease
+from . import common
+
+
+TITLE = 'Shared lease'
+NAME = 'benchmark'
+
+
+def run() -> dict:
+    held = lease.Lease(NAME)
+    other = lease.Lease(NAME)
+    held.acquire()
+
+    def acquire_release():
+        other.acquire()
+        other.release()
+
+    try:
+        return {
+            'acquire + release': common.measure(acquire_release,
+                                                number=100),
+            'count': common.measure(held.count, number=1000),
+        }
+    finally:
+        held.release()
+
+
+def main():
+    common.print_results(TITLE, run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Overhead of logging requests/responses to Allure by event hooks of HTTP
+client in synchronous, deferred and disabled modes (see `core.logger`).
+
+python -m benchmarks.bench_logger
+"""
+import json
+import httpx
+
+from core import logger, settings
+from . import common
+
+
+TITLE = 'Request/response logging'
+URL = 'https://api.test.server/v5/platforms/1/devices/1'
+RECORDS = 20
+
+
+def make_exchange() -> tuple:
+    """Make request and response with JSON bodies.
+
+    :return: request and response
+    :rtype: tuple
+    """
+    request = httpx.Request(
+        'PUT', URL, json={'commands': [{'action': {'command': 'reboot'}}]},
+        headers={'Cookie': 'session=0123456789abcdef'}
+    )
+    response = httpx.Response(
+        200, request=request, headers={'Set-Cookie': 'session=fedcba'},
+        content=json.dumps({
+            f'field_{i}': 'x' * 32 for i in range(64)
+        }).encode()
+    )
+    return request, response
+
+
+def run() -> dict:
+    request, response = make_exchange()
+
+    def log():
+        logger.log_request(request)
+        logger.log_response(response)
+
+    def log_test():
+        for _ in range(RECORDS // 2):
+            log()
+        logger.deferred_log.failed = True
+        logger.deferred_log.flush()
+
+    results = {}
+    log_mode = settings.base_settings.log_mode
+    try:
+        for mode in ('sync', 'deferred', 'off'):
+            settings.base_settings.log_mode = mode
+            if mode == 'deferred':
+                # Records are flushed by every test, keep the log short
+                results[f'{mode}, test of {RECORDS} records'] = \
+                    common.measure(log_test, number=10)
+            else:
+                results[f'{mode}, request + response'] = \
+                    common.measure(log, number=100)
+    finally:
+        settings.base_settings.log_mode = log_mode
+    return results
+
+
+def main():
+    common.print_results(TITLE, run())
+
+
+if __name__ == '__main__':
+    main()
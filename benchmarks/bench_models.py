@@ -0,0 +1,35 @@
+"""Parsing of device info: raw JSON, full `DeviceRetrieveModel` validation
+and validation of `player_metrics` projection (status polling).
+
+python -m benchmarks.bench_models
+"""
+import json
+
+from api.mono.devices import models
+from api.mono.mock import payloads
+from . import common
+
+
+TITLE = 'Device info parsing'
+
+
+def run() -> dict:
+    raw = json.dumps(payloads.device_payload(1)).encode()
+    status_model = models.device_projection(('player_metrics',))
+    return {
+        'json.loads': common.measure(
+            lambda: json.loads(raw)['player_metrics'], number=1000),
+        'DeviceRetrieveModel': common.measure(
+            lambda: models.DeviceRetrieveModel.model_validate_json(raw),
+            number=1000),
+        'player_metrics projection': common.measure(
+            lambda: status_model.model_validate_json(raw), number=1000),
+    }
+
+
+def main():
+    common.print_results(TITLE, run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Per-command overhead of building request payload: pydantic model dump
+and JSON round trip (previous way) against direct JSON serialization and
+cached payloads.
+
+python -m benchmarks.bench_payload
+"""
+import json
+import httpx
+
+from api.mono.devices import device as device_api, models
+from core.client import Base
+from . import common
+
+
+TITLE = 'Command request building'
+URL = 'https://api.test.server/v5/platforms/1/devices/1'
+
+
+def build_model() -> models.DeviceUpdateModel:
+    return models.DeviceUpdateModel(
+        commands=[models.Command(
+            action=models.Action(
+                command=models.ActionCommand.REBOOT,
+                event=models.ActionEvent.COMMAND
+            )
+        )]
+    )
+
+
+def prepare_json() -> httpx.Request:
+    payload = Base.prepare_json(build_model().model_dump(exclude_none=True))
+    return httpx.Request('PUT', URL, json=payload)
+
+
+def dump_json() -> httpx.Request:
+    payload = Base.dump_json(build_model())
+    return httpx.Request('PUT', URL, **Base.json_payload(payload))
+
+
+def cached() -> httpx.Request:
+    payload = device_api.Device.command_payload(models.ActionCommand.REBOOT)
+    return httpx.Request('PUT', URL, **Base.json_payload(payload))
+
+
+def run() -> dict:
+    assert json.loads(prepare_json().read()) \
+        == json.loads(dump_json().read()) == json.loads(cached().read())
+    return {
+        'prepare_json (before)': common.measure(prepare_json, number=1000),
+        'dump_json': common.measure(dump_json, number=1000),
+        'cached command_payload': common.measure(cached, number=1000),
+    }
+
+
+def main():
+    common.print_results(TITLE, run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""End-to-end retrieval of a screenshot (info, request, poll, download)
+through the whole client stack against the mock server of mono API (see
+`api.mono.mock`) running in process without latency, so only the
+framework's own overhead is measured.
+
+python -m benchmarks.bench_screenshot
+"""
+import httpx
+
+from api.mono.devices import device as device_api
+from api.mono.mock import server as mock_server
+from core import improc
+from core.settings import base_settings
+from . import common
+
+
+TITLE = 'Screenshot retrieval (mock server)'
+DEVICE_ID = 1
+
+
+def run() -> dict:
+    server = mock_server.MockServer(devices=[DEVICE_ID], screenshot_delay=0,
+                                    auth=False)
+    with httpx.Client(base_url=base_settings.api_url,
+                      transport=server.transport()) as client:
+        device = device_api.Device(client)
+
+        def stream_and_decode():
+            with device.stream_screenshot(DEVICE_ID) as screenshot:
+                improc.ImageProcessing().load_target_reduced(screenshot)
+
+        return {
+            'retrieve_screenshot': common.measure(
+                lambda: device.retrieve_screenshot(DEVICE_ID), number=20),
+            'stream_screenshot + decode': common.measure(
+                stream_and_decode, number=20),
+        }
+
+
+def main():
+    common.print_results(TITLE, run())
+
+
+if __name__ == '__main__':
+    main()
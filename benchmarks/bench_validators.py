@@ -0,0 +1,50 @@
+"""Validation of device inventory (10k devices) with IP/MAC validators of
+network interfaces, with empty and warm validation caches.
+
+python -m benchmarks.bench_validators
+"""
+from typing import List
+import json
+import pydantic
+
+from api.mono.devices import models
+from api.mono.mock import payloads
+from core import misc
+from . import common
+
+
+TITLE = 'Device inventory validation'
+DEVICES = 10000
+
+
+def clear_caches() -> None:
+    misc.is_ip.cache_clear()
+    misc.is_mac.cache_clear()
+
+
+def run() -> dict:
+    raw = json.dumps(
+        [payloads.device_payload(i) for i in range(DEVICES)]
+    ).encode()
+    inventory = pydantic.TypeAdapter(List[models.DeviceRetrieveModel])
+
+    def cold():
+        clear_caches()
+        inventory.validate_json(raw)
+
+    return {
+        f'{DEVICES} devices, cold cache': common.measure(
+            cold, number=1, repeat=3),
+        f'{DEVICES} devices, warm cache': common.measure(
+            lambda: inventory.validate_json(raw), number=1, repeat=3),
+    }
+
+
+def main():
+    common.print_results(TITLE, run())
+    print(f'is_ip: {misc.is_ip.cache_info()}')
+    print(f'is_mac: {misc.is_mac.cache_info()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from typing import Callable, Any
+import timeit
+import tracemalloc
+import statistics
+
+
+def measure(func: Callable[[], Any], number: int = 10,
+            repeat: int = 5) -> dict:
+    """Measure execution time and peak memory of a callable.
+
+    Peak memory is traced with `tracemalloc`, so only allocations made
+    through Python's allocators are counted (including NumPy arrays and
+    OpenCV images returned as NumPy arrays, excluding internal buffers of
+    C libraries).
+
+    :param func: callable to be measured
+    :type func: Callable[[], Any]
+
+    :param number: number of calls per one timing run
+    :type number: int
+
+    :param repeat: number of timing runs
+    :type repeat: int
+
+    :return: min/mean/max time of one call (in seconds) and peak memory of
+    one call (in bytes)
+    :rtype: dict
+    """
+    timings = [
+        t / number for t in timeit.repeat(func, number=number, repeat=repeat)
+    ]
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'min': min(timings),
+        'mean': statistics.mean(timings),
+        'max': max(timings),
+        'peak_memory': peak,
+    }
+
+
+def print_results(title: str, results: dict) -> None:
+    """Print benchmark results as a table.
+
+    :param title: benchmark title
+    :type title: str
+
+    :param results: results by case name (see `measure()`)
+    :type results: dict
+    """
+    print(f'\n{title}')
+    print(f'{"case":<32} {"min, ms":>10} {"mean, ms":>10} {"peak, MiB":>10}')
+    for case, result in results.items():
+        print(f'{case:<32} {result["min"]*1000:>10.3f} '
+              f'{result["mean"]*1000:>10.3f} '
+              f'{result["peak_memory"]/2**20:>10.2f}')
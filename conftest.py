@@ -1,29 +1,91 @@
-import os.path
-import pickle
-import filelock
 import pytest
 
-from api.mono.auth import multistep
+from api.mono.auth import session
+from api.mono.devices import content
 from core.client import get_http_client
-from core import misc
+from core import logger, telemetry, tracing, wait
+
+
+pytest_plugins = ('core.scheduler',)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    report = (yield).get_result()
+    if report.failed:
+        logger.deferred_log.failed = True
+    if report.when == 'teardown':
+        logger.deferred_log.flush()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    # Spans of setup, call and teardown of a test share one trace
+    with tracing.span('test', {'test.id': item.nodeid}):
+        yield
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    # Session fixtures are already finalized, so their requests (e.g.,
+    # logout) are counted
+    workeroutput = getattr(session.config, 'workeroutput', None)
+    if workeroutput is not None:
+        workeroutput[telemetry.WORKER_OUTPUT_KEY] = \
+            telemetry.recorder.to_dict()
+        workeroutput[tracing.WORKER_OUTPUT_KEY] = tracing.tracer.to_dict()
+        workeroutput[wait.WORKER_OUTPUT_KEY] = wait.to_dict()
+        workeroutput[content.WORKER_OUTPUT_KEY] = content.to_dict()
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    workeroutput = getattr(node, 'workeroutput', None) or {}
+    telemetry.recorder.merge(workeroutput.get(telemetry.WORKER_OUTPUT_KEY,
+                                              {}))
+    tracing.tracer.merge(workeroutput.get(tracing.WORKER_OUTPUT_KEY, []))
+    wait.merge(workeroutput.get(wait.WORKER_OUTPUT_KEY, {}))
+    content.merge(workeroutput.get(content.WORKER_OUTPUT_KEY, {}))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if hasattr(config, 'workerinput'):
+        return
+    if telemetry.recorder.endpoints:
+        terminalreporter.section('HTTP metrics (latency in ms)')
+        for line in telemetry.recorder.summary():
+            terminalreporter.write_line(line)
+        terminalreporter.write_line(
+            f'Histograms written to "{telemetry.recorder.dump()}"'
+        )
+    if tracing.tracer.spans:
+        lines = tracing.tracer.device_summary()
+        if lines:
+            terminalreporter.section('Screenshots by device (median, s)')
+            for line in lines:
+                terminalreporter.write_line(line)
+        terminalreporter.write_line(
+            f'Trace written to "{tracing.tracer.dump()}"'
+        )
+    if wait.stats:
+        terminalreporter.section('Waits by kind (mean polls, duration in s)')
+        for line in wait.summary():
+            terminalreporter.write_line(line)
+    if content.stats:
+        terminalreporter.section('Content verification by campaign '
+                                 '(mean per check, time to match in s)')
+        for line in content.summary():
+            terminalreporter.write_line(line)
 
 
 @pytest.fixture(scope='session')
-def api_client(tmp_path_factory, worker_id):
-    auth = multistep.MultistepAuth(get_http_client())
-    if worker_id != "master":
-        session_file = misc.get_tmp_path('session.cookies')
-        with filelock.FileLock(session_file + '.lock'):
-            if os.path.isfile(session_file):
-                with open(session_file, 'rb+') as f:
-                    cookies = pickle.load(f)
-                auth.client.cookies.jar._cookies.update(cookies)
-            else:
-                auth.login()
-                with open(session_file, 'wb') as f:
-                    pickle.dump(auth.client.cookies.jar._cookies, f)
-        yield auth.client
-    else:
-        auth.login()
-        yield auth.client
-        auth.logout()
+def api_client(worker_id):
+    manager = session.SessionManager(get_http_client())
+    manager.open()
+    # Deferred records of log in belong to this fixture, not to the first
+    # test using it
+    logger.deferred_log.flush()
+    yield manager.client
+    if worker_id == 'master':
+        manager.close()
+        logger.deferred_log.flush()
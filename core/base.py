@@ -1,7 +1,10 @@
 import enum
 import inspect
 from typing import Optional
-from pydantic import create_model, BaseModel
+from typing_extensions import Annotated
+from pydantic import create_model, BaseModel, AfterValidator
+
+from . import misc
 
 
 class StrEnum(str, enum.Enum):
@@ -17,6 +20,10 @@ class IntEnum(int, enum.Enum):
     pass
 
 
+IPAddress = Annotated[str, AfterValidator(misc.is_ip)]
+MACAddress = Annotated[str, AfterValidator(misc.is_mac)]
+
+
 def optional(*fields):
     def dec(cls):
         fields_dict = {}
@@ -0,0 +1,137 @@
+from typing import Iterator, List
+import logging
+import contextlib
+import threading
+import httpx
+
+from . import logger
+
+
+INITIAL_SIZE = 2**20  # bytes
+# Maximal number of free buffers kept (surplus ones are garbage collected)
+MAX_FREE = 8
+
+
+class BufferPool:
+    """Pool of reusable byte buffers.
+
+    Buffers grow on demand and are never shrunk, so after a few downloads
+    every buffer fits the largest response and no more allocations occur.
+
+    :ivar buffer_size: initial size of a new buffer
+    :ivar max_free: maximal number of free buffers kept in the pool
+    """
+    def __init__(self, buffer_size: int = INITIAL_SIZE,
+                 max_free: int = MAX_FREE):
+        self.buffer_size = buffer_size
+        self.max_free = max_free
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+
+    def _get(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.buffer_size)
+
+    def _put(self, buf: bytearray) -> None:
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
+
+    @contextlib.contextmanager
+    def buffer(self) -> Iterator[bytearray]:
+        """Borrow buffer from the pool.
+
+        :return: buffer (returned to the pool on exit)
+        :rtype: Iterator[bytearray]
+        """
+        buf = self._get()
+        try:
+            yield buf
+        finally:
+            self._put(buf)
+
+    @contextlib.contextmanager
+    def download(self, client: httpx.Client,
+                 url: str) -> Iterator[memoryview]:
+        """Stream response body into a buffer from the pool.
+
+        Body is not attached to Allure report. Returned view is valid only
+        inside `with` block and must not be referenced after it. Objects
+        exporting the view (e.g. `numpy.frombuffer(view)`) must not outlive
+        the block either: if one does, the buffer is left to it and is not
+        returned to the pool (so it is never overwritten by next download).
+
+        :param client: HTTP client
+        :type client: httpx.Client
+
+        :param url: URL to download
+        :type url: str
+
+        :return: zero-copy view of response body
+        :rtype: Iterator[memoryview]
+        """
+        buf = self._get()
+        view = None
+        try:
+            with client.stream(
+                    'GET', url, extensions={logger.STREAM: True}
+            ) as response:
+                size = read_into(response, buf)
+                view = memoryview(buf)[:size]
+                yield view
+        finally:
+            if view is not None:
+                # Fails if the view itself is exported, then so is buffer
+                with contextlib.suppress(BufferError):
+                    view.release()
+            if is_exported(buf):
+                logging.warning(f'Buffer of {url} is still exported after '
+                                f'download, it is not reused')
+            else:
+                self._put(buf)
+
+
+def is_exported(buf: bytearray) -> bool:
+    """Check whether buffer is exported (e.g. viewed by a numpy array).
+
+    Exported buffer can not be resized, so a resize is tried.
+
+    :param buf: buffer
+    :type buf: bytearray
+
+    :return: True if buffer is exported
+    :rtype: bool
+    """
+    try:
+        buf.append(0)
+    except BufferError:
+        return True
+    buf.pop()
+    return False
+
+
+def read_into(response: httpx.Response, buf: bytearray) -> int:
+    """Read streamed response body into buffer, growing it if necessary.
+
+    :param response: streamed response
+    :type response: httpx.Response
+
+    :param buf: destination buffer
+    :type buf: bytearray
+
+    :return: size of response body
+    :rtype: int
+    """
+    size = 0
+    for chunk in response.iter_bytes():
+        end = size + len(chunk)
+        if end > len(buf):
+            buf.extend(bytes(max(end, 2*len(buf)) - len(buf)))
+        buf[size:end] = chunk
+        size = end
+    return size
+
+
+pool = BufferPool()
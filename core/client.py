@@ -1,16 +1,31 @@
-from typing import Callable, Any
+from typing import AsyncIterator, Callable, Any, Dict, Iterator, Union
 import json
+import time
+import threading
 import httpx
+import pydantic
 import seleniumbase
 
-from . import settings, logger
+from . import settings, logger, telemetry
+
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
 
 
 class Base:
     """Bridge class between HTTP client and framework's API.
 
+    URL patterns of subclasses (`URL_*` attributes) are registered as
+    endpoints of request metrics (see `core.telemetry`).
+
     :ivar client: HTTP client
     """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, value in vars(cls).items():
+            if name.startswith('URL_') and isinstance(value, str):
+                telemetry.recorder.register(value)
+
     def __init__(self, client):
         self.client = client
 
@@ -50,6 +65,36 @@ class Base:
         """
         return json.loads(json.dumps(model))
 
+    @staticmethod
+    def dump_json(model: pydantic.BaseModel) -> bytes:
+        """Serialize pydantic model directly to request payload (JSON bytes)
+        excluding None values.
+
+        :param model: model to be serialized
+        :type model: pydantic.BaseModel
+
+        :return: serialized payload
+        :rtype: bytes
+        """
+        return model.__pydantic_serializer__.to_json(model, exclude_none=True)
+
+    @staticmethod
+    def json_payload(payload: Union[dict, bytes]) -> dict:
+        """Get request arguments for JSON payload.
+
+        self.client.put(url, **self.json_payload(payload))
+
+        :param payload: payload as dict or serialized JSON (see
+        `dump_json()`)
+        :type payload: Union[dict, bytes]
+
+        :return: keyword arguments of HTTP client's request
+        :rtype: dict
+        """
+        if isinstance(payload, bytes):
+            return {'content': payload, 'headers': JSON_HEADERS}
+        return {'json': payload}
+
     @staticmethod
     def check_status_ok(request: Callable[..., Any], *args, **kwargs):
         """Checks status code of a response whether it is equal to 200 (OK).
@@ -67,19 +112,362 @@ class Base:
             return False
 
 
-def get_http_client():
+class SharedTransport(httpx.BaseTransport):
+    """Transport shared by all HTTP clients of a process.
+
+    Closing a client does not close shared transport, so warm connections
+    stay available to other clients.
+
+    :ivar transport: underlying transport
+    """
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.transport.handle_request(request)
+
+    def close(self) -> None:
+        pass
+
+
+class RedirectTransport(httpx.BaseTransport):
+    """Transport sending all requests to one server (e.g. local mock
+    server), original host is kept in Host header.
+
+    :ivar transport: underlying transport
+    :ivar url: URL of the server
+    """
+    def __init__(self, transport: httpx.BaseTransport, url: str):
+        self.transport = transport
+        self.url = httpx.URL(url)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        request.url = redirect_url(url, self.url)
+        try:
+            return self.transport.handle_request(request)
+        finally:
+            # Cookies are extracted from response for original URL
+            request.url = url
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRedirectTransport(httpx.AsyncBaseTransport):
+    """Asynchronous version of `RedirectTransport`.
+
+    :ivar transport: underlying transport
+    :ivar url: URL of the server
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport, url: str):
+        self.transport = transport
+        self.url = httpx.URL(url)
+
+    async def handle_async_request(self, request: httpx.Request) \
+            -> httpx.Response:
+        url = request.url
+        request.url = redirect_url(url, self.url)
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            request.url = url
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class MeteredStream(httpx.SyncByteStream):
+    """Response stream counting transferred bytes, calls back when body is
+    read or stream is closed.
+
+    :ivar stream: underlying stream
+    :ivar size: number of transferred bytes
+    """
+    def __init__(self, stream: httpx.SyncByteStream,
+                 done: Callable[[int], None]):
+        self.stream = stream
+        self.size = 0
+        self._done = done
+        self._finished = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.stream:
+            self.size += len(chunk)
+            yield chunk
+        # Body is read, response may be closed much later
+        self._finish()
+
+    def close(self) -> None:
+        try:
+            self.stream.close()
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        if not self._finished:
+            self._finished = True
+            self._done(self.size)
+
+
+class AsyncMeteredStream(httpx.AsyncByteStream):
+    """Asynchronous version of `MeteredStream`.
+
+    :ivar stream: underlying stream
+    :ivar size: number of transferred bytes
+    """
+    def __init__(self, stream: httpx.AsyncByteStream,
+                 done: Callable[[int], None]):
+        self.stream = stream
+        self.size = 0
+        self._done = done
+        self._finished = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            self.size += len(chunk)
+            yield chunk
+        # Body is read, response may be closed much later
+        self._finish()
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        if not self._finished:
+            self._finished = True
+            self._done(self.size)
+
+
+class MeteredTransport(httpx.BaseTransport):
+    """Transport recording latency and size of responses (see
+    `core.telemetry`).
+
+    Latency is measured till response body is read or response is closed,
+    so streamed downloads are measured completely.
+
+    :ivar transport: underlying transport
+    """
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = self.transport.handle_request(request)
+        except httpx.TransportError:
+            telemetry.recorder.record(request, None,
+                                      time.perf_counter() - start, 0)
+            raise
+        return meter_response(request, response, start, MeteredStream)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    """Asynchronous version of `MeteredTransport`.
+
+    :ivar transport: underlying transport
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) \
+            -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            telemetry.recorder.record(request, None,
+                                      time.perf_counter() - start, 0)
+            raise
+        return meter_response(request, response, start, AsyncMeteredStream)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def meter_response(request: httpx.Request, response: httpx.Response,
+                   start: float, stream_class: type) -> httpx.Response:
+    """Record response when its body is read or response is closed.
+
+    :param request: request
+    :type request: httpx.Request
+
+    :param response: response returned by transport
+    :type response: httpx.Response
+
+    :param start: time of sending request (`time.perf_counter()`)
+    :type start: float
+
+    :param stream_class: `MeteredStream` or `AsyncMeteredStream`
+    :type stream_class: type
+
+    :return: response with metered stream
+    :rtype: httpx.Response
+    """
+    def done(size: int) -> None:
+        telemetry.recorder.record(request, response.status_code,
+                                  time.perf_counter() - start, size)
+
+    if response.is_closed:
+        # Content is already read (e.g., responses built by mock transport)
+        done(len(response.content))
+    else:
+        response.stream = stream_class(response.stream, done)
+    return response
+
+
+def redirect_url(url: httpx.URL, server_url: httpx.URL) -> httpx.URL:
+    """Replace scheme, host and port of URL with those of server URL.
+
+    :param url: original URL
+    :type url: httpx.URL
+
+    :param server_url: URL of the server
+    :type server_url: httpx.URL
+
+    :return: redirected URL
+    :rtype: httpx.URL
+    """
+    return url.copy_with(scheme=server_url.scheme, host=server_url.host,
+                         port=server_url.port)
+
+
+_transports: Dict[str, SharedTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_limits(max_connections: int = None) -> httpx.Limits:
+    """Get connection pool limits defined by settings.
+
+    :param max_connections: maximal number of connections (overrides
+    `base_settings.http_max_connections`)
+    :type max_connections: int
+
+    :return: connection pool limits
+    :rtype: httpx.Limits
+    """
+    base_settings = settings.base_settings
+    max_connections = max_connections or base_settings.http_max_connections
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(
+            max_connections, base_settings.http_max_keepalive_connections
+        ),
+        keepalive_expiry=base_settings.http_keepalive_expiry
+    )
+
+
+def get_timeout() -> httpx.Timeout:
+    """Get timeouts defined by settings.
+
+    :return: timeouts
+    :rtype: httpx.Timeout
+    """
+    return httpx.Timeout(settings.base_settings.http_timeout,
+                         connect=settings.base_settings.http_connect_timeout)
+
+
+def get_transport(host: str = None) -> SharedTransport:
+    """Get transport (connection pool) shared within a process.
+
+    :param host: host pattern with its own pool (one of
+    `base_settings.http_host_connections`), default pool if omitted
+    :type host: str
+
+    :return: shared transport
+    :rtype: SharedTransport
+    """
+    with _transports_lock:
+        if host not in _transports:
+            max_connections = \
+                settings.base_settings.http_host_connections.get(host)
+            transport = httpx.HTTPTransport(
+                http2=settings.base_settings.http2,
+                limits=get_limits(max_connections)
+            )
+            if settings.base_settings.mock_server_url:
+                transport = RedirectTransport(
+                    transport, settings.base_settings.mock_server_url
+                )
+            if settings.base_settings.http_metrics:
+                transport = MeteredTransport(transport)
+            _transports[host] = SharedTransport(transport)
+        return _transports[host]
+
+
+def get_http_client(cookies: httpx.Cookies = None):
     """Get initialized HTTP client.
 
+    All clients of a process share connection pools (see `get_transport()`).
+
+    :param cookies: initial cookies of the client
+    :type cookies: httpx.Cookies
+
     :return: HTTP client object
     """
     return httpx.Client(
         base_url=settings.base_settings.api_url,
+        cookies=cookies,
+        timeout=get_timeout(),
+        transport=get_transport(),
+        mounts={
+            host: get_transport(host)
+            for host in settings.base_settings.http_host_connections
+        },
         event_hooks={
             'request': [logger.log_request],
             'response': [logger.log_response]}
     )
 
 
+def get_async_http_client(cookies: httpx.Cookies = None):
+    """Get initialized asynchronous HTTP client.
+
+    Asynchronous connections are bound to an event loop, so every client
+    has its own connection pools configured by settings.
+
+    :param cookies: cookies to share with the client (e.g., cookies of
+    already authorized synchronous client)
+    :type cookies: httpx.Cookies
+
+    :return: asynchronous HTTP client object
+    """
+    base_settings = settings.base_settings
+
+    def transport(max_connections: int = None) -> httpx.AsyncBaseTransport:
+        transport = httpx.AsyncHTTPTransport(
+            http2=base_settings.http2, limits=get_limits(max_connections)
+        )
+        if base_settings.mock_server_url:
+            transport = AsyncRedirectTransport(
+                transport, base_settings.mock_server_url
+            )
+        if base_settings.http_metrics:
+            transport = AsyncMeteredTransport(transport)
+        return transport
+
+    return httpx.AsyncClient(
+        base_url=base_settings.api_url,
+        cookies=cookies,
+        timeout=get_timeout(),
+        transport=transport(),
+        mounts={
+            host: transport(max_connections)
+            for host, max_connections
+            in base_settings.http_host_connections.items()
+        },
+        event_hooks={
+            'request': [logger.async_log_request],
+            'response': [logger.async_log_response]}
+    )
+
+
 class Case(seleniumbase.BaseCase):
     """Bridge class for SeleniumBase.
     """
@@ -1,30 +1,816 @@
+from typing import List, Optional, Union
 import io
+import os
 import logging
+import functools
+import hashlib
+import dataclasses
 from PIL import Image
 import cv2
 import numpy
 from matplotlib import pyplot
 
+from . import misc, settings, tracing
+
 
 RESCALE_SIZE = (640, 360)
+# Size of cheap preliminary comparison (see `decode_reduced()`)
+PREVIEW_SIZE = (160, 90)
 HIST_CHANNELS = (0, 1)
 HIST_BINS = (180, 256)
 HIST_RANGE = (0, 180, 0, 256)
 ROUND_PRECISION = 3
 THRESHOLD = 99.5
+# Preview histogram correlation at least THRESHOLD + ACCEPT_MARGIN is a
+# match, less than THRESHOLD - REJECT_MARGIN is a mismatch, otherwise the
+# screenshot is compared again at comparison resolution (see
+# `HistComparator`)
+ACCEPT_MARGIN = 0.3
+REJECT_MARGIN = 5.0
+HIST_CACHE_DIR = 'hist'
+HIST_CACHE_SIZE = 32
+# Perceptual hashes are computed on grayscale thumbnail
+THUMBNAIL_SIZE = (32, 32)
+HASH_SIZE = 8  # bits per side, i.e. 64-bit hashes
+# Hamming distance between hashes at most MATCH_DISTANCE is a match, at least
+# MISMATCH_DISTANCE is a mismatch, otherwise the comparison is ambiguous
+MATCH_DISTANCE = 6
+MISMATCH_DISTANCE = 20
+SSIM_SIZE = (160, 90)
+SSIM_THRESHOLD = 0.9
+# Video frames are compared with the nearest keyframe, so similarity is lower
+VIDEO_THRESHOLD = 95.0
+# Mean absolute difference of thumbnails (in percents) of consecutive frames
+# which is considered as motion
+MOTION_THRESHOLD = 1.0
+# Minimal share of frames matching keyframes
+MATCH_RATIO = 0.5
+# JPEG decoder scales in DCT domain, from the smallest image to the largest
+REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (1, cv2.IMREAD_COLOR),
+)
+# Start Of Frame markers (except DHT, JPG and DAC ones)
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def calc_hist(image: numpy.ndarray, code: int = cv2.COLOR_BGR2HSV,
+              size: tuple = RESCALE_SIZE) -> numpy.ndarray:
+    """Calculate normalized Hue-Saturation histogram of an image.
+
+    Histograms are normalized, so histograms of images rescaled to
+    different sizes are comparable.
+
+    :param image: loaded image
+    :type image: numpy.ndarray
+
+    :param code: colorspace conversion code (image is BGR by default)
+    :type code: int
+
+    :param size: (width, height) image is rescaled to
+    :type size: tuple
+
+    :return: histogram
+    :rtype: numpy.ndarray
+    """
+    resized = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+    hsv = cv2.cvtColor(resized, code)
+    hist = cv2.calcHist(
+        [hsv], HIST_CHANNELS, None, HIST_BINS, HIST_RANGE, accumulate=False
+    )
+    cv2.normalize(hist, hist, alpha=0, beta=1, norm_type=cv2.NORM_MINMAX)
+    return hist
+
+
+@functools.lru_cache(maxsize=HIST_CACHE_SIZE)
+def _load_hist(fname: str, mtime: int, file_size: int, reduced: bool,
+               size: tuple) -> numpy.ndarray:
+    """Load histogram of an image file from on-disk cache, calculate and
+    store it in cache on miss.
+
+    Histograms are stored as .npy files and are memory-mapped, so the same
+    pages are shared between all workers.
+
+    :param fname: absolute filename
+    :type fname: str
+
+    :param mtime: modification time of a file (in nanoseconds)
+    :type mtime: int
+
+    :param file_size: size of a file
+    :type file_size: int
+
+    :param reduced: decode image with `decode_reduced()`
+    :type reduced: bool
+
+    :param size: (width, height) image is rescaled to
+    :type size: tuple
+
+    :return: read-only histogram
+    :rtype: numpy.ndarray
+    """
+    key = hashlib.sha1(
+        f'{fname}|{mtime}|{file_size}|{reduced}|{size}|{HIST_BINS}|'
+        f'{HIST_RANGE}'.encode()
+    ).hexdigest()
+    path = misc.get_tmp_path(HIST_CACHE_DIR, f'{key}.npy')
+    if not os.path.isfile(path):
+        if reduced:
+            with open(fname, 'rb') as f:
+                image = decode_reduced(f.read(), size)
+        else:
+            image = cv2.imread(fname)
+        hist = calc_hist(image, size=size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to temporary file first, so other workers never see
+        # partially written histogram
+        tmp_path = f'{path}.{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            numpy.save(f, hist)
+        os.replace(tmp_path, path)
+    return numpy.load(path, mmap_mode='r')
+
+
+def get_file_hist(fname: str, reduced: bool = False,
+                  size: tuple = RESCALE_SIZE) -> numpy.ndarray:
+    """Get normalized Hue-Saturation histogram of an image file.
+
+    Histogram is calculated once per file version (path + mtime) and cached
+    in memory and on disk under `base_settings.tmp_path`.
+
+    Reference of screenshots decoded with `decode_reduced()` must be
+    decoded the same way: DCT-domain downscaling smooths fine details
+    (e.g. noise), so histograms of full and reduced decodes of the same
+    image may differ by more than THRESHOLD tolerates.
+
+    :param fname: filename
+    :type fname: str
+
+    :param reduced: decode image with `decode_reduced()`
+    :type reduced: bool
+
+    :param size: (width, height) image is rescaled to (e.g. PREVIEW_SIZE
+    for histograms of previews)
+    :type size: tuple
+
+    :return: read-only histogram
+    :rtype: numpy.ndarray
+    """
+    fname = os.path.abspath(fname)
+    stat = os.stat(fname)
+    return _load_hist(fname, stat.st_mtime_ns, stat.st_size, reduced, size)
+
+
+def compare_hist(source_hist: numpy.ndarray,
+                 target_hist: numpy.ndarray) -> float:
+    """Compare two histograms.
+
+    :param source_hist: histogram of source image
+    :type source_hist: numpy.ndarray
+
+    :param target_hist: histogram of target image
+    :type target_hist: numpy.ndarray
+
+    :return: correlation (in percents)
+    :rtype: float
+    """
+    return round(
+        cv2.compareHist(source_hist, target_hist, cv2.HISTCMP_CORREL)*100,
+        ROUND_PRECISION
+    )
+
+
+def calc_hists(images, code: int = cv2.COLOR_BGR2HSV) -> numpy.ndarray:
+    """Calculate normalized Hue-Saturation histograms of many images.
+
+    :param images: loaded images
+    :type images: Iterable[numpy.ndarray]
+
+    :param code: colorspace conversion code (images are BGR by default)
+    :type code: int
+
+    :return: flattened histograms, one row per image
+    :rtype: numpy.ndarray
+    """
+    return numpy.stack([calc_hist(image, code).ravel() for image in images])
+
+
+def get_file_hists(fnames, reduced: bool = False) -> numpy.ndarray:
+    """Get (cached) histograms of image files as a stack.
+
+    :param fnames: filenames
+    :type fnames: Iterable[str]
+
+    :param reduced: decode images with `decode_reduced()`
+    :type reduced: bool
+
+    :return: flattened histograms, one row per file
+    :rtype: numpy.ndarray
+    """
+    return numpy.stack([get_file_hist(fname, reduced).ravel()
+                        for fname in fnames])
+
+
+def standardize(hists: numpy.ndarray) -> numpy.ndarray:
+    """Center and normalize flattened histograms, so correlation of two
+    histograms is dot product of standardized ones.
+
+    :param hists: flattened histograms, one row per image
+    :type hists: numpy.ndarray
+
+    :return: standardized histograms
+    :rtype: numpy.ndarray
+    """
+    hists = hists.astype(numpy.float64)
+    hists -= hists.mean(axis=1, keepdims=True)
+    norm = numpy.linalg.norm(hists, axis=1, keepdims=True)
+    norm[norm == 0] = 1
+    return hists / norm
+
+
+def correlation_matrix(target_hists: numpy.ndarray,
+                       reference_hists: numpy.ndarray) -> numpy.ndarray:
+    """Compare every target histogram with every reference histogram.
+
+    Equal to `cv2.compareHist(..., cv2.HISTCMP_CORREL)` for each pair, but
+    all N*M correlations are computed as one matrix product of centered and
+    normalized histograms.
+
+    :param target_hists: flattened histograms of N targets
+    :type target_hists: numpy.ndarray
+
+    :param reference_hists: flattened histograms of M references
+    :type reference_hists: numpy.ndarray
+
+    :return: NxM matrix of correlations (in percents)
+    :rtype: numpy.ndarray
+    """
+    result = standardize(target_hists) @ standardize(reference_hists).T
+    return numpy.round(result*100, ROUND_PRECISION)
+
+
+def compare_batch(targets, reference_fnames,
+                  threshold: float = THRESHOLD) -> numpy.ndarray:
+    """Compare many target images with many reference image files.
+
+    :param targets: loaded BGR target images (see `decode_reduced()`)
+    :type targets: Iterable[numpy.ndarray]
+
+    :param reference_fnames: filenames of reference images
+    :type reference_fnames: Iterable[str]
+
+    :param threshold: minimal correlation for images to be considered equal
+    :type threshold: float
+
+    :return: NxM boolean matrix, True if target matches reference
+    :rtype: numpy.ndarray
+    """
+    return correlation_matrix(
+        calc_hists(targets), get_file_hists(reference_fnames, reduced=True)
+    ) >= threshold
+
+
+def jpeg_size(raw: bytes) -> tuple:
+    """Get dimensions of JPEG image from its SOF header without decoding.
+
+    :param raw: JPEG image
+    :type raw: bytes (or any object supporting buffer protocol)
+
+    :return: (width, height), or (0, 0) if SOF header is not found
+    :rtype: tuple
+    """
+    data = memoryview(raw)
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            break
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(data[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(data[pos + 7:pos + 9], 'big')
+            return width, height
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+    return 0, 0
+
+
+def decode_reduced(raw: bytes, size: tuple = RESCALE_SIZE) -> numpy.ndarray:
+    """Decode JPEG image downscaled in DCT domain.
+
+    The smallest decoder scale (1/8, 1/4, 1/2) which keeps image not less
+    than given size is chosen, so full-resolution image is never decoded.
+    Image is decoded directly from given buffer without copying it.
+
+    :param raw: JPEG image
+    :type raw: bytes (or any object supporting buffer protocol, e.g.
+               memoryview of a pooled buffer)
+
+    :param size: minimal (width, height) of decoded image
+    :type size: tuple
+
+    :return: decoded BGR image
+    :rtype: numpy.ndarray
+    """
+    width, height = jpeg_size(raw)
+    for scale, flag in REDUCED_MODES:
+        if width // scale >= size[0] and height // scale >= size[1]:
+            break
+    return cv2.imdecode(numpy.frombuffer(raw, dtype=numpy.uint8), flag)
+
+
+def thumbnail(image: numpy.ndarray) -> numpy.ndarray:
+    """Get grayscale thumbnail of an image for perceptual hashing.
+
+    :param image: loaded BGR image
+    :type image: numpy.ndarray
+
+    :return: grayscale thumbnail of THUMBNAIL_SIZE
+    :rtype: numpy.ndarray
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def dhash(thumb: numpy.ndarray) -> int:
+    """Calculate difference hash: signs of horizontal gradients of
+    downscaled thumbnail.
+
+    :param thumb: grayscale thumbnail (see `thumbnail()`)
+    :type thumb: numpy.ndarray
+
+    :return: 64-bit hash
+    :rtype: int
+    """
+    small = cv2.resize(thumb, (HASH_SIZE + 1, HASH_SIZE),
+                       interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(numpy.packbits(bits).tobytes(), 'big')
+
+
+def phash(thumb: numpy.ndarray) -> int:
+    """Calculate perceptual hash: signs of the lowest DCT frequencies of
+    thumbnail relative to their median.
+
+    :param thumb: grayscale thumbnail (see `thumbnail()`)
+    :type thumb: numpy.ndarray
+
+    :return: 64-bit hash
+    :rtype: int
+    """
+    dct = cv2.dct(numpy.float32(thumb))[:HASH_SIZE, :HASH_SIZE]
+    # DC component (average brightness) is excluded from median
+    bits = dct > numpy.median(dct.ravel()[1:])
+    return int.from_bytes(numpy.packbits(bits).tobytes(), 'big')
+
+
+HASHES = {
+    'dhash': dhash,
+    'phash': phash,
+}
+
+
+def hamming(a: int, b: int) -> int:
+    """Get Hamming distance between hashes.
+
+    :return: number of different bits
+    :rtype: int
+    """
+    return bin(a ^ b).count('1')
+
+
+def ssim(a: numpy.ndarray, b: numpy.ndarray) -> float:
+    """Calculate mean structural similarity of grayscale images of the same
+    size.
+
+    https://ece.uwaterloo.ca/~z70wang/publications/ssim.pdf
+
+    :return: SSIM (from -1 to 1)
+    :rtype: float
+    """
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    a = a.astype(numpy.float32)
+    b = b.astype(numpy.float32)
+
+    def blur(image):
+        return cv2.GaussianBlur(image, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    mu_aa, mu_bb, mu_ab = mu_a * mu_a, mu_b * mu_b, mu_a * mu_b
+    sigma_aa = blur(a * a) - mu_aa
+    sigma_bb = blur(b * b) - mu_bb
+    sigma_ab = blur(a * b) - mu_ab
+    ssim_map = (2 * mu_ab + c1) * (2 * sigma_ab + c2) / \
+        ((mu_aa + mu_bb + c1) * (sigma_aa + sigma_bb + c2))
+    return float(ssim_map.mean())
+
+
+def ssim_gray(image: numpy.ndarray) -> numpy.ndarray:
+    """Prepare grayscale image for `ssim()`.
+
+    :param image: loaded BGR image
+    :type image: numpy.ndarray
+
+    :return: grayscale image of SSIM_SIZE
+    :rtype: numpy.ndarray
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, SSIM_SIZE, interpolation=cv2.INTER_AREA)
+
+
+@dataclasses.dataclass(frozen=True)
+class Reference:
+    """Precomputed features of reference image.
+
+    :ivar hash: perceptual hash
+    :ivar hist: Hue-Saturation histogram
+    :ivar gray: grayscale image for SSIM
+    """
+    hash: int
+    hist: numpy.ndarray
+    gray: numpy.ndarray
+
+
+@dataclasses.dataclass(frozen=True)
+class HistReference:
+    """Histograms of reference image (see `HistComparator`).
+
+    :ivar preview: histogram of preview
+    :ivar hist: histogram at comparison resolution
+    """
+    preview: numpy.ndarray
+    hist: numpy.ndarray
+
+
+@dataclasses.dataclass
+class Comparison:
+    """Result of tiered comparison (true if images match).
+
+    :ivar match: whether images match
+    :ivar tier: tier which made the decision: cheap 'hash' or 'preview',
+    or escalated 'hist' or 'ssim'
+    :ivar distance: Hamming distance between hashes, None if hashes are
+    not compared (see `HistComparator`)
+    :ivar score: histogram correlation (in percents) or SSIM, None if
+    decided by hashes
+    """
+    CHEAP_TIERS = ('hash', 'preview')
+
+    match: bool
+    tier: str
+    distance: Optional[int]
+    score: Optional[float] = None
+
+    @property
+    def escalated(self) -> bool:
+        return self.tier not in self.CHEAP_TIERS
+
+    def __bool__(self) -> bool:
+        return self.match
+
+
+class HistComparator:
+    """Comparison of screenshots with reference images by Hue-Saturation
+    histogram correlation (default comparison, see `get_comparator()`).
+
+    Preview of screenshot (see `PREVIEW_SIZE`) decides if its score is
+    clear enough, i.e. not within `reject_margin` below and
+    `accept_margin` above the threshold. Otherwise the screenshot is
+    decoded again and compared at comparison resolution.
+
+    :ivar threshold: minimal histogram correlation of a match
+    :ivar accept_margin: margin above threshold of a match by preview
+    :ivar reject_margin: margin below threshold of a mismatch by preview
+    """
+    def __init__(self, threshold: float = THRESHOLD,
+                 accept_margin: float = ACCEPT_MARGIN,
+                 reject_margin: float = REJECT_MARGIN):
+        self.threshold = threshold
+        self.accept_margin = accept_margin
+        self.reject_margin = reject_margin
+
+    def reference(self, fname: str) -> HistReference:
+        """Get (cached) histograms of reference image file.
+
+        Reference is decoded the same way as screenshots, both at preview
+        and comparison resolution.
+
+        :param fname: filename
+        :type fname: str
+
+        :return: histograms
+        :rtype: HistReference
+        """
+        return HistReference(
+            preview=get_file_hist(fname, reduced=True, size=PREVIEW_SIZE),
+            hist=get_file_hist(fname, reduced=True),
+        )
+
+    def compare(self, reference: HistReference, raw: bytes) -> Comparison:
+        """Compare screenshot with reference image.
+
+        :param reference: histograms of reference image (see
+        `reference()`)
+        :type reference: HistReference
+
+        :param raw: screenshot in JPEG format
+        :type raw: bytes (or any object supporting buffer protocol)
+
+        :return: result of comparison
+        :rtype: Comparison
+        """
+        with tracing.span('compare_images') as span:
+            comparison = self._compare(reference, raw)
+            span.attributes.update({
+                'compare.match': comparison.match,
+                'compare.tier': comparison.tier,
+                'compare.score': comparison.score,
+            })
+        return comparison
+
+    def _compare(self, reference: HistReference, raw: bytes) -> Comparison:
+        score = compare_hist(reference.preview, calc_hist(
+            decode_reduced(raw, PREVIEW_SIZE), size=PREVIEW_SIZE
+        ))
+        logging.debug(f'Preview compare result = {score}')
+        if score >= self.threshold + self.accept_margin:
+            return Comparison(True, 'preview', None, score)
+        if score < self.threshold - self.reject_margin:
+            return Comparison(False, 'preview', None, score)
+
+        score = compare_hist(reference.hist, calc_hist(decode_reduced(raw)))
+        logging.debug(f'Compare result = {score}')
+        return Comparison(score >= self.threshold, 'hist', None, score)
+
+
+@functools.lru_cache(maxsize=HIST_CACHE_SIZE)
+def _load_reference(fname: str, mtime: int, size: int,
+                    hash_name: str) -> Reference:
+    # Reference preview is decoded the same way as screenshot previews
+    with open(fname, 'rb') as f:
+        preview = decode_reduced(f.read(), PREVIEW_SIZE)
+    return Reference(
+        hash=HASHES[hash_name](thumbnail(preview)),
+        hist=get_file_hist(fname, reduced=True),
+        gray=ssim_gray(preview),
+    )
+
+
+class TieredComparator:
+    """Comparison of screenshots with reference images, from the cheapest
+    method to the most expensive one (enabled per campaign, see
+    `get_comparator()`).
+
+    Perceptual hash of preview (see `PREVIEW_SIZE`) decides if it is clear
+    enough, i.e. Hamming distance is not between `match_distance` and
+    `mismatch_distance`. Otherwise fallback method decides: Hue-Saturation
+    histogram correlation (screenshot is decoded again at comparison
+    resolution) or SSIM of preview.
+
+    :ivar hash_name: perceptual hash ('dhash' or 'phash')
+    :ivar match_distance: maximal distance of a match
+    :ivar mismatch_distance: minimal distance of a mismatch
+    :ivar fallback: fallback method ('hist' or 'ssim')
+    :ivar threshold: minimal histogram correlation of a match
+    :ivar ssim_threshold: minimal SSIM of a match
+    """
+    def __init__(self, hash_name: str = 'dhash',
+                 match_distance: int = MATCH_DISTANCE,
+                 mismatch_distance: int = MISMATCH_DISTANCE,
+                 fallback: str = 'hist', threshold: float = THRESHOLD,
+                 ssim_threshold: float = SSIM_THRESHOLD):
+        assert hash_name in HASHES, f'Unknown hash {hash_name}'
+        assert fallback in ('hist', 'ssim'), f'Unknown fallback {fallback}'
+        self.hash_name = hash_name
+        self.match_distance = match_distance
+        self.mismatch_distance = mismatch_distance
+        self.fallback = fallback
+        self.threshold = threshold
+        self.ssim_threshold = ssim_threshold
+
+    def reference(self, fname: str) -> Reference:
+        """Get (cached) features of reference image file.
+
+        :param fname: filename
+        :type fname: str
+
+        :return: reference
+        :rtype: Reference
+        """
+        fname = os.path.abspath(fname)
+        stat = os.stat(fname)
+        return _load_reference(fname, stat.st_mtime_ns, stat.st_size,
+                               self.hash_name)
+
+    def compare(self, reference: Reference, raw: bytes) -> Comparison:
+        """Compare screenshot with reference image.
+
+        :param reference: reference image (see `reference()`)
+        :type reference: Reference
+
+        :param raw: screenshot in JPEG format
+        :type raw: bytes (or any object supporting buffer protocol)
+
+        :return: result of comparison
+        :rtype: Comparison
+        """
+        with tracing.span('compare_images') as span:
+            comparison = self._compare(reference, raw)
+            span.attributes.update({
+                'compare.match': comparison.match,
+                'compare.tier': comparison.tier,
+                'compare.distance': comparison.distance,
+            })
+            if comparison.score is not None:
+                span.set_attribute('compare.score', comparison.score)
+        return comparison
+
+    def _compare(self, reference: Reference, raw: bytes) -> Comparison:
+        preview = decode_reduced(raw, PREVIEW_SIZE)
+        distance = hamming(
+            HASHES[self.hash_name](thumbnail(preview)), reference.hash
+        )
+        logging.debug(f'Hash distance = {distance}')
+        if distance <= self.match_distance:
+            return Comparison(True, 'hash', distance)
+        if distance >= self.mismatch_distance:
+            return Comparison(False, 'hash', distance)
+
+        if self.fallback == 'ssim':
+            score = round(ssim(reference.gray, ssim_gray(preview)),
+                          ROUND_PRECISION)
+            match = score >= self.ssim_threshold
+        else:
+            score = compare_hist(reference.hist,
+                                 calc_hist(decode_reduced(raw)))
+            match = score >= self.threshold
+        logging.debug(f'Compare result ({self.fallback}) = {score}')
+        return Comparison(match, self.fallback, distance, score)
+
+
+Comparator = Union[HistComparator, TieredComparator]
+
+
+def get_comparator(campaign: str = None) -> Comparator:
+    """Get comparator of a campaign.
+
+    Campaigns configured by `base_settings.comparison` use tiered
+    comparison (unset fields take default values). Others are compared by
+    histograms (of previews first): perceptual hashes ignore colors, so
+    e.g. grayscale or channel-swapped screenshot would match reference at
+    the hash tier.
+
+    :param campaign: campaign name
+    :type campaign: str
+
+    :return: comparator
+    :rtype: Comparator
+    """
+    config = settings.base_settings.comparison.get(campaign)
+    if config is None:
+        return HistComparator()
+    return TieredComparator(**config.model_dump(exclude_unset=True))
+
+
+@dataclasses.dataclass
+class FrameMatch:
+    """Result of comparison of video frame with keyframes.
+
+    :ivar index: frame number
+    :ivar keyframe: index of the most similar keyframe
+    :ivar score: histogram correlation with the keyframe (in percents)
+    :ivar distance: Hamming distance between hashes of frame and keyframe
+    :ivar difference: mean absolute difference from previous frame (in
+    percents), None for the first frame
+    """
+    index: int
+    keyframe: int
+    score: float
+    distance: int
+    difference: Optional[float]
+
+
+class VideoMatcher:
+    """Incremental verification of video playback.
+
+    Frames (e.g. screenshots of a device) are added one by one as they
+    arrive. Every frame is decoded once at comparison resolution and looked
+    up in keyframe index (see `core.keyframes.KeyframeIndex.nearest()`):
+    histograms are correlated only for keyframes with the closest hashes.
+    Thumbnail of a frame (also used for its hash) is compared with the
+    thumbnail of previous frame. Only the last thumbnail is kept, frames
+    are not stored.
+
+    Video is playing if frames change (not frozen) and enough of them match
+    keyframes.
+
+    :ivar index: keyframe index
+    :ivar threshold: minimal correlation of a frame matching a keyframe
+    :ivar motion_threshold: minimal difference of frames considered as
+    motion
+    :ivar match_ratio: minimal share of matching frames
+    :ivar frames: results of added frames
+    """
+    def __init__(self, index, threshold: float = VIDEO_THRESHOLD,
+                 motion_threshold: float = MOTION_THRESHOLD,
+                 match_ratio: float = MATCH_RATIO):
+        self.index = index
+        self.threshold = threshold
+        self.motion_threshold = motion_threshold
+        self.match_ratio = match_ratio
+        self.frames: List[FrameMatch] = []
+        self._thumbnail: Optional[numpy.ndarray] = None
+
+    def add(self, raw: bytes) -> FrameMatch:
+        """Add next frame.
+
+        :param raw: frame in JPEG format
+        :type raw: bytes (or any object supporting buffer protocol)
+
+        :return: result of frame comparison
+        :rtype: FrameMatch
+        """
+        image = decode_reduced(raw)
+        thumb = thumbnail(image)
+        match = self.index.nearest(calc_hist(image),
+                                   HASHES[self.index.hash_name](thumb))
+        difference = None
+        if self._thumbnail is not None:
+            difference = round(
+                float(cv2.absdiff(thumb, self._thumbnail).mean()) / 2.55,
+                ROUND_PRECISION
+            )
+        self._thumbnail = thumb
+        frame = FrameMatch(
+            index=len(self.frames), keyframe=match.index, score=match.score,
+            distance=match.distance, difference=difference
+        )
+        logging.debug(f'Frame {frame}')
+        self.frames.append(frame)
+        return frame
+
+    @property
+    def matched(self) -> int:
+        """Number of frames matching keyframes."""
+        return sum(frame.score >= self.threshold for frame in self.frames)
+
+    @property
+    def moving(self) -> bool:
+        """Whether any consecutive frames differ."""
+        return any(frame.difference is not None and
+                   frame.difference >= self.motion_threshold
+                   for frame in self.frames)
+
+    def is_playing(self, total: int = None) -> bool:
+        """Check whether added frames show playing video.
+
+        :param total: total number of frames to be added (if given, video
+        is considered playing as soon as the rest of frames cannot change
+        the result)
+        :type total: int
+
+        :return: True if frames change and enough frames match keyframes
+        :rtype: bool
+        """
+        total = max(total or 0, len(self.frames))
+        return self.moving and self.matched >= self.match_ratio * total
 
 
 class ImageProcessing:
-    source = None
+    source_hist = None
+    source_fname = None
     target = None
+    _source = None
+
+    @property
+    def source(self) -> Optional[numpy.ndarray]:
+        """Source image (BGR). Only its histogram is needed for comparison,
+        so image loaded by `load_source_from_file()` is read on first
+        access.
+        """
+        if self._source is None and self.source_fname is not None:
+            self._source = cv2.imread(self.source_fname)
+        return self._source
+
+    @source.setter
+    def source(self, image: Optional[numpy.ndarray]) -> None:
+        self._source = image
+        self.source_fname = None
+        self.source_hist = None if image is None else calc_hist(image)
 
     def load_source_from_file(self, fname: str) -> None:
-        """Load source image from file.
+        """Load (cached) histogram of source image from file.
 
         :param fname: filename
         :type fname: str
         """
-        self.source = cv2.imread(fname)
+        self._source = None
+        self.source_fname = fname
+        self.source_hist = get_file_hist(fname)
 
     def load_target_from_bytes(self, raw: bytes) -> None:
         """Load target image from bytes.
@@ -35,6 +821,33 @@ class ImageProcessing:
         stream = io.BytesIO(raw)
         self.target = Image.open(stream)
 
+    def load_target_reduced(self, raw: bytes) -> None:
+        """Load target image from bytes decoding it at reduced resolution
+        (enough for comparison).
+
+        Target is loaded as BGR numpy array, so `is_target_image()` is not
+        applicable.
+
+        :param raw: array of bytes
+        :type raw: bytes (or any object supporting buffer protocol)
+        """
+        self.target = decode_reduced(raw)
+
+    def find_reference(self, index):
+        """Find the nearest reference keyframe of target image.
+
+        :param index: keyframe index
+        :type index: core.keyframes.KeyframeIndex
+
+        :return: the nearest keyframe
+        :rtype: core.keyframes.Match
+        """
+        if isinstance(self.target, numpy.ndarray):
+            return index.nearest_image(self.target)
+        return index.nearest_image(
+            cv2.cvtColor(numpy.array(self.target), cv2.COLOR_RGB2BGR)
+        )
+
     def is_target_image(self) -> bool:
         """Check integrity of target image.
 
@@ -43,37 +856,21 @@ class ImageProcessing:
         self.target.verify()
         return True
 
+    @tracing.traced('compare_images')
     def compare_images(self) -> bool:
         """Compare source and target images using Hue-Saturation histograms.
 
         :return: True if result more or equal predefined THRESHOLD, else False
         """
-        source_r = cv2.resize(self.source, RESCALE_SIZE,
-                              interpolation=cv2.INTER_LINEAR)
-        target_r = cv2.resize(numpy.array(self.target), RESCALE_SIZE,
-                              interpolation=cv2.INTER_LINEAR)
-
-        source_hsv = cv2.cvtColor(source_r, cv2.COLOR_BGR2HSV)
-        target_hsv = cv2.cvtColor(target_r, cv2.COLOR_RGB2HSV)
-
-        source_hist = cv2.calcHist(
-            [source_hsv], HIST_CHANNELS, None, HIST_BINS, HIST_RANGE,
-            accumulate=False
-        )
-        cv2.normalize(source_hist, source_hist, alpha=0, beta=1,
-                      norm_type=cv2.NORM_MINMAX)
-        target_hist = cv2.calcHist(
-            [target_hsv], HIST_CHANNELS, None, HIST_BINS, HIST_RANGE,
-            accumulate=False
-        )
-        cv2.normalize(target_hist, target_hist, alpha=0, beta=1,
-                      norm_type=cv2.NORM_MINMAX)
+        if isinstance(self.target, numpy.ndarray):
+            target_hist = calc_hist(self.target)
+        else:
+            target_hist = calc_hist(numpy.array(self.target),
+                                    cv2.COLOR_RGB2HSV)
 
-        result = round(
-            cv2.compareHist(source_hist, target_hist, cv2.HISTCMP_CORREL)*100,
-            ROUND_PRECISION
-        )
+        result = compare_hist(self.source_hist, target_hist)
         logging.debug(f'Compare result = {result}')
+        tracing.current_span().set_attribute('compare.score', result)
         if result >= THRESHOLD:
             return True
         else:
@@ -0,0 +1,347 @@
+"""Index of reference keyframes built offline from campaign media.
+
+Build index from images and videos (directories are scanned recursively):
+
+python -m core.keyframes build -o test_player/data/video.index media/
+
+Find the nearest keyframe of an image:
+
+python -m core.keyframes query test_player/data/video.index screenshot.jpg
+"""
+from typing import Iterator, List, Tuple
+import os
+import sys
+import json
+import time
+import argparse
+import dataclasses
+import cv2
+import numpy
+
+from . import improc
+
+
+VERSION = 1
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.webm')
+# Video is sampled every SAMPLE_INTERVAL seconds, sample becomes a new
+# keyframe if its hash differs from the previous keyframe at least by
+# KEYFRAME_DISTANCE bits
+SAMPLE_INTERVAL = 0.5
+KEYFRAME_DISTANCE = 8
+# Histograms are correlated only for keyframes with the closest hashes
+CANDIDATES = 8
+HISTS_FILE = 'hists.npy'
+HASHES_FILE = 'hashes.npy'
+META_FILE = 'meta.json'
+
+
+@dataclasses.dataclass
+class Keyframe:
+    """Keyframe of campaign media.
+
+    :ivar source: media filename (relative to the scanned path)
+    :ivar frame: frame number (0 for images)
+    :ivar time: position in video (in seconds)
+    """
+    source: str
+    frame: int = 0
+    time: float = 0
+
+
+@dataclasses.dataclass
+class Match:
+    """The nearest keyframe of an image.
+
+    :ivar index: index of keyframe
+    :ivar keyframe: keyframe
+    :ivar distance: Hamming distance between hashes
+    :ivar score: histogram correlation (in percents)
+    """
+    index: int
+    keyframe: Keyframe
+    distance: int
+    score: float
+
+
+def media_files(paths: List[str]) -> Iterator[Tuple[str, str]]:
+    """Find media files.
+
+    :param paths: files and directories
+    :type paths: List[str]
+
+    :return: iterator over (filename, name relative to given path) pairs
+    :rtype: Iterator[Tuple[str, str]]
+    """
+    extensions = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+    for path in paths:
+        if os.path.isfile(path):
+            yield path, os.path.basename(path)
+            continue
+        for root, _, fnames in sorted(os.walk(path)):
+            for fname in sorted(fnames):
+                if fname.lower().endswith(extensions):
+                    full_name = os.path.join(root, fname)
+                    yield full_name, os.path.relpath(full_name, path)
+
+
+def video_keyframes(fname: str, hash_name: str = 'dhash',
+                    interval: float = SAMPLE_INTERVAL,
+                    distance: int = KEYFRAME_DISTANCE) \
+        -> Iterator[Tuple[int, float, numpy.ndarray]]:
+    """Extract keyframes from a video: samples which differ from the
+    previous keyframe.
+
+    :param fname: video filename
+    :type fname: str
+
+    :param hash_name: perceptual hash (see `improc.HASHES`)
+    :type hash_name: str
+
+    :param interval: sampling interval (in seconds)
+    :type interval: float
+
+    :param distance: minimal hash distance from the previous keyframe
+    :type distance: int
+
+    :return: iterator over (frame number, position in seconds, BGR frame)
+    :rtype: Iterator[Tuple[int, float, numpy.ndarray]]
+
+    :raises OSError when video cannot be opened
+    """
+    capture = cv2.VideoCapture(fname)
+    if not capture.isOpened():
+        raise OSError(f'Could not open video "{fname}"')
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25
+    step = max(1, round(fps * interval))
+    last_hash = None
+    number = 0
+    try:
+        # Frames between samples are only grabbed, not decoded
+        while capture.grab():
+            if number % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    frame_hash = improc.HASHES[hash_name](
+                        improc.thumbnail(frame)
+                    )
+                    if last_hash is None or \
+                            improc.hamming(frame_hash, last_hash) >= distance:
+                        last_hash = frame_hash
+                        yield number, number / fps, frame
+            number += 1
+    finally:
+        capture.release()
+
+
+def build(paths: List[str], output: str, hash_name: str = 'dhash',
+          interval: float = SAMPLE_INTERVAL,
+          distance: int = KEYFRAME_DISTANCE) -> int:
+    """Build keyframe index of campaign media.
+
+    Index is a directory with histograms (standardized, see
+    `improc.standardize()`) and hashes of keyframes as .npy files and
+    keyframes metadata as JSON.
+
+    :param paths: media files and directories
+    :type paths: List[str]
+
+    :param output: index directory
+    :type output: str
+
+    :param hash_name: perceptual hash (see `improc.HASHES`)
+    :type hash_name: str
+
+    :param interval: video sampling interval (in seconds)
+    :type interval: float
+
+    :param distance: minimal hash distance between video keyframes
+    :type distance: int
+
+    :return: number of keyframes
+    :rtype: int
+
+    :raises OSError when a media file cannot be read
+    :raises ValueError when no media is found
+    """
+    keyframes, hists, hashes = [], [], []
+
+    def add(keyframe: Keyframe, image: numpy.ndarray) -> None:
+        keyframes.append(dataclasses.asdict(keyframe))
+        hists.append(improc.standardize(
+            improc.calc_hist(image).reshape(1, -1)
+        )[0].astype(numpy.float32))
+        hashes.append(improc.HASHES[hash_name](improc.thumbnail(image)))
+
+    for fname, source in media_files(paths):
+        if fname.lower().endswith(VIDEO_EXTENSIONS):
+            for number, position, frame in video_keyframes(
+                    fname, hash_name, interval, distance):
+                add(Keyframe(source, number, round(position, 3)), frame)
+        else:
+            image = cv2.imread(fname)
+            if image is None:
+                raise OSError(f'Could not read image "{fname}"')
+            add(Keyframe(source), image)
+    if not keyframes:
+        raise ValueError('No media found')
+
+    os.makedirs(output, exist_ok=True)
+    numpy.save(os.path.join(output, HISTS_FILE), numpy.stack(hists))
+    numpy.save(os.path.join(output, HASHES_FILE),
+               numpy.array(hashes, dtype=numpy.uint64))
+    with open(os.path.join(output, META_FILE), 'w') as f:
+        json.dump({
+            'version': VERSION,
+            'hash_name': hash_name,
+            'rescale_size': improc.RESCALE_SIZE,
+            'hist_bins': improc.HIST_BINS,
+            'keyframes': keyframes,
+        }, f, indent=1)
+    return len(keyframes)
+
+
+class KeyframeIndex:
+    """Memory-mapped keyframe index (see `build()`).
+
+    Lookup compares hash of an image with hashes of all keyframes and
+    correlates histograms only for `CANDIDATES` keyframes with the closest
+    hashes.
+
+    :ivar path: index directory
+    :ivar hash_name: perceptual hash
+    :ivar keyframes: keyframes
+    :ivar hists: standardized flattened histograms, one row per keyframe
+    :ivar hashes: hashes of keyframes
+
+    :raises ValueError when index is built by another version
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r') as f:
+            meta = json.load(f)
+        if meta['version'] != VERSION or \
+                tuple(meta['rescale_size']) != improc.RESCALE_SIZE or \
+                tuple(meta['hist_bins']) != improc.HIST_BINS:
+            raise ValueError(f'Index "{path}" is outdated, rebuild it')
+        self.hash_name = meta['hash_name']
+        self.keyframes = [Keyframe(**keyframe)
+                          for keyframe in meta['keyframes']]
+        self.hists = numpy.load(os.path.join(path, HISTS_FILE),
+                                mmap_mode='r')
+        self.hashes = numpy.load(os.path.join(path, HASHES_FILE),
+                                 mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.keyframes)
+
+    def distances(self, image_hash: int) -> numpy.ndarray:
+        """Get Hamming distances between hash of an image and hashes of all
+        keyframes.
+
+        :param image_hash: hash of an image
+        :type image_hash: int
+
+        :return: distances
+        :rtype: numpy.ndarray
+        """
+        xor = numpy.bitwise_xor(self.hashes, numpy.uint64(image_hash))
+        return numpy.unpackbits(
+            xor.view(numpy.uint8).reshape(-1, 8), axis=1
+        ).sum(axis=1)
+
+    def nearest(self, hist: numpy.ndarray, image_hash: int) -> Match:
+        """Find the nearest keyframe of an image by its features.
+
+        :param hist: histogram of an image (see `improc.calc_hist()`)
+        :type hist: numpy.ndarray
+
+        :param image_hash: perceptual hash of an image (`hash_name`)
+        :type image_hash: int
+
+        :return: the nearest keyframe
+        :rtype: Match
+        """
+        distances = self.distances(image_hash)
+        candidates = numpy.argsort(distances, kind='stable')[:CANDIDATES]
+        # Standardized in float32 like stored histograms (see `build()`)
+        target = hist.ravel().astype(numpy.float32)
+        target -= target.mean()
+        target /= numpy.linalg.norm(target) or 1
+        scores = self.hists[candidates] @ target
+        best = int(scores.argmax())
+        index = int(candidates[best])
+        return Match(
+            index=index, keyframe=self.keyframes[index],
+            distance=int(distances[index]),
+            score=round(float(scores[best])*100, improc.ROUND_PRECISION)
+        )
+
+    def nearest_image(self, image: numpy.ndarray) -> Match:
+        """Find the nearest keyframe of an image.
+
+        :param image: loaded BGR image
+        :type image: numpy.ndarray
+
+        :return: the nearest keyframe
+        :rtype: Match
+        """
+        return self.nearest(
+            improc.calc_hist(image),
+            improc.HASHES[self.hash_name](improc.thumbnail(image))
+        )
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m core.keyframes',
+        description='Index of reference keyframes of campaign media.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build index')
+    build_parser.add_argument('media', nargs='+',
+                              help='media files and directories')
+    build_parser.add_argument('-o', '--output', required=True,
+                              help='index directory')
+    build_parser.add_argument('--hash', default='dhash',
+                              choices=tuple(improc.HASHES),
+                              help='perceptual hash')
+    build_parser.add_argument('--interval', type=float,
+                              default=SAMPLE_INTERVAL,
+                              help='video sampling interval, seconds')
+    build_parser.add_argument('--distance', type=int,
+                              default=KEYFRAME_DISTANCE,
+                              help='minimal hash distance between video '
+                                   'keyframes')
+    query_parser = commands.add_parser('query',
+                                       help='find the nearest keyframes')
+    query_parser.add_argument('index', help='index directory')
+    query_parser.add_argument('images', nargs='+', help='images')
+    options = parser.parse_args(args)
+
+    if options.command == 'build':
+        count = build(options.media, options.output, options.hash,
+                      options.interval, options.distance)
+        print(f'{count} keyframes written to "{options.output}"')
+    else:
+        index = KeyframeIndex(options.index)
+        for fname in options.images:
+            image = cv2.imread(fname)
+            if image is None:
+                raise OSError(f'Could not read image "{fname}"')
+            hist = improc.calc_hist(image)
+            image_hash = improc.HASHES[index.hash_name](
+                improc.thumbnail(image)
+            )
+            start = time.perf_counter()
+            match = index.nearest(hist, image_hash)
+            elapsed = time.perf_counter() - start
+            print(f'{fname}: {match.keyframe.source} '
+                  f'frame {match.keyframe.frame} '
+                  f'({match.keyframe.time} s), '
+                  f'distance {match.distance}, score {match.score}, '
+                  f'lookup {elapsed*1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,253 @@
+from typing import Callable, Any, Iterator, Optional, Tuple
+import os
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import contextlib
+
+from . import misc, settings, wait
+
+
+# States of a shared resource guarded by leases (see `Lease.acquire()`)
+STOPPED = 'stopped'
+STARTING = 'starting'
+STARTED = 'started'
+STOPPING = 'stopping'
+
+
+class Lease:
+    """Named reference counter shared between processes (e.g., xdist
+    workers).
+
+    Every holder owns a lease which expires after `base_settings.lease_ttl`
+    seconds (unless renewed, see `renewing()`), so leases of crashed
+    workers do not block others forever.
+    Leases are stored in SQLite database in WAL mode, all operations are
+    atomic and use indexed lookups.
+
+    Callbacks starting and stopping a shared resource run outside of write
+    transactions, so slow callbacks (e.g., HTTP requests) never block lease
+    operations of other holders. Instead, state of the resource is kept in
+    a row per name: the holder which moves it to a transitional state
+    (starting or stopping) runs the callback, other holders wait for the
+    transition to finish.
+
+    :ivar name: name of a counter
+    :ivar lease_id: ID of a lease held by this instance
+    """
+    DB_NAME = 'leases.db'
+    WAIT_TRANSITION = 'lease transition'
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lease_id: Optional[int] = None
+        self._owner = f'{os.getpid()}-{uuid.uuid4().hex}'
+        self._db = sqlite3.connect(
+            misc.get_tmp_path(self.DB_NAME), timeout=60,
+            isolation_level=None, check_same_thread=False
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS leases (id INTEGER PRIMARY KEY, '
+            'name TEXT, owner TEXT, expires_at REAL)'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS leases_name '
+            'ON leases (name, expires_at)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS states (name TEXT PRIMARY KEY, '
+            'state TEXT, owner TEXT, updated_at REAL)'
+        )
+
+    def _transaction(self, operation: Callable[[], Any]) -> Tuple[Any, int]:
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            self._db.execute(
+                'DELETE FROM leases WHERE name = ? AND expires_at < ?',
+                (self.name, time.time())
+            )
+            result = operation()
+            count = self.count()
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+        return result, count
+
+    def _state(self) -> str:
+        row = self._db.execute(
+            'SELECT state, updated_at FROM states WHERE name = ?',
+            (self.name,)
+        ).fetchone()
+        if row is None:
+            return STOPPED
+        state, updated_at = row
+        if state in (STARTING, STOPPING) and \
+                time.time() - updated_at > settings.base_settings.lease_ttl:
+            # Holder running the transition has crashed
+            return STOPPED
+        return state
+
+    def _set_state(self, state: str) -> None:
+        self._db.execute(
+            'INSERT OR REPLACE INTO states (name, state, owner, updated_at) '
+            'VALUES (?, ?, ?, ?)',
+            (self.name, state, self._owner, time.time())
+        )
+
+    def _transition(self, state: str) -> None:
+        self._transaction(lambda: self._set_state(state))
+
+    def acquire(self, callback: Callable[[], Any] = None) -> int:
+        """Acquire lease.
+
+        The lease is held for `base_settings.lease_ttl` seconds, a holder
+        running longer must `renew()` it (see `renewing()`).
+
+        :param callback: called by the holder which finds the resource
+        stopped (e.g., to start shared resource), other holders wait for it
+        to finish; if it fails the lease is not acquired
+        :type callback: Callable[[], Any]
+
+        :return: number of active leases
+        :rtype: int
+        """
+        def insert():
+            return self._db.execute(
+                'INSERT INTO leases (name, owner, expires_at) '
+                'VALUES (?, ?, ?)',
+                (self.name, self._owner,
+                 time.time() + settings.base_settings.lease_ttl)
+            ).lastrowid
+
+        def start() -> Optional[str]:
+            # Take over stopped resource, or wait while another holder is
+            # starting or stopping it
+            state = self._state()
+            if state == STOPPED:
+                self._set_state(STARTING)
+            return state if state in (STOPPED, STARTED) else None
+
+        assert self.lease_id is None, f'Lease "{self.name}" is already held'
+        self.lease_id, count = self._transaction(insert)
+        if callback is None:
+            return count
+
+        def abandon(starting: bool) -> None:
+            self._db.execute('DELETE FROM leases WHERE id = ?',
+                             (self.lease_id,))
+            if starting:
+                # Let another holder start the resource
+                self._set_state(STOPPED)
+
+        state = None
+        try:
+            state = wait.wait(
+                lambda: self._transaction(start)[0],
+                timeout_seconds=settings.base_settings.lease_ttl,
+                kind=self.WAIT_TRANSITION,
+                waiting_for=f'transition of "{self.name}" to finish'
+            )
+            if state == STOPPED:
+                callback()
+        except BaseException:
+            self._transaction(lambda: abandon(state == STOPPED))
+            self.lease_id = None
+            raise
+        if state == STOPPED:
+            self._transition(STARTED)
+        return self.count()
+
+    def release(self, callback: Callable[[], Any] = None) -> int:
+        """Release lease.
+
+        :param callback: called if released lease was the last one (e.g.,
+        to stop shared resource), holders acquiring meanwhile wait for it to
+        finish; the lease is released even if it fails
+        :type callback: Callable[[], Any]
+
+        :return: number of remaining active leases
+        :rtype: int
+        """
+        def delete() -> bool:
+            self._db.execute('DELETE FROM leases WHERE id = ?',
+                             (self.lease_id,))
+            if callback is None or self.count() or \
+                    self._state() != STARTED:
+                return False
+            self._set_state(STOPPING)
+            return True
+
+        stop, count = self._transaction(delete)
+        self.lease_id = None
+        if stop:
+            try:
+                callback()
+            finally:
+                self._transition(STOPPED)
+        return count
+
+    def renew(self) -> bool:
+        """Extend held lease by `base_settings.lease_ttl` seconds from now.
+
+        :return: False if the lease has already expired (it is not held
+        anymore)
+        :rtype: bool
+        """
+        now = time.time()
+        renewed = self._db.execute(
+            'UPDATE leases SET expires_at = ? '
+            'WHERE id = ? AND expires_at >= ?',
+            (now + settings.base_settings.lease_ttl, self.lease_id, now)
+        ).rowcount
+        if not renewed:
+            self.lease_id = None
+        return bool(renewed)
+
+    @contextlib.contextmanager
+    def renewing(self) -> Iterator[None]:
+        """Keep held lease renewed by a background thread (every third of
+        `base_settings.lease_ttl`) inside `with` block.
+
+        with campaign_lease.renewing():
+            run_tests()
+        campaign_lease.release()
+        """
+        stopped = threading.Event()
+
+        def renew():
+            while not stopped.wait(settings.base_settings.lease_ttl / 3):
+                if not self.renew():
+                    logging.warning(f'Lease "{self.name}" has expired')
+                    return
+
+        thread = threading.Thread(target=renew, name=f'lease-{self.name}',
+                                  daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def count(self) -> int:
+        """Get number of active leases.
+
+        :return: number of active leases
+        :rtype: int
+        """
+        return self._db.execute(
+            'SELECT COUNT(*) FROM leases WHERE name = ? AND expires_at >= ?',
+            (self.name, time.time())
+        ).fetchone()[0]
+
+    def is_empty(self) -> bool:
+        """Check whether there are no active leases.
+
+        :return: True if no one holds a lease
+        :rtype: bool
+        """
+        return self.count() == 0
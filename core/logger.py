@@ -1,46 +1,271 @@
-from typing import Union
+from typing import List, Optional, Tuple, Union
+import queue
 import logging
+import threading
 import httpx
 import allure
 
-from . import misc
+from . import misc, settings
 
 
-def attach(obj: Union[httpx.Request, httpx.Response]) -> None:
-    """Attach data to request/response.
+# Request extension which marks streamed requests: their content is read by
+# the caller and must not be read (and attached) by logger
+STREAM = 'mechanist.stream'
+
+ATTACHMENT_TYPES = (
+    ('text/plain', allure.attachment_type.TEXT),
+    ('text/html', allure.attachment_type.HTML),
+    ('application/json', allure.attachment_type.JSON),
+    ('image/jpeg', allure.attachment_type.JPG),
+)
+
+Attachment = Tuple[Union[str, bytes], allure.attachment_type]
+
+
+def serialize_meta(obj: Union[httpx.Request, httpx.Response]) \
+        -> List[Attachment]:
+    """Serialize headers and cookies of request/response.
 
     :param obj: request or response object
     :type obj: Union[httpx.Request, httpx.Response]
+
+    :return: attachments
+    :rtype: List[Attachment]
     """
-    headers = misc.dict_to_text(obj.headers)
+    attachments = [
+        (misc.dict_to_text(obj.headers), allure.attachment_type.TEXT)
+    ]
     logging.debug(str(obj.headers))
-    allure.attach(headers, attachment_type=allure.attachment_type.TEXT)
     try:
         cookies = misc.dict_to_text(obj.cookies)
         logging.debug(str(cookies))
-        allure.attach(cookies, attachment_type=allure.attachment_type.TEXT)
+        attachments.append((cookies, allure.attachment_type.TEXT))
     except Exception as e:
         logging.debug(str(e))
+    return attachments
+
+
+def serialize_content(obj: Union[httpx.Request, httpx.Response],
+                      content: Optional[bytes]) -> List[Attachment]:
+    """Prepare content of request/response for attachment.
+
+    Content is attached only if its type is known and its size does not
+    exceed `base_settings.log_body_limit`.
+
+    :param obj: request or response object
+    :type obj: Union[httpx.Request, httpx.Response]
+
+    :param content: content of request/response
+    :type content: Optional[bytes]
+
+    :return: attachments
+    :rtype: List[Attachment]
+    """
+    if content is None:
+        return []
+    attachment_type = get_attachment_type(obj)
+    if attachment_type is None:
+        return []
+    if len(content) > settings.base_settings.log_body_limit:
+        logging.debug(f'Content of {len(content)} bytes is not attached')
+        return []
+    return [(content, attachment_type)]
+
+
+def get_attachment_type(obj: Union[httpx.Request, httpx.Response]) \
+        -> Optional[allure.attachment_type]:
+    """Get attachment type of content of request/response.
+
+    :param obj: request or response object
+    :type obj: Union[httpx.Request, httpx.Response]
+
+    :return: attachment type, None if content type is unknown
+    :rtype: Optional[allure.attachment_type]
+    """
+    content_type = obj.headers.get('content-type', None)
+    if not content_type:
+        return None
+    for mime_type, attachment_type in ATTACHMENT_TYPES:
+        if mime_type in content_type:
+            return attachment_type
+    return None
+
+
+def is_attachable(obj: Union[httpx.Request, httpx.Response]) -> bool:
+    """Check whether content of request/response may be attached: it is
+    not streamed, its type is known and its declared size does not exceed
+    `base_settings.log_body_limit`.
+
+    :param obj: request or response object
+    :type obj: Union[httpx.Request, httpx.Response]
+
+    :return: True if content may be attached
+    :rtype: bool
+    """
+    if is_streamed(obj) or get_attachment_type(obj) is None:
+        return False
+    length = obj.headers.get('content-length')
+    return not (length and length.isdigit() and
+                int(length) > settings.base_settings.log_body_limit)
+
+
+def is_streamed(obj: Union[httpx.Request, httpx.Response]) -> bool:
+    """Check whether content of request/response is read by the caller.
+
+    :param obj: request or response object
+    :type obj: Union[httpx.Request, httpx.Response]
+
+    :return: True if content must not be read by logger
+    :rtype: bool
+    """
+    request = obj.request if isinstance(obj, httpx.Response) else obj
+    return bool(request.extensions.get(STREAM))
+
+
+def attach(obj: Union[httpx.Request, httpx.Response]) -> None:
+    """Attach data to request/response.
+
+    :param obj: request or response object
+    :type obj: Union[httpx.Request, httpx.Response]
+    """
+    attachments = serialize_meta(obj)
+    if not is_streamed(obj):
+        try:
+            content = obj.read()
+            logging.debug(str(content))
+            attachments.extend(serialize_content(obj, content))
+        except Exception as e:
+            logging.debug(str(e))
+    for body, attachment_type in attachments:
+        allure.attach(body, attachment_type=attachment_type)
+
+
+def read_content(obj: Union[httpx.Request, httpx.Response]) \
+        -> Optional[bytes]:
+    """Read content of request/response if it can be attached (response
+    of asynchronous client must be read beforehand).
+
+    :param obj: request or response object
+    :type obj: Union[httpx.Request, httpx.Response]
+
+    :return: content or None
+    :rtype: Optional[bytes]
+    """
+    if not is_attachable(obj):
+        return None
     try:
-        content = obj.read()
-        logging.debug(str(content))
-        if obj.headers.get('content-type', None):
-            content_type = obj.headers['content-type']
-            attachment_type = None
-            if 'text/plain' in content_type:
-                attachment_type = allure.attachment_type.TEXT
-            elif 'text/html' in content_type:
-                attachment_type = allure.attachment_type.HTML
-            elif 'application/json' in content_type:
-                attachment_type = allure.attachment_type.JSON
-            elif 'image/jpeg' in content_type:
-                attachment_type = allure.attachment_type.JPG
-            else:
-                pass
-            if attachment_type:
-                allure.attach(content, attachment_type=attachment_type)
-    except Exception as e:
+        if isinstance(obj, httpx.Response):
+            return obj.read()
+        return obj.content
+    except (httpx.RequestNotRead, httpx.StreamError, RuntimeError) as e:
         logging.debug(str(e))
+        return None
+
+
+class Record:
+    """Deferred log record.
+
+    Content is captured when the record is made (only if it can be
+    attached), request/response object is released as soon as its headers
+    and cookies are serialized.
+
+    :ivar title: title of Allure step
+    :ivar obj: request or response object, None after serialization
+    :ivar content: attachments of content
+    :ivar attachments: serialized headers and cookies
+    """
+    __slots__ = ('title', 'obj', 'content', 'attachments')
+
+    def __init__(self, title: str,
+                 obj: Union[httpx.Request, httpx.Response]):
+        self.title = title
+        self.obj = obj
+        self.content = serialize_content(obj, read_content(obj))
+        self.attachments: List[Attachment] = []
+
+
+class DeferredLog:
+    """Log of requests/responses attached to Allure at the end of a test.
+
+    Event hooks only store records with content which can be attached
+    (see `Record`), headers and cookies are serialized by a background
+    thread. At the end of a test records are sampled and attached by
+    `flush()`.
+
+    :ivar records: records of current test
+    :ivar failed: whether current test failed
+    """
+    def __init__(self):
+        self.records: List[Record] = []
+        self.failed = False
+        self._queue: 'queue.Queue[Record]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _serialize(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                record.attachments = serialize_meta(record.obj)
+            except Exception as e:
+                logging.debug(str(e))
+            finally:
+                record.obj = None
+                self._queue.task_done()
+
+    def add(self, title: str,
+            obj: Union[httpx.Request, httpx.Response]) -> None:
+        """Add record unless the limit of records per test is reached.
+
+        :param title: title of Allure step
+        :type title: str
+
+        :param obj: request or response object
+        :type obj: Union[httpx.Request, httpx.Response]
+        """
+        limit = settings.base_settings.log_max_per_test
+        if limit and len(self.records) >= limit:
+            return
+        record = Record(title, obj)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._serialize, name='logger', daemon=True
+                )
+                self._thread.start()
+        self.records.append(record)
+        self._queue.put(record)
+
+    def flush(self) -> None:
+        """Attach records of finished test to Allure (only if test failed
+        when `base_settings.log_failures_only` is set).
+        """
+        records, failed = self.records, self.failed
+        self.records, self.failed = [], False
+        if not records or \
+                (settings.base_settings.log_failures_only and not failed):
+            return
+        self._queue.join()
+        for record in records:
+            with allure.step(record.title):
+                attachments = record.attachments + record.content
+                for body, attachment_type in attachments:
+                    allure.attach(body, attachment_type=attachment_type)
+
+
+deferred_log = DeferredLog()
+
+
+def _log(title: str, obj: Union[httpx.Request, httpx.Response]) -> None:
+    mode = settings.base_settings.log_mode
+    # Allure steps are not thread-safe: requests of other threads (e.g.,
+    # of `DeviceFleet`) are attached at the end of the test
+    if mode == 'sync' and \
+            threading.current_thread() is threading.main_thread():
+        with allure.step(title):
+            attach(obj)
+    elif mode != 'off':
+        deferred_log.add(title, obj)
 
 
 def log_request(request: httpx.Request) -> None:
@@ -49,8 +274,7 @@ def log_request(request: httpx.Request) -> None:
     :param request: client's HTTP request
     :type request: httpx.Request
     """
-    with allure.step(f'{request.method} {request.url}'):
-        attach(request)
+    _log(f'{request.method} {request.url}', request)
 
 
 def log_response(response: httpx.Response) -> None:
@@ -59,7 +283,30 @@ def log_response(response: httpx.Response) -> None:
     :param response: server's response
     :type response: httpx.Response
     """
-    with allure.step(
-            f'{response.status_code} {response.reason_phrase} {response.url}'
-    ):
-        attach(response)
+    _log(f'{response.status_code} {response.reason_phrase} {response.url}',
+         response)
+
+
+async def async_log_request(request: httpx.Request) -> None:
+    """Log request of asynchronous client to Allure.
+
+    :param request: client's HTTP request
+    :type request: httpx.Request
+    """
+    log_request(request)
+
+
+async def async_log_response(response: httpx.Response) -> None:
+    """Log response of asynchronous client to Allure.
+
+    Response body must be read asynchronously before it can be attached
+    (in deferred mode only if it can be attached).
+
+    :param response: server's response
+    :type response: httpx.Response
+    """
+    mode = settings.base_settings.log_mode
+    if not is_streamed(response) and (
+            mode == 'sync' or mode == 'deferred' and is_attachable(response)):
+        await response.aread()
+    log_response(response)
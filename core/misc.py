@@ -1,11 +1,19 @@
 from typing import Union
+import re
 import os.path
+import functools
+import ipaddress
 import httpx
-import validators
 
 from . import settings
 
 
+# Addresses repeat across devices and polls, so validation results are
+# memoized
+VALIDATION_CACHE_SIZE = 4096
+MAC_PATTERN = re.compile(r'(?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}')
+
+
 def dict_to_text(dic: Union[dict, httpx.Cookies]) -> str:
     """Transform dictionary to multiline text.
 
@@ -23,6 +31,7 @@ def dict_to_text(dic: Union[dict, httpx.Cookies]) -> str:
     return '\n'.join([f'{k}: {v}' for k, v in dic.items()])
 
 
+@functools.lru_cache(maxsize=VALIDATION_CACHE_SIZE)
 def is_ip(ip: str) -> str:
     """Check whether given string is IPv4 or IPv6.
 
@@ -34,18 +43,14 @@ def is_ip(ip: str) -> str:
 
     :raises AssertionError when `ip` is not IPv4/6
     """
-    ipv4 = False
-    if validators.ipv4(ip) is True:
-        ipv4 = True
-    ipv6 = False
-    if validators.ipv6(ip) is True:
-        ipv6 = True
-    if ipv4 or ipv6:
-        return ip
-    else:
-        assert False
+    try:
+        ipaddress.ip_address(ip)
+    except ValueError:
+        assert False, f'{ip} is not IP address'
+    return ip
 
 
+@functools.lru_cache(maxsize=VALIDATION_CACHE_SIZE)
 def is_mac(mac: str) -> str:
     """Check whether given string is MAC address.
 
@@ -57,10 +62,8 @@ def is_mac(mac: str) -> str:
 
     :raises AssertionError when `mac` is not MAC address
     """
-    if validators.mac_address(mac) is True:
-        return mac
-    else:
-        assert False
+    assert MAC_PATTERN.fullmatch(mac), f'{mac} is not MAC address'
+    return mac
 
 
 def full_url(method):
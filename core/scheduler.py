@@ -0,0 +1,383 @@
+"""Campaign-aware test scheduling for pytest-xdist.
+
+Tests of one device and one campaign form a work unit
+(`--dist=loadscope`). Work units are queued campaign by campaign (the
+longest first by recorded durations), and workers enter the next campaign
+together: a worker waits before a test of another campaign until all
+other workers have left the previous one (see `CampaignBarrier`). So the
+whole run switches campaigns once per campaign and every device is served
+by one worker at a time.
+
+`pytest test_player/ -n 4 --schedule-dry-run` prints the planned schedule
+and estimated wall time without running tests.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+import math
+import collections
+import time
+import sqlite3
+import pytest
+from xdist.scheduler import LoadScopeScheduling
+
+from . import misc, settings, wait
+
+
+# Device name is the first token of parametrization ID
+DEVICE_PATTERN = re.compile(r'\[(\w+)-')
+DURATIONS_KEY = 'mechanist/durations'
+DEFAULT_DURATION = 60  # seconds
+CAMPAIGN_SWITCH_DURATION = 10  # seconds
+# Barrier group of tests parametrized by device without campaign
+NO_CAMPAIGN = ''
+
+
+def get_device(nodeid: str) -> Optional[str]:
+    """Get device name from test node ID.
+
+    :param nodeid: node ID
+    :type nodeid: str
+
+    :return: device name or None for tests not parametrized by device
+    :rtype: Optional[str]
+    """
+    match = DEVICE_PATTERN.search(nodeid)
+    return match.group(1) if match else None
+
+
+def get_campaign(nodeid: str) -> Optional[str]:
+    """Get campaign name (one of `base_settings.campaigns`) from test node
+    ID.
+
+    :param nodeid: node ID
+    :type nodeid: str
+
+    :return: campaign name or None for tests without campaign
+    :rtype: Optional[str]
+    """
+    if '[' not in nodeid:
+        return None
+    for token in nodeid[nodeid.index('[') + 1:-1].split('-'):
+        if token in settings.base_settings.campaigns:
+            return token
+    return None
+
+
+def campaign_order(nodeid: str) -> int:
+    """Sorting key of a test: tests without campaign go first, then tests
+    grouped by campaign in order of `base_settings.campaigns`.
+
+    :param nodeid: node ID
+    :type nodeid: str
+
+    :return: sorting key
+    :rtype: int
+    """
+    campaign = get_campaign(nodeid)
+    if campaign is None:
+        return -1
+    return list(settings.base_settings.campaigns).index(campaign)
+
+
+def get_group(nodeid: str) -> Optional[str]:
+    """Get barrier group of a test (see `CampaignBarrier`).
+
+    :param nodeid: node ID
+    :type nodeid: str
+
+    :return: campaign name, `NO_CAMPAIGN` for tests parametrized by device
+    without campaign, None for other tests (they do not pass the barrier)
+    :rtype: Optional[str]
+    """
+    campaign = get_campaign(nodeid)
+    if campaign is None and get_device(nodeid) is not None:
+        return NO_CAMPAIGN
+    return campaign
+
+
+def split_scope(nodeid: str) -> str:
+    """Get scope (work unit) of a test: device and campaign for tests
+    parametrized by device, class or module otherwise.
+
+    :param nodeid: node ID
+    :type nodeid: str
+
+    :return: scope
+    :rtype: str
+    """
+    device = get_device(nodeid)
+    if device is None:
+        return nodeid.rsplit('::', 1)[0]
+    campaign = get_campaign(nodeid)
+    return f'{device}/{campaign}' if campaign else device
+
+
+def order_units(units: Dict[str, Sequence[str]],
+                durations: Dict[str, float]) \
+        -> List[Tuple[str, Sequence[str]]]:
+    """Order work units campaign by campaign (see `campaign_order()`), the
+    longest first inside a campaign, so campaigns end at about the same
+    time on all workers.
+
+    :param units: node IDs by scope
+    :type units: Dict[str, Sequence[str]]
+
+    :param durations: known durations of tests (in seconds)
+    :type durations: Dict[str, float]
+
+    :return: ordered scopes and node IDs
+    :rtype: List[Tuple[str, Sequence[str]]]
+    """
+    def key(item):
+        _, unit = item
+        nodeid = next(iter(unit))
+        return (campaign_order(nodeid),
+                -sum(durations.get(nodeid, DEFAULT_DURATION)
+                     for nodeid in unit))
+    return sorted(units.items(), key=key)
+
+
+def plan(nodeids: Sequence[str], workers: int,
+         durations: Dict[str, float]) -> dict:
+    """Plan schedule as `CampaignScheduling` does: ordered work units (see
+    `order_units()`) are taken by the least loaded worker, a campaign
+    starts when all workers have finished the previous one.
+
+    :param nodeids: node IDs in collection order
+    :type nodeids: Sequence[str]
+
+    :param workers: number of workers
+    :type workers: int
+
+    :param durations: known durations of tests (in seconds)
+    :type durations: Dict[str, float]
+
+    :return: plan: work units with tests and estimated end time of every
+    worker ('workers'), campaign switches of the whole run ('switches')
+    and estimated wall time ('duration')
+    :rtype: dict
+    """
+    units: Dict[str, List[str]] = {}
+    for nodeid in nodeids:
+        units.setdefault(split_scope(nodeid), []).append(nodeid)
+
+    schedule = [{'units': [], 'duration': 0.0}
+                for _ in range(max(workers, 1))]
+    campaign, switches = None, 0
+    for scope, unit in order_units(units, durations):
+        unit_campaign = get_campaign(unit[0])
+        if unit_campaign is not None and unit_campaign != campaign:
+            # Barrier: all workers wait for the end of previous campaign
+            start = max(worker['duration'] for worker in schedule) + \
+                CAMPAIGN_SWITCH_DURATION
+            for worker in schedule:
+                worker['duration'] = start
+            campaign = unit_campaign
+            switches += 1
+        worker = min(schedule, key=lambda worker: worker['duration'])
+        worker['units'].append((scope, unit))
+        worker['duration'] += sum(durations.get(nodeid, DEFAULT_DURATION)
+                                  for nodeid in unit)
+    return {
+        'workers': schedule,
+        'switches': switches,
+        'duration': max(worker['duration'] for worker in schedule),
+    }
+
+
+class CampaignBarrier:
+    """Barrier between campaigns shared by xdist workers of a test run: a
+    worker enters a group of tests (campaign, see `get_group()`) only when
+    no other worker is inside another group.
+
+    Worker stays inside a group while its next test belongs to it. Entries
+    expire after `base_settings.lease_ttl` seconds, so crashed workers do
+    not block others forever; every entered test renews the entry.
+
+    :ivar run_id: ID of test run shared by its workers
+    :ivar worker_id: ID of this worker
+    """
+    DB_NAME = 'campaigns.db'
+
+    def __init__(self, run_id: str, worker_id: str):
+        self.run_id = run_id
+        self.worker_id = worker_id
+        self._db = sqlite3.connect(
+            misc.get_tmp_path(self.DB_NAME), timeout=60,
+            isolation_level=None
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS barrier (worker TEXT, run TEXT, '
+            '"group" TEXT, expires_at REAL, PRIMARY KEY (run, worker))'
+        )
+
+    def try_enter(self, group: str) -> bool:
+        """Enter a group unless another worker is inside another one.
+
+        :param group: barrier group
+        :type group: str
+
+        :return: True if entered
+        :rtype: bool
+        """
+        now = time.time()
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            self._db.execute('DELETE FROM barrier WHERE expires_at < ?',
+                             (now,))
+            busy = self._db.execute(
+                'SELECT COUNT(*) FROM barrier WHERE run = ? AND '
+                'worker != ? AND "group" != ?',
+                (self.run_id, self.worker_id, group)
+            ).fetchone()[0]
+            if not busy:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO barrier '
+                    '(worker, run, "group", expires_at) VALUES (?, ?, ?, ?)',
+                    (self.worker_id, self.run_id, group,
+                     now + settings.base_settings.lease_ttl)
+                )
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+        return not busy
+
+    def enter(self, group: str) -> None:
+        """Wait until the group can be entered and enter it.
+
+        :param group: barrier group
+        :type group: str
+        """
+        wait.wait(lambda: self.try_enter(group), timeout_seconds=math.inf,
+                  kind='campaign barrier',
+                  waiting_for=f'other workers to finish before "{group}"')
+
+    def leave(self) -> None:
+        """Leave current group.
+        """
+        self._db.execute('DELETE FROM barrier WHERE run = ? AND worker = ?',
+                         (self.run_id, self.worker_id))
+
+
+class CampaignScheduling(LoadScopeScheduling):
+    """Load scope scheduling with device and campaign work units (see
+    `split_scope()`) queued campaign by campaign (see `order_units()`).
+    """
+    def __init__(self, config, log=None):
+        super().__init__(config, log)
+        cache = getattr(config, 'cache', None)
+        self.durations: Dict[str, float] = \
+            cache.get(DURATIONS_KEY, {}) if cache else {}
+
+    def _split_scope(self, nodeid: str) -> str:
+        return split_scope(nodeid)
+
+    def _assign_work_unit(self, node) -> None:
+        # Units of crashed workers are queued again in order of campaigns
+        self.workqueue = collections.OrderedDict(
+            order_units(self.workqueue, self.durations)
+        )
+        super()._assign_work_unit(node)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--schedule-dry-run', action='store_true', default=False,
+        help='print planned schedule of tests and estimated wall time '
+             'without running tests'
+    )
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    if config.getoption('schedule_dry_run'):
+        config.option.collectonly = True
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    if config.getvalue('dist') == 'loadscope':
+        return CampaignScheduling(config, log)
+
+
+def pytest_collection_modifyitems(session, config, items):
+    # Only tests parametrized by campaign or device are reordered (within
+    # positions they occupy), other tests keep their order. Sorting is
+    # stable and deterministic, so all workers collect tests in the same
+    # order.
+    positions = [i for i, item in enumerate(items)
+                 if get_group(item.nodeid) is not None]
+    ordered = sorted((items[i] for i in positions),
+                     key=lambda item: campaign_order(item.nodeid))
+    for i, item in zip(positions, ordered):
+        items[i] = item
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_setup(item):
+    global _barrier
+    workerinput = getattr(item.config, 'workerinput', None)
+    group = get_group(item.nodeid)
+    if workerinput is None or group is None:
+        return
+    if _barrier is None:
+        _barrier = CampaignBarrier(workerinput['testrunuid'],
+                                   workerinput['workerid'])
+    _barrier.enter(group)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_teardown(item, nextitem):
+    group = get_group(item.nodeid)
+    if _barrier is not None and group is not None and (
+            nextitem is None or get_group(nextitem.nodeid) != group):
+        _barrier.leave()
+
+
+def pytest_runtest_logreport(report):
+    if report.when == 'call':
+        _durations[report.nodeid] = report.duration
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    # Durations are collected by controller (or by the only process)
+    cache = getattr(config, 'cache', None)
+    if hasattr(config, 'workerinput') or not _durations or cache is None:
+        return
+    durations = cache.get(DURATIONS_KEY, {})
+    durations.update(_durations)
+    cache.set(DURATIONS_KEY, durations)
+
+
+def pytest_collection_finish(session):
+    config = session.config
+    if not config.getoption('schedule_dry_run'):
+        return
+    workers = config.getoption('numprocesses', None) or 1
+    cache = getattr(config, 'cache', None)
+    durations = cache.get(DURATIONS_KEY, {}) if cache else {}
+    schedule = plan([item.nodeid for item in session.items], workers,
+                    durations)
+
+    terminal = config.pluginmanager.get_plugin('terminalreporter')
+    terminal.section('Planned schedule')
+    for i, worker in enumerate(schedule['workers']):
+        terminal.write_line(
+            f'worker {i}: {len(worker["units"])} units, '
+            f'~{worker["duration"]:.0f} s'
+        )
+        for scope, unit in worker['units']:
+            terminal.write_line(f'    {scope}')
+            for nodeid in unit:
+                terminal.write_line(f'        {nodeid}')
+    terminal.write_line(f'Campaign switches: {schedule["switches"]}')
+    terminal.write_line(
+        f'Estimated wall time: ~{schedule["duration"]:.0f} s'
+    )
+
+
+_durations: Dict[str, float] = {}
+_barrier: Optional[CampaignBarrier] = None
@@ -1,3 +1,4 @@
+from typing import Dict, Literal
 import os
 import pydantic
 import pydantic_settings
@@ -8,6 +9,18 @@ class TestUser(pydantic.BaseModel):
     password: str
 
 
+class ComparisonSettings(pydantic.BaseModel):
+    """Settings of tiered image comparison (see
+    `improc.TieredComparator`), unset fields take default values.
+    """
+    hash_name: Literal['dhash', 'phash'] = None
+    match_distance: int = None
+    mismatch_distance: int = None
+    fallback: Literal['hist', 'ssim'] = None
+    threshold: float = None
+    ssim_threshold: float = None
+
+
 class Settings(pydantic_settings.BaseSettings):
     model_config = pydantic_settings.SettingsConfigDict(
         env_file='.env', env_file_encoding='utf-8'
@@ -26,6 +39,46 @@ class Settings(pydantic_settings.BaseSettings):
     campaigns: dict
 
     polling_interval: int
+    session_ttl: int = 3600  # seconds
+    lease_ttl: int = 600  # seconds
+    # Maximal number of concurrent requests of fleet-wide operations
+    fleet_max_workers: int = 16
+
+    # Allure logging of requests/responses (see core.logger)
+    log_mode: Literal['sync', 'deferred', 'off'] = 'sync'
+    log_failures_only: bool = False
+    log_max_per_test: int = 0  # unlimited
+    log_body_limit: int = 2**20  # bytes
+
+    http2: bool = False
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30  # seconds
+    http_timeout: float = 30  # seconds
+    http_connect_timeout: float = 10  # seconds
+    # Separate connection pools for hosts, e.g. CDN serving screenshots:
+    # '{"https://cdn.server": max_connections, ...}'
+    http_host_connections: dict = {}
+    # Content verification (see api.mono.devices.content)
+    content_attempts: int = 3
+    content_ready_timeout: float = 120  # seconds
+    video_frames: int = 5  # screenshots per video check
+    # Tiered image comparison by campaign name (other campaigns are
+    # compared by histograms):
+    # '{"campaign": {"hash_name": "dhash", "fallback": "ssim"}, ...}'
+    comparison: Dict[str, ComparisonSettings] = {}
+    # All requests are sent to this server keeping original host in Host
+    # header, e.g. local mock server 'http://127.0.0.1:8321' (see
+    # api.mono.mock)
+    mock_server_url: str = ''
+    # Latency histograms of requests by endpoint (see core.telemetry)
+    http_metrics: bool = True
+    # Spans of screenshot phases, waits and comparisons (see core.tracing)
+    tracing: bool = True
+    wait_strategy: Literal['fixed', 'backoff', 'adaptive'] = 'fixed'
+    # Cached timestamp of the last screenshot of a device is used instead of
+    # requesting it again while it is fresh
+    screenshot_state_ttl: float = 10  # seconds
 
     tmp_path: str = os.path.join(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tmp'
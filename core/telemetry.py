@@ -0,0 +1,363 @@
+"""Metrics of HTTP requests made by framework's clients: latency
+histograms, bytes transferred and retries by endpoint.
+
+Requests are recorded by metered transports (see `core.client`), endpoints
+are templated by URL patterns of API classes (`URL_*` attributes of
+`core.client.Base` subclasses), so e.g. all requests of device info are
+collected as 'GET /platforms/{platform_id}/devices/{device_id}'.
+
+In test session (see conftest.py) metrics of xdist workers are sent to
+controller, summary is printed at the end of session and written to
+`SUMMARY_FILE` under project temporary path (see `Recorder.dump()`).
+"""
+from typing import Dict, List, Optional
+import re
+import json
+import math
+import threading
+import collections
+import httpx
+
+from . import misc
+
+
+# 128 linear sub-buckets per power of two: values are exact below 256 and
+# recorded with relative error below 1% above
+SUB_BUCKET_BITS = 7
+PERCENTILES = (50, 90, 99)
+# Failed attempts repeated by the same request are counted as retries
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+# Only retries of the latest failed requests are detected (retries follow
+# failures closely), older failures are forgotten
+MAX_FAILED = 1024
+ERROR_STATUS = 'error'
+SUMMARY_FILE = 'http_metrics.json'
+WORKER_OUTPUT_KEY = 'http_metrics'
+# Numeric path segments of URLs not matching any pattern
+ID_SEGMENT = re.compile(r'(?<=/)\d+(?=[/.]|$)')
+
+
+class Histogram:
+    """Histogram with logarithmic buckets divided into linear sub-buckets
+    (layout of HDR histogram), so percentiles are recorded with constant
+    relative precision in a few hundred buckets per range of values.
+
+    :ivar counts: number of values by bucket index (sparse)
+    :ivar count: number of values
+    :ivar total: sum of values
+    :ivar min: minimal value
+    :ivar max: maximal value
+    """
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    @staticmethod
+    def index(value: int) -> int:
+        """Get bucket index of a value.
+
+        :param value: non-negative value
+        :type value: int
+
+        :return: bucket index
+        :rtype: int
+        """
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def highest_value(index: int) -> int:
+        """Get the highest value of a bucket.
+
+        :param index: bucket index
+        :type index: int
+
+        :return: the highest value equivalent to values of the bucket
+        :rtype: int
+        """
+        shift = max(0, (index >> SUB_BUCKET_BITS) - 1)
+        return ((index - (shift << SUB_BUCKET_BITS) + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """Record a value.
+
+        :param value: non-negative value
+        :type value: int
+        """
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percentile: float) -> int:
+        """Get value at a percentile.
+
+        :param percentile: percentile (e.g., 99)
+        :type percentile: float
+
+        :return: the highest value equivalent to value at the percentile, 0
+        if histogram is empty
+        :rtype: int
+        """
+        rank = max(1, math.ceil(self.count * percentile / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.highest_value(index), self.max)
+        return 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def merge(self, other: 'Histogram') -> None:
+        """Add values of another histogram.
+
+        :param other: histogram
+        :type other: Histogram
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None \
+                else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        return {
+            'counts': {str(index): count
+                       for index, count in sorted(self.counts.items())},
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls()
+        histogram.counts = {int(index): count
+                            for index, count in data['counts'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class EndpointStats:
+    """Metrics of requests of one endpoint.
+
+    :ivar latency: time from sending request till response body is read or
+    response is closed (in microseconds)
+    :ivar statuses: number of responses by status code ('error' for
+    transport errors)
+    :ivar retries: number of requests repeating failed ones
+    :ivar bytes_sent: total size of request bodies
+    :ivar bytes_received: total size of response bodies as transferred
+    (before content decoding)
+    """
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses: Dict[str, int] = {}
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def failures(self) -> int:
+        """Get number of transport errors and responses with retryable
+        status codes.
+
+        :return: number of failed requests
+        :rtype: int
+        """
+        return sum(count for status, count in self.statuses.items()
+                   if status == ERROR_STATUS or
+                   int(status) in RETRY_STATUS_CODES)
+
+    def merge(self, other: 'EndpointStats') -> None:
+        self.latency.merge(other.latency)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.retries += other.retries
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+
+    def to_dict(self) -> dict:
+        return {
+            'latency': self.latency.to_dict(),
+            'statuses': self.statuses,
+            'retries': self.retries,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'EndpointStats':
+        stats = cls()
+        stats.latency = Histogram.from_dict(data['latency'])
+        stats.statuses = dict(data['statuses'])
+        stats.retries = data['retries']
+        stats.bytes_sent = data['bytes_sent']
+        stats.bytes_received = data['bytes_received']
+        return stats
+
+
+class Recorder:
+    """Collector of request metrics by endpoint.
+
+    :ivar endpoints: metrics by endpoint ('METHOD templated path')
+    """
+    def __init__(self):
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self._patterns: Dict[str, re.Pattern] = {}
+        self._failed: 'collections.OrderedDict[tuple, None]' = \
+            collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, pattern: str) -> None:
+        """Register URL pattern of an endpoint.
+
+        :param pattern: URL pattern, e.g.
+        '/platforms/{platform_id}/devices/{device_id}'
+        :type pattern: str
+        """
+        regex = re.compile(re.sub(r'\\{(\w+)\\}', r'(?P<\1>[^/]+)',
+                                  re.escape(pattern)) + '$')
+        with self._lock:
+            self._patterns[pattern] = regex
+            # Patterns with fewer placeholders are more specific, e.g.
+            # '.../devices/screenshot' before '.../devices/{device_id}'
+            self._patterns = dict(sorted(
+                self._patterns.items(),
+                key=lambda item: (item[1].groups, -len(item[0]))
+            ))
+
+    def endpoint(self, request: httpx.Request) -> str:
+        """Get templated endpoint of a request.
+
+        :param request: request
+        :type request: httpx.Request
+
+        :return: method and URL pattern matching request path, path with
+        numeric segments replaced by '{id}' if no pattern matches
+        :rtype: str
+        """
+        path = request.url.path
+        for pattern, regex in self._patterns.items():
+            if regex.search(path):
+                return f'{request.method} {pattern}'
+        return f'{request.method} {ID_SEGMENT.sub("{id}", path)}'
+
+    def record(self, request: httpx.Request, status_code: Optional[int],
+               elapsed: float, bytes_received: int) -> None:
+        """Record finished request.
+
+        :param request: request
+        :type request: httpx.Request
+
+        :param status_code: status code of response, None on transport
+        error
+        :type status_code: Optional[int]
+
+        :param elapsed: latency (in seconds)
+        :type elapsed: float
+
+        :param bytes_received: size of response body
+        :type bytes_received: int
+        """
+        endpoint = self.endpoint(request)
+        try:
+            bytes_sent = len(request.content)
+        except httpx.RequestNotRead:
+            bytes_sent = int(request.headers.get('Content-Length', 0))
+        key = (request.method, str(request.url))
+        failed = status_code is None or status_code in RETRY_STATUS_CODES
+        status = ERROR_STATUS if status_code is None else str(status_code)
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.latency.record(round(elapsed * 1e6))
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            if key in self._failed:
+                stats.retries += 1
+            if failed:
+                self._failed[key] = None
+                self._failed.move_to_end(key)
+                if len(self._failed) > MAX_FAILED:
+                    self._failed.popitem(last=False)
+            else:
+                self._failed.pop(key, None)
+
+    def merge(self, data: dict) -> None:
+        """Add metrics of another recorder (e.g., of xdist worker).
+
+        :param data: metrics (see `to_dict()`)
+        :type data: dict
+        """
+        with self._lock:
+            for endpoint, stats_data in data.items():
+                stats = EndpointStats.from_dict(stats_data)
+                if endpoint in self.endpoints:
+                    self.endpoints[endpoint].merge(stats)
+                else:
+                    self.endpoints[endpoint] = stats
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {endpoint: stats.to_dict()
+                    for endpoint, stats in sorted(self.endpoints.items())}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.endpoints.clear()
+            self._failed.clear()
+
+    def dump(self) -> str:
+        """Write metrics to `SUMMARY_FILE` under project temporary path.
+
+        :return: filename
+        :rtype: str
+        """
+        fname = misc.get_tmp_path(SUMMARY_FILE)
+        with open(fname, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        return fname
+
+    def summary(self) -> List[str]:
+        """Get summary table: number of requests, failures, retries,
+        latency percentiles and maximum (in milliseconds) and received
+        KiB by endpoint.
+
+        :return: lines of the table
+        :rtype: List[str]
+        """
+        columns = ''.join(f'{"p" + str(p):>8}' for p in PERCENTILES)
+        lines = [f'{"endpoint":<56} {"count":>7} {"failed":>6} '
+                 f'{"retries":>7}{columns}{"max":>8}{"KiB in":>10}']
+        for endpoint, stats in sorted(self.endpoints.items()):
+            latency = stats.latency
+            percentiles = ''.join(f'{latency.percentile(p)/1000:>8.1f}'
+                                  for p in PERCENTILES)
+            lines.append(
+                f'{endpoint:<56} {latency.count:>7} {stats.failures:>6} '
+                f'{stats.retries:>7}{percentiles}{latency.max/1000:>8.1f}'
+                f'{stats.bytes_received/1024:>10.1f}'
+            )
+        return lines
+
+
+recorder = Recorder()
+
@@ -0,0 +1,354 @@
+"""Tracing of framework's operations by spans (data model of OpenTelemetry:
+trace and span IDs, parent span, start and end time in Unix nanoseconds,
+attributes and status).
+
+with tracing.span('screenshot.download', {'device.id': device_id}):
+    ...
+
+Spans opened inside another span of the same thread (or asyncio task)
+become its children. In test session (see conftest.py) spans of xdist
+workers are sent to controller and exported at the end of session as
+Chrome trace (`TRACE_FILE` under project temporary path, open it in
+chrome://tracing or https://ui.perfetto.dev) with summary of screenshot
+phases by device.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import os
+import enum
+import json
+import time
+import secrets
+import functools
+import threading
+import contextlib
+import contextvars
+import statistics
+import dataclasses
+
+from . import misc, settings
+
+
+TRACE_FILE = 'trace.json'
+WORKER_OUTPUT_KEY = 'spans'
+# Span of screenshot round trip and its phases ('screenshot.<phase>')
+SCREENSHOT_SPAN = 'screenshot'
+SCREENSHOT_PHASES = ('baseline', 'request', 'poll', 'download')
+# Device is slow when its median screenshot time exceeds median of all
+# devices by this factor
+SLOW_FACTOR = 1.5
+
+
+@dataclasses.dataclass
+class Span:
+    """Timed operation.
+
+    :ivar name: name of operation
+    :ivar trace_id: ID of trace (32 hex digits)
+    :ivar span_id: ID of span (16 hex digits)
+    :ivar parent_span_id: ID of parent span, None for root span
+    :ivar start_time_unix_nano: start time
+    :ivar end_time_unix_nano: end time, 0 while span is open
+    :ivar attributes: attributes (e.g., 'device.id')
+    :ivar status: 'UNSET' or 'ERROR' if operation raised exception
+    :ivar status_message: description of error
+    :ivar resource: process, thread and xdist worker of span
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str] = None
+    start_time_unix_nano: int = 0
+    end_time_unix_nano: int = 0
+    attributes: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    status: str = 'UNSET'
+    status_message: str = ''
+    resource: Dict[str, Any] = dataclasses.field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        """Get duration of closed span.
+
+        :return: duration (in seconds)
+        :rtype: float
+        """
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1e9
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+_current: 'contextvars.ContextVar[Optional[Span]]' = \
+    contextvars.ContextVar('span', default=None)
+
+
+class Tracer:
+    """Collector of closed spans.
+
+    :ivar spans: closed spans
+    """
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        """Record closed span unless tracing is disabled by
+        `base_settings.tracing`.
+
+        :param span: closed span
+        :type span: Span
+        """
+        if settings.base_settings.tracing:
+            with self._lock:
+                self.spans.append(span)
+
+    def merge(self, data: List[dict]) -> None:
+        """Add spans of another tracer (e.g., of xdist worker).
+
+        :param data: spans (see `to_dict()`)
+        :type data: List[dict]
+        """
+        with self._lock:
+            self.spans.extend(Span(**span) for span in data)
+
+    def to_dict(self) -> List[dict]:
+        with self._lock:
+            spans = [dataclasses.asdict(span) for span in self.spans]
+        for span in spans:
+            span['attributes'] = {
+                key: attribute_value(value)
+                for key, value in span['attributes'].items()
+            }
+        return spans
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+    def chrome_trace(self) -> dict:
+        """Get spans as Chrome trace (complete events grouped by process
+        and thread, span data in event arguments).
+
+        :return: Chrome trace
+        :rtype: dict
+        """
+        events, processes = [], {}
+        for span in self.to_dict():
+            resource = span['resource']
+            processes[resource['pid']] = resource['worker']
+            events.append({
+                'name': span['name'],
+                'cat': span['name'].partition('.')[0],
+                'ph': 'X',
+                'ts': span['start_time_unix_nano'] / 1000,
+                'dur': (span['end_time_unix_nano'] -
+                        span['start_time_unix_nano']) / 1000,
+                'pid': resource['pid'],
+                'tid': resource['thread'],
+                'args': {
+                    **span['attributes'],
+                    'trace_id': span['trace_id'],
+                    'span_id': span['span_id'],
+                    'parent_span_id': span['parent_span_id'],
+                    'status': span['status'],
+                    'status_message': span['status_message'],
+                },
+            })
+        events.extend({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                       'args': {'name': worker}}
+                      for pid, worker in processes.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self) -> str:
+        """Write Chrome trace to `TRACE_FILE` under project temporary path.
+
+        :return: filename
+        :rtype: str
+        """
+        fname = misc.get_tmp_path(TRACE_FILE)
+        with open(fname, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return fname
+
+    def device_summary(self) -> List[str]:
+        """Get summary table of screenshot round trips by device: number of
+        screenshots, median durations of round trip and its phases, maximal
+        duration (in seconds). Devices which are consistently slow (median
+        exceeds median of all devices by `SLOW_FACTOR`) are marked.
+
+        :return: lines of the table, empty if there are no screenshot spans
+        :rtype: List[str]
+        """
+        durations: Dict[Any, Dict[str, List[float]]] = {}
+        with self._lock:
+            for span in self.spans:
+                device_id = span.attributes.get('device.id')
+                name, _, phase = span.name.partition('.')
+                if device_id is None or name != SCREENSHOT_SPAN:
+                    continue
+                phases = durations.setdefault(device_id, {})
+                phases.setdefault(phase, []).append(span.duration)
+        totals = {device_id: phases[''] for device_id, phases
+                  in durations.items() if phases.get('')}
+        if not totals:
+            return []
+        overall = statistics.median(statistics.median(total)
+                                    for total in totals.values())
+        columns = ''.join(f'{phase:>10}' for phase in SCREENSHOT_PHASES)
+        lines = [f'{"device":<10} {"count":>6} {"total":>8}{columns}'
+                 f'{"max":>8}']
+        for device_id, total in sorted(totals.items()):
+            phases = durations[device_id]
+            median = statistics.median(total)
+            medians = ''.join(
+                f'{statistics.median(phases[phase]):>10.3f}'
+                if phases.get(phase) else f'{"-":>10}'
+                for phase in SCREENSHOT_PHASES
+            )
+            slow = '  SLOW' if median > overall * SLOW_FACTOR else ''
+            lines.append(f'{str(device_id):<10} {len(total):>6} '
+                         f'{median:>8.3f}{medians}{max(total):>8.3f}{slow}')
+        return lines
+
+
+tracer = Tracer()
+
+
+def attribute_value(value: Any) -> Any:
+    """Convert value to primitive type allowed for span attributes.
+
+    :param value: value
+    :type value: Any
+
+    :return: value of enumeration, string if value is not primitive
+    :rtype: Any
+    """
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+def current_span() -> Optional[Span]:
+    """Get current span of this thread (or asyncio task).
+
+    :return: current span, None outside of spans
+    :rtype: Optional[Span]
+    """
+    return _current.get()
+
+
+def start_span(name: str, attributes: Dict[str, Any] = None,
+               parent: Span = None) -> Span:
+    """Start span without making it current (e.g., span of one of many
+    operations driven by one asyncio task), it must be ended by
+    `end_span()`.
+
+    :param name: name of operation
+    :type name: str
+
+    :param attributes: attributes of span
+    :type attributes: Dict[str, Any]
+
+    :param parent: parent span, current span by default
+    :type parent: Span
+
+    :return: span
+    :rtype: Span
+    """
+    parent = parent or _current.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_span_id=parent.span_id if parent else None,
+        start_time_unix_nano=time.time_ns(),
+        attributes=dict(attributes or {}),
+        resource={
+            'pid': os.getpid(),
+            'thread': threading.get_native_id(),
+            'worker': os.environ.get('PYTEST_XDIST_WORKER', 'master'),
+        }
+    )
+
+
+def end_span(current: Span, error: BaseException = None) -> None:
+    """End span and record it.
+
+    :param current: span started by `start_span()`
+    :type current: Span
+
+    :param error: exception raised by operation
+    :type error: BaseException
+    """
+    if error is not None:
+        current.status = 'ERROR'
+        current.status_message = repr(error)
+    current.end_time_unix_nano = time.time_ns()
+    tracer.record(current)
+
+
+@contextlib.contextmanager
+def use_span(current: Span) -> Iterator[Span]:
+    """Make started span current inside `with` block without ending it,
+    so spans opened inside (or asyncio tasks created inside) become its
+    children.
+
+    :param current: span started by `start_span()`
+    :type current: Span
+
+    :return: span
+    :rtype: Iterator[Span]
+    """
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str, attributes: Dict[str, Any] = None) -> Iterator[Span]:
+    """Trace operation inside `with` block.
+
+    Span must not be left open across `yield` of a generator, otherwise it
+    becomes parent of consumer's spans.
+
+    :param name: name of operation
+    :type name: str
+
+    :param attributes: attributes of span
+    :type attributes: Dict[str, Any]
+
+    :return: span, attributes may be added inside `with` block
+    :rtype: Iterator[Span]
+    """
+    current = start_span(name, attributes)
+    error = None
+    try:
+        with use_span(current):
+            yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(current, error)
+
+
+def traced(name: str = None) -> Callable:
+    """Decorator tracing every call of a function.
+
+    @tracing.traced('compare_images')
+    def compare_images(self):
+        ...
+
+    :param name: name of span, qualified name of function by default
+    :type name: str
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__qualname__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,274 @@
+from typing import Callable, Any, Dict, Iterator, List, Optional
+import abc
+import time
+import random
+import logging
+import threading
+import dataclasses
+import waiting
+
+from . import settings
+
+
+MIN_INTERVAL = 0.25  # seconds
+BACKOFF_FACTOR = 2
+JITTER = 0.25
+# Weight of the latest observation in adaptive estimate
+SMOOTHING = 0.3
+
+
+class Strategy(abc.ABC):
+    """Base wait strategy.
+
+    Strategy produces intervals between polls and may learn from observed
+    durations of successful waits.
+    """
+    @abc.abstractmethod
+    def intervals(self) -> Iterator[float]:
+        """Get intervals between polls of one wait.
+
+        :return: infinite iterator over intervals (in seconds)
+        :rtype: Iterator[float]
+        """
+
+    def observe(self, elapsed: float) -> None:
+        """Take into account duration of a successful wait.
+
+        :param elapsed: time from the start of a wait till success
+        :type elapsed: float
+        """
+        pass
+
+
+class FixedInterval(Strategy):
+    """Poll with fixed interval.
+
+    :ivar interval: interval between polls
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+
+    def intervals(self) -> Iterator[float]:
+        while True:
+            yield self.interval
+
+
+class ExponentialBackoff(Strategy):
+    """Poll with exponentially growing interval with random jitter.
+
+    :ivar initial: first interval
+    :ivar maximum: maximal interval
+    :ivar factor: growth factor
+    :ivar jitter: relative jitter (interval is multiplied by random value
+    from [1 - jitter, 1 + jitter])
+    """
+    def __init__(self, initial: float = MIN_INTERVAL,
+                 maximum: float = None,
+                 factor: float = BACKOFF_FACTOR, jitter: float = JITTER):
+        self.initial = initial
+        self.maximum = maximum or settings.base_settings.polling_interval
+        self.factor = factor
+        self.jitter = jitter
+
+    def intervals(self) -> Iterator[float]:
+        interval = self.initial
+        while True:
+            yield interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            interval = min(interval * self.factor, self.maximum)
+
+
+class AdaptiveInterval(ExponentialBackoff):
+    """Poll densely around expected transition time.
+
+    Expected time is a moving average of observed durations of previous
+    successful waits. The first poll happens shortly before expected time,
+    then polls are frequent until expected time is well exceeded, then
+    interval grows exponentially. Without observations behaves like
+    `ExponentialBackoff`.
+
+    :ivar estimate: expected duration of a wait (in seconds)
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estimate: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def intervals(self) -> Iterator[float]:
+        estimate = self.estimate
+        if estimate is None:
+            yield from super().intervals()
+            return
+        step = max(self.initial, estimate * 0.1)
+        elapsed = 0.75 * estimate
+        yield elapsed
+        while elapsed < 1.5 * estimate:
+            yield step
+            elapsed += step
+        yield from super().intervals()
+
+    def observe(self, elapsed: float) -> None:
+        with self._lock:
+            if self.estimate is None:
+                self.estimate = elapsed
+            else:
+                self.estimate += SMOOTHING * (elapsed - self.estimate)
+
+
+STRATEGIES = {
+    'fixed': lambda: FixedInterval(settings.base_settings.polling_interval),
+    'backoff': ExponentialBackoff,
+    'adaptive': AdaptiveInterval,
+}
+
+_strategies: Dict[str, Strategy] = {}
+_strategies_lock = threading.Lock()
+
+
+def get_strategy(kind: str) -> Strategy:
+    """Get shared strategy (defined by `base_settings.wait_strategy`) for
+    given kind of waits.
+
+    Waits of the same kind (e.g., device status change) share observations.
+
+    :param kind: kind of waits
+    :type kind: str
+
+    :return: wait strategy
+    :rtype: Strategy
+    """
+    with _strategies_lock:
+        if kind not in _strategies:
+            _strategies[kind] = \
+                STRATEGIES[settings.base_settings.wait_strategy]()
+        return _strategies[kind]
+
+
+@dataclasses.dataclass
+class WaitStats:
+    """Aggregated waits of one kind.
+
+    :ivar waits: number of waits
+    :ivar timeouts: number of waits which exceeded time limit
+    :ivar polls: total number of polls
+    :ivar elapsed: total duration of waits (in seconds)
+    :ivar max_elapsed: maximal duration of a wait (in seconds)
+    """
+    waits: int = 0
+    timeouts: int = 0
+    polls: int = 0
+    elapsed: float = 0.0
+    max_elapsed: float = 0.0
+
+    def add(self, polls: int, elapsed: float, success: bool) -> None:
+        self.waits += 1
+        self.timeouts += not success
+        self.polls += polls
+        self.elapsed += elapsed
+        self.max_elapsed = max(self.max_elapsed, elapsed)
+
+    def merge(self, other: 'WaitStats') -> None:
+        self.waits += other.waits
+        self.timeouts += other.timeouts
+        self.polls += other.polls
+        self.elapsed += other.elapsed
+        self.max_elapsed = max(self.max_elapsed, other.max_elapsed)
+
+
+WORKER_OUTPUT_KEY = 'wait_stats'
+# Wait statistics by kind (see `wait()`)
+stats: Dict[str, WaitStats] = {}
+_stats_lock = threading.Lock()
+
+
+def wait(predicate: Callable[[], Any], timeout_seconds: float,
+         kind: str, waiting_for: str) -> Any:
+    """Wait for predicate to return true value.
+
+    Polls are scheduled by the strategy of given kind (see
+    `get_strategy()`). Sleeps never exceed the deadline, so the last poll
+    happens right at it.
+
+    :param predicate: callable to poll
+    :type predicate: Callable[[], Any]
+
+    :param timeout_seconds: time limit
+    :type timeout_seconds: float
+
+    :param kind: kind of wait
+    :type kind: str
+
+    :param waiting_for: description of awaited condition
+    :type waiting_for: str
+
+    :return: true value returned by predicate
+
+    :raises waiting.TimeoutExpired when time limit is exceeded
+    """
+    strategy = get_strategy(kind)
+    start = time.monotonic()
+    deadline = start + timeout_seconds
+    polls = 0
+    for interval in strategy.intervals():
+        polls += 1
+        result = predicate()
+        now = time.monotonic()
+        if result:
+            strategy.observe(now - start)
+            _record(kind, waiting_for, polls, now - start, True)
+            return result
+        if now >= deadline:
+            _record(kind, waiting_for, polls, now - start, False)
+            raise waiting.TimeoutExpired(timeout_seconds, waiting_for)
+        time.sleep(min(interval, deadline - now))
+
+
+def _record(kind: str, waiting_for: str, polls: int, elapsed: float,
+            success: bool) -> None:
+    logging.debug(f'Waited for {waiting_for}: {polls} polls, '
+                  f'{elapsed:.3f} s')
+    with _stats_lock:
+        stats.setdefault(kind, WaitStats()).add(polls, elapsed, success)
+
+
+def to_dict() -> dict:
+    """Get wait statistics as JSON-serializable dictionary (e.g., to pass
+    them from xdist worker to controller).
+
+    :return: statistics by kind
+    :rtype: dict
+    """
+    with _stats_lock:
+        return {kind: dataclasses.asdict(kind_stats)
+                for kind, kind_stats in stats.items()}
+
+
+def merge(data: dict) -> None:
+    """Add wait statistics of another process.
+
+    :param data: statistics by kind (see `to_dict()`)
+    :type data: dict
+    """
+    with _stats_lock:
+        for kind, kind_stats in data.items():
+            stats.setdefault(kind, WaitStats()).merge(WaitStats(**kind_stats))
+
+
+def summary() -> List[str]:
+    """Get summary table: number of waits, timeouts, mean number of polls,
+    mean and maximal duration (in seconds) by kind of waits.
+
+    :return: lines of the table
+    :rtype: List[str]
+    """
+    lines = [f'{"kind":<40} {"waits":>6} {"timeouts":>8} {"polls":>7} '
+             f'{"mean":>7} {"max":>7}']
+    with _stats_lock:
+        for kind, kind_stats in sorted(stats.items()):
+            lines.append(
+                f'{kind:<40} {kind_stats.waits:>6} '
+                f'{kind_stats.timeouts:>8} '
+                f'{kind_stats.polls/kind_stats.waits:>7.1f} '
+                f'{kind_stats.elapsed/kind_stats.waits:>7.2f} '
+                f'{kind_stats.max_elapsed:>7.2f}'
+            )
+    return lines
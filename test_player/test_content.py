@@ -1,14 +1,13 @@
-import time
+import os
+import contextlib
 import pytest
 import allure
 
 from api.mono.devices import device as device_api
+from api.mono.devices import content as content_api
 from api.mono.campaigns import campaign as campaign_api
 from core.settings import base_settings
-from core import improc, queue, misc
-
-
-ATTEMPTS = 3
+from core import improc, keyframes, lease, misc
 
 devices_mark = pytest.mark.parametrize('device_name,device_id',
                                        base_settings.devices)
@@ -18,41 +17,71 @@ devices_mark = pytest.mark.parametrize('device_name,device_id',
 class TestContent:
 
     @staticmethod
-    def check_playing_content(api_client, device_name, device_id,
-                              campaign_name, data_file):
-        passed = False
-        campaign_id = base_settings.campaigns[campaign_name]
+    def require_campaign(campaign_name):
+        if campaign_name not in base_settings.campaigns:
+            pytest.skip(f'Campaign "{campaign_name}" is not configured '
+                        f'(add it to CAMPAIGNS)')
 
-        device = device_api.Device(api_client)
+    @staticmethod
+    @contextlib.contextmanager
+    def playing_campaign(api_client, campaign_name):
+        campaign_id = base_settings.campaigns[campaign_name]
         campaign = campaign_api.Campaign(api_client)
-        imp = improc.ImageProcessing()
-        fname = misc.get_path(__file__, 'data', data_file)
-        q = queue.Queue(campaign_name)
-
-        with allure.step(f'Load source image "{fname}"'):
-            imp.load_source_from_file(fname)
+        campaign_lease = lease.Lease(campaign_name)
 
         with allure.step(f'Play campaign "{campaign_name}" #{campaign_id}'):
-            campaign.play_campaign(campaign_id)
-            q.put()
-        time.sleep(5)
-
-        with allure.step(f'Retrieve screenshot from {device_name} and '
-                         f'compare with source image'):
-            counter = ATTEMPTS
-            while counter > 0 and not passed:
-                screenshot = device.retrieve_screenshot(device_id)
-                imp.load_target_from_bytes(screenshot)
-                passed = imp.compare_images()
-                counter -= 1
-        q.get()
-
-        if q.is_empty():
+            campaign_lease.acquire(
+                lambda: campaign.play_campaign(campaign_id)
+            )
+
+        def pause():
             with allure.step(f'Pause campaign "{campaign_name}" '
                              f'#{campaign_id}'):
                 campaign.pause_campaign(campaign_id)
 
-        return passed
+        try:
+            # Tests may run longer than the lease lives
+            with campaign_lease.renewing():
+                yield campaign_id
+        finally:
+            campaign_lease.release(pause)
+
+    def check_playing_content(self, api_client, device_name, device_id,
+                              campaign_name, data_file):
+        verifier = content_api.ContentVerifier(
+            device_api.Device(api_client),
+            comparator=improc.get_comparator(campaign_name)
+        )
+        fname = misc.get_path(__file__, 'data', data_file)
+
+        with self.playing_campaign(api_client, campaign_name) as campaign_id:
+            with allure.step(f'Retrieve screenshots from {device_name} and '
+                             f'compare with source image "{fname}"'):
+                result = verifier.verify(device_id, campaign_id, fname)
+                allure.attach(str(result), 'Content metrics',
+                              allure.attachment_type.TEXT)
+
+        return result.success
+
+    def check_playing_video(self, api_client, device_name, device_id,
+                            campaign_name, index_dir):
+        self.require_campaign(campaign_name)
+        verifier = content_api.ContentVerifier(device_api.Device(api_client))
+        index_path = misc.get_path(__file__, 'data', index_dir)
+        if not os.path.isdir(index_path):
+            pytest.skip(f'No keyframe index of "{campaign_name}" campaign '
+                        f'(build it with `python -m core.keyframes build '
+                        f'-o {index_path} <media>`)')
+        index = keyframes.KeyframeIndex(index_path)
+
+        with self.playing_campaign(api_client, campaign_name) as campaign_id:
+            with allure.step(f'Retrieve screenshots from {device_name} and '
+                             f'compare with {len(index)} keyframes'):
+                result = verifier.verify_video(device_id, campaign_id, index)
+                allure.attach(str(result), 'Video metrics',
+                              allure.attachment_type.TEXT)
+
+        return result.success
 
     @allure.feature('JPEG image')
     @pytest.mark.parametrize(
@@ -67,3 +96,17 @@ class TestContent:
         assert self.check_playing_content(
             api_client, device_name, device_id, campaign_name, data_file
         )
+
+    @allure.feature('Video')
+    @pytest.mark.parametrize(
+        'campaign_name,index_dir',
+        (
+            ('video', 'video.index'),
+        )
+    )
+    @devices_mark
+    def test_video(self, api_client, device_name, device_id,
+                   campaign_name, index_dir):
+        assert self.check_playing_video(
+            api_client, device_name, device_id, campaign_name, index_dir
+        )